@@ -0,0 +1,176 @@
+import fcntl
+import heapq
+import json
+import os
+import urllib.request
+from datetime import date, datetime
+
+import numpy as np
+
+# =========================
+# ALERTAS DE INACTIVIDADE (MUDANÇAS DE ESTADO, AVALIAÇÃO INCREMENTAL)
+# =========================
+# O estado de cada distrito (PI e Cadastro_Ano_Atual) só muda por duas razões: chegam dados novos
+# (muda a data do último levantamento de alguma infra) ou passa o tempo (uma infra atravessa o limite
+# de dias). Para a segunda, cada distrito tem na fila a data da sua próxima mudança; cada avaliação
+# só toca nos distritos com datas alteradas e nos que chegaram à data da fila. Só são emitidas
+# transições (edge-triggered) e o último estado emitido é guardado em disco.
+
+SEM_REGISTO = -1  # ordinal usado para "nunca registou"
+
+
+class FileSink:
+    """Acrescenta cada alerta como uma linha JSON num ficheiro local."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def __call__(self, alerta):
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(alerta, ensure_ascii=False) + '\n')
+
+
+class WebhookSink:
+    """Envia cada alerta por POST (JSON) para um URL; erros de rede são registados e ignorados."""
+
+    def __init__(self, url, timeout_s=5):
+        self.url, self.timeout_s = url, timeout_s
+
+    def __call__(self, alerta):
+        pedido = urllib.request.Request(self.url, data=json.dumps(alerta).encode(),
+                                        headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(pedido, timeout=self.timeout_s).close()
+        except OSError as e:
+            print(f"AVISO: Falha ao enviar alerta para {self.url}: {e}")
+
+
+def make_sink(especificacao):
+    """'file:caminho.jsonl' ou 'webhook:https://...' -> destino de alertas (None se vazio)."""
+    if not especificacao:
+        return None
+    tipo, _, alvo = especificacao.partition(':')
+    if tipo == 'file':
+        return FileSink(alvo)
+    if tipo == 'webhook':
+        return WebhookSink(alvo)
+    raise ValueError(f"Destino de alertas desconhecido: '{especificacao}'")
+
+
+class AlertEngine:
+    """
+    Avalia o PI (infra com dias parados >= `limite_dias`) e o Cadastro_Ano_Atual de cada distrito e
+    envia para `sink` apenas as mudanças de estado. `caminho_estado` guarda o último estado emitido,
+    para que reinícios não repitam nem percam alertas.
+    """
+
+    def __init__(self, limite_dias, sink, caminho_estado=None):
+        self.limite_dias = limite_dias
+        self.sink = sink
+        self.caminho_estado = caminho_estado
+        self._actividade = None
+        self._ultimas = {}  # chave -> (ordinais do último levantamento por infra, cadastro no ano)
+        self._fila = []  # (ordinal da próxima mudança, chave)
+        self._proxima = {}  # chave -> entrada válida na fila (as outras são ignoradas ao sair)
+        self._estado = self._ler_estado()
+        # Sem estado gravado, a primeira avaliação só estabelece a linha de base (não alerta o que já existia)
+        self._linha_base = not self._estado
+
+    def _ler_estado(self):
+        if self.caminho_estado and os.path.exists(self.caminho_estado):
+            with open(self.caminho_estado, encoding='utf-8') as f:
+                return {tuple(k.split('|', 1)): tuple(v) for k, v in json.load(f).items()}
+        return {}
+
+    def _gravar_estado(self):
+        if not self.caminho_estado:
+            return
+        temporario = f"{self.caminho_estado}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'|'.join(k): list(v) for k, v in self._estado.items()}, f, ensure_ascii=False)
+        os.replace(temporario, self.caminho_estado)
+
+    def _datas_alteradas(self, actividade):
+        """Distritos cujas datas de último levantamento (ou cadastro no ano) mudaram no novo snapshot."""
+        referencia = actividade['referencia'].toordinal()
+        dias = actividade['dias_parados']
+        ultimas = np.where(dias == 9999, SEM_REGISTO, referencia - dias)
+        alterados = set()
+        # O índice é (Distrito, Provincia); as chaves dos alertas são (Provincia, Distrito)
+        for (distrito, provincia), datas, cadastro in zip(actividade['indice'], ultimas.tolist(),
+                                                          actividade['cadastro_ano'].tolist()):
+            chave = (provincia, distrito)
+            valor = (tuple(datas), bool(cadastro))
+            if self._ultimas.get(chave) != valor:
+                self._ultimas[chave] = valor
+                alterados.add(chave)
+        return alterados
+
+    def _avaliar(self, chave, hoje):
+        """Estado actual do distrito e ordinal da próxima mudança por passagem do tempo (ou None)."""
+        datas, cadastro = self._ultimas[chave]
+        dias = [None if d == SEM_REGISTO else hoje - d for d in datas]
+        pi = sum(1 for d in dias if d is None or d >= self.limite_dias)
+        # Com o tempo o PI só sobe: a próxima mudança é a primeira infra a atingir o limite
+        futuras = [d_ultimo + self.limite_dias for d_ultimo, d in zip(datas, dias)
+                   if d is not None and d < self.limite_dias]
+        return (pi, cadastro), (min(futuras) if futuras else None), dias
+
+    def evaluate(self, actividade, hoje=None):
+        """Avalia os distritos afectados e emite as transições. Devolve o número de alertas emitidos."""
+        hoje = (hoje or date.today()).toordinal()
+        pendentes = set()
+        if actividade is not self._actividade:
+            self._actividade = actividade
+            pendentes |= self._datas_alteradas(actividade)
+        while self._fila and self._fila[0][0] <= hoje:
+            dia, chave = heapq.heappop(self._fila)
+            if self._proxima.get(chave) == dia:
+                pendentes.add(chave)
+
+        emitidos = 0
+        for chave in pendentes:
+            if chave not in self._ultimas:
+                continue
+            estado, proxima, dias = self._avaliar(chave, hoje)
+            self._proxima[chave] = proxima
+            if proxima is not None:
+                heapq.heappush(self._fila, (proxima, chave))
+            anterior = self._estado.get(chave)
+            if anterior == estado:
+                continue
+            self._estado[chave] = estado
+            if self._linha_base or (anterior is None and estado[0] == 0 and estado[1]):
+                continue  # linha de base, ou distrito novo e sem problemas: não há nada a alertar
+            self.sink({
+                'data': date.fromordinal(hoje).isoformat(),
+                'emitido_em': datetime.now().isoformat(timespec='seconds'),
+                'provincia': chave[0],
+                'distrito': chave[1],
+                'pi_anterior': anterior[0] if anterior else None,
+                'pi': estado[0],
+                'cadastro_ano_anterior': anterior[1] if anterior else None,
+                'cadastro_ano': estado[1],
+                'dias_parados': dias,
+                'limite_dias': self.limite_dias,
+            })
+            emitidos += 1
+
+        if emitidos or self._linha_base:
+            self._gravar_estado()
+        self._linha_base = False
+        return emitidos
+
+
+def acquire_scheduler_lock(caminho):
+    """
+    Tenta obter o bloqueio exclusivo (flock) do agendador: só um processo por máquina avalia os alertas,
+    mesmo com vários workers. Devolve o ficheiro aberto (a manter vivo) ou None.
+    """
+    ficheiro = open(caminho, 'a')
+    try:
+        fcntl.flock(ficheiro, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        ficheiro.close()
+        return None
+    return ficheiro
@@ -0,0 +1,134 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# =========================
+# ANOMALIAS NO VOLUME MENSAL DE LEVANTAMENTOS (DISTRITO x INFRA)
+# =========================
+# Todas as séries mensais distrito x infra do cubo de contagens são tratadas de uma vez, como uma matriz
+# (meses x séries): a linha de base de cada mês é a mediana do mesmo mês nos anos anteriores (sazonal),
+# ou, sem histórico desse mês, a mediana dos 12 meses anteriores; a escala é o MAD dos resíduos da série,
+# com o desvio de Poisson (raiz da base) como mínimo para as séries de volume baixo. O desvio z de cada
+# mês recente é (contagem - base) / escala. Os anos em que uma série não teve nenhum levantamento (distrito
+# ainda sem recolha) não entram nas linhas de base.
+
+COLUNAS_ANOMALIAS = ['Provincia', 'Distrito', 'Infra', 'Mes', 'Levantamentos', 'Esperado', 'Desvio (z)', 'Tipo']
+FACTOR_MAD = 1.4826  # MAD -> desvio padrão numa distribuição normal
+
+
+def _nanmedian(valores, axis):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # fatias só com NaN (sem histórico) dão NaN
+        return np.nanmedian(valores, axis=axis)
+
+
+def seasonal_baseline(serie, activa, anos_base):
+    """
+    Linha de base de cada mês (forma (meses, séries)) a partir da matriz `serie` (meses x séries) e da
+    máscara `activa` (mesma forma) dos meses que podem entrar nas linhas de base.
+    """
+    historico = np.where(activa, serie, np.nan)
+    anteriores = np.full((anos_base,) + serie.shape, np.nan)
+    for k in range(1, anos_base + 1):
+        if 12 * k < len(serie):
+            anteriores[k - 1, 12 * k:] = historico[:-12 * k]
+    base = _nanmedian(anteriores, axis=0)
+
+    # Sem o mesmo mês nos anos anteriores: mediana dos 12 meses anteriores
+    recuados = np.vstack([np.full((12, serie.shape[1]), np.nan), historico[:-1]])
+    base_recente = _nanmedian(sliding_window_view(recuados, 12, axis=0)[:len(serie)], axis=-1)
+    return np.where(np.isnan(base), base_recente, base)
+
+
+def _ranked(anomalias):
+    """Ordena pelo |desvio z| (maior primeiro); empates por província, distrito, infra e mês."""
+    ordem = anomalias.assign(_ordem=-anomalias['Desvio (z)'].abs())
+    return (ordem.sort_values(['_ordem', 'Provincia', 'Distrito', 'Infra', 'Mes'], kind='stable')
+            .drop(columns='_ordem').reset_index(drop=True))
+
+
+def _last_month(contagens):
+    """Posição (ano * 12 + mês) do último mês com levantamentos no cubo; -1 se não há nenhum."""
+    meses_com_dados = np.flatnonzero(contagens.sum(axis=(2, 3, 4)).ravel())
+    return int(meses_com_dados[-1]) if len(meses_com_dados) else -1
+
+
+def detect_anomalies(cubo, infra_names, meses=3, anos_base=3, volume_minimo=5, limiar_z=3.5, series=None):
+    """
+    Quedas e picos de volume nos `meses` meses completos mais recentes, para todas as séries distrito x
+    infra do cubo (ou só para as posições `series` da matriz meses x séries). O último mês com
+    levantamentos não é avaliado (provavelmente ainda incompleto).
+    Devolve um dataframe (COLUNAS_ANOMALIAS) ordenado pelo |desvio z|, do maior para o menor.
+    """
+    contagens = cubo['contagens']
+    vazio = pd.DataFrame(columns=COLUNAS_ANOMALIAS)
+    fim = _last_month(contagens) if contagens.size else -1
+    if fim < 0:
+        return vazio
+    n_anos, _, n_provincias, n_distritos, n_infra = contagens.shape
+    inicio = max(fim - meses, 0)
+    series = np.arange(n_provincias * n_distritos * n_infra) if series is None else np.asarray(series)
+    serie = contagens.reshape(n_anos * 12, -1)[:, series].astype(np.float64)
+
+    activa = np.repeat(contagens.sum(axis=1).reshape(n_anos, -1)[:, series] > 0, 12, axis=0)
+    base = seasonal_baseline(serie, activa, anos_base)
+
+    # Escala robusta por série, a partir dos resíduos anteriores ao período avaliado
+    residuos = np.where(activa[:inicio], serie[:inicio] - base[:inicio], np.nan)
+    mad = _nanmedian(np.abs(residuos - _nanmedian(residuos, axis=0)), axis=0)
+    recentes, base_recente = serie[inicio:fim], base[inicio:fim]
+    escala = np.fmax(FACTOR_MAD * np.nan_to_num(mad), np.sqrt(np.fmax(np.nan_to_num(base_recente), 1)))
+    z = (recentes - base_recente) / escala
+
+    # Só os distritos que existem (o eixo do distrito é preenchido até ao maior número por província)
+    existe = np.zeros((n_provincias, n_distritos, n_infra), dtype=bool)
+    for p, nomes in enumerate(cubo['distritos']):
+        existe[p, :len(nomes)] = True
+    sinalizadas = (~np.isnan(z) & (np.abs(z) >= limiar_z) & (np.fmax(recentes, base_recente) >= volume_minimo)
+                   & existe.ravel()[series])
+    linhas, colunas = np.nonzero(sinalizadas)
+    if not len(linhas):
+        return vazio
+
+    p, d, i = np.unravel_index(series[colunas], (n_provincias, n_distritos, n_infra))
+    mes_absoluto = inicio + linhas
+    anos = np.asarray(cubo['anos'])[mes_absoluto // 12]
+    valores_z = z[linhas, colunas]
+    anomalias = pd.DataFrame({
+        'Provincia': np.asarray(cubo['provincias'], dtype=object)[p],
+        'Distrito': [cubo['distritos'][pp][dd] for pp, dd in zip(p, d)],
+        'Infra': np.asarray(infra_names, dtype=object)[i],
+        'Mes': [f"{a}-{m + 1:02d}" for a, m in zip(anos, mes_absoluto % 12)],
+        'Levantamentos': recentes[linhas, colunas].astype(np.int64),
+        'Esperado': base_recente[linhas, colunas].round(1),
+        'Desvio (z)': valores_z.round(1),
+        'Tipo': np.where(valores_z < 0, 'Queda', 'Pico'),
+    })
+    return _ranked(anomalias)
+
+
+def update_anomalies(anomalias, cubo_anterior, cubo, infra_names, **parametros):
+    """
+    Anomalias depois de `cubo_anterior` passar a `cubo` (levantamentos novos juntos). Com os mesmos eixos e
+    o mesmo último mês, só as séries cujas contagens mudaram são reavaliadas; caso contrário, todas.
+    """
+    antes, depois = cubo_anterior['contagens'], cubo['contagens']
+    if (anomalias is None or antes.shape != depois.shape or cubo_anterior['distritos'] != cubo['distritos']
+            or _last_month(antes) != _last_month(depois)):
+        return detect_anomalies(cubo, infra_names, **parametros)
+    alteradas = np.flatnonzero((antes != depois).reshape(-1, antes[0, 0].size).any(axis=0))
+    if not len(alteradas):
+        return anomalias
+
+    _, _, n_provincias, n_distritos, n_infra = depois.shape
+    p, d, i = np.unravel_index(alteradas, (n_provincias, n_distritos, n_infra))
+    chaves = pd.MultiIndex.from_arrays([np.asarray(cubo['provincias'], dtype=object)[p],
+                                        [cubo['distritos'][pp][dd] if dd < len(cubo['distritos'][pp]) else None
+                                         for pp, dd in zip(p, d)],
+                                        np.asarray(infra_names, dtype=object)[i]])
+    mantidas = anomalias[~pd.MultiIndex.from_frame(anomalias[['Provincia', 'Distrito', 'Infra']]).isin(chaves)]
+    novas = detect_anomalies(cubo, infra_names, series=alteradas, **parametros)
+    partes = [parte for parte in (mantidas, novas) if len(parte)]
+    return _ranked(pd.concat(partes, ignore_index=True)) if partes else novas
@@ -1,11 +1,39 @@
+import gc
+import glob
+import os
+import threading
+import time
 import dash
-from dash import dcc, html, Input, Output, dash_table, State
+import flask
+from dash import dcc, html, Input, Output, dash_table, State, Patch
 import dash_bootstrap_components as dbc
-import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from functools import reduce
+from collections import Counter
+
+from cube import add_to_cube, build_count_cube, monthly_totals, province_totals, year_position, yearly_totals
+from dates import combine_reports, describe_report, normalize_dates
+from geo import load_district_geometries, normalize_name, zoom_level_for
+from dedup import DUPLICADO_EXACTO_COL, DUPLICADO_PROXIMO_COL, find_duplicates, summarize_duplicates
+from quality import build_hierarchy_reference, evaluate_rules
+from result_cache import ResultCache, snapshot_version
+from storage import PandasBackend, SQLiteBackend
+from excel_incremental import read_excel_incremental
+from ingest import count_rows, detect_format, iter_columns, read_columns
+from uploads import UploadQueue, save_upload
+from push import RefreshBroadcaster
+from alerts import AlertEngine, acquire_scheduler_lock, make_sink
+from anomalies import detect_anomalies, update_anomalies
+from coverage import GridIndex, community_coverage, coverage_summary, latest_positions
+from hierarchy import NUNCA, SEM_NOME, build_rollup
+from snapshot import read_snapshot, write_snapshot
+
+# Copy-on-write (por omissão a partir do pandas 3): recortes e selecções de colunas são vistas só de leitura,
+# copiadas apenas quando alteradas; nem o carregamento nem os callbacks fazem cópias defensivas
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # =========================
 # 1. CONFIGURAÇÃO E CARREGAR DADOS MULTI-INFRA
@@ -15,8 +43,16 @@ from functools import reduce
 CODIGO_COL = 'Codigo_Fonte'
 DISTRITO_COL = 'Distrito'
 DATA_COL = 'Data_Levantamento'
-ERROR_FLAG_COL = 'Erros_DAM_Simulados'
+ERROR_FLAG_COL = 'Erros_DAM'
 PROVINCIA_COL = 'Provincia'  # Constante para clareza (sem acento)
+POSTO_COL = 'Posto_Administrativo'  # Opcional: sem ele, a hierarquia pára no distrito
+
+# Hierarquia administrativa dos KPIs (do nível mais alto ao mais fino)
+HIERARCHY_LEVELS = [PROVINCIA_COL, DISTRITO_COL, POSTO_COL]
+
+# Infraestruturas e respectivas colunas de código
+INFRA_NAMES = ['Fontes', 'SAA', 'Comunidades']
+CODIGO_COLS = {'Fontes': CODIGO_COL, 'SAA': 'Codigo_SAA', 'Comunidades': 'Codigo_Comunidade'}
 
 # Parâmetros de Priorização de Inactividade e Novos KPIs
 DAYS_THRESHOLD = 14
@@ -24,28 +60,182 @@ INATIVIDADE_SCORE_NAME = 'Pontos de Inactividade (PI)'
 DAYS_COLS = ['Dias Parados (Fontes)', 'Dias Parados (SAA)', 'Dias Parados (Comunidades)']
 DAYS_ACTIVE_THRESHOLD = 30
 
+# Janelas (em dias) pré-calculadas para as métricas de actividade (limites seleccionáveis na UI)
+ACTIVITY_WINDOWS = (7, 14, 30, 90, 365)
+
+# Previsão da data em que cada distrito/infra ultrapassa o limite de inactividade (intervalos entre levantamentos)
+BREACH_MIN_GAPS = 3  # Intervalos mínimos (entre dias com levantamentos) para haver previsão
+FORECAST_COLS = ['Limite Previsto (Fontes)', 'Limite Previsto (SAA)', 'Limite Previsto (Comunidades)']
+
+# Parâmetros de Deduplicação (levantamentos reenviados)
+DEDUP_JANELA_DIAS = 3  # Mesmo código e distrito com datas a <= N dias: duplicado próximo
+DEDUP_DROP = True  # Remove os duplicados exactos antes das agregações
+DEDUP_DROP_NEAR = False  # Remove também os duplicados próximos (por omissão só são reportados)
+
+# Parâmetros do Mapa de Distritos (GeoJSON local, simplificado por nível de zoom)
+DISTRICTS_GEOJSON = 'mocambique_distritos.geojson'
+GEOJSON_DISTRITO_PROP = 'Distrito'
+MAP_ZOOM_TOLERANCES = {0: 0.02, 6: 0.005, 8: 0.001}  # zoom mínimo -> tolerância de simplificação (graus)
+MAP_COORD_DECIMALS = 3
+MAP_INITIAL_ZOOM = 4.5
+MAP_CENTER = {'lat': -18.5, 'lon': 35.5}
+
+# Parâmetros da Detecção de Anomalias no volume mensal de levantamentos (distrito x infra)
+ANOMALY_MONTHS = 3  # Meses completos mais recentes avaliados
+ANOMALY_BASE_YEARS = 3  # Anos anteriores na linha de base sazonal (mesmo mês)
+ANOMALY_MIN_VOLUME = 5  # Ignora meses em que a contagem e a base ficam ambas abaixo deste volume
+ANOMALY_Z_THRESHOLD = 3.5
+ANOMALY_PARAMS = {'meses': ANOMALY_MONTHS, 'anos_base': ANOMALY_BASE_YEARS, 'volume_minimo': ANOMALY_MIN_VOLUME,
+                  'limiar_z': ANOMALY_Z_THRESHOLD}
+
+# Parâmetros da Cobertura das Comunidades por pontos de água (coordenadas opcionais nos ficheiros)
+LATITUDE_COL = 'Latitude'
+LONGITUDE_COL = 'Longitude'
+COORD_COLS = [LATITUDE_COL, LONGITUDE_COL]
+OPTIONAL_COLS = [POSTO_COL] + COORD_COLS  # Lidas quando existem nos ficheiros (hierarquia e cobertura)
+WATER_POINT_INFRA = ('Fontes', 'SAA')  # Infra cujos levantamentos são pontos de água
+COVERAGE_RADIUS_KM = 0.5  # Comunidade sem nenhum ponto de água a esta distância: sem cobertura
+
+# Parâmetros das Regras de Qualidade (DAM)
+DATA_MINIMA_PLAUSIVEL = '2000-01-01'
+QUALITY_RULE_BUDGET_MS = 50
+
+# Ficheiros de dados: por infra, o primeiro que existir pela ordem de DATA_FORMATS (xlsx, csv ou parquet)
+DATA_FORMATS = tuple(f.strip() for f in os.environ.get('DATA_FORMATS', 'parquet,csv,xlsx').split(',') if f.strip())
+FICHEIROS_BASE = {'Fontes': 'fontes_cleaned', 'SAA': 'saa_cleaned', 'Comunidades': 'comunidades_cleaned'}
+FICHEIROS_DADOS = tuple(f"{base}.{formato}" for base in FICHEIROS_BASE.values() for formato in DATA_FORMATS)
+
+# Modo só de leitura: o estado pré-calculado é lido de um instantâneo (export_snapshot.py), sem ler os ficheiros
+# de levantamentos nem recalcular os agregados. Desactiva os carregamentos e a recarga automática
+SNAPSHOT_FILE = os.environ.get('SNAPSHOT_FILE', '')
+
+# Carregamento de novos levantamentos pela página /carregar ('' desactiva): os aceites ficam em UPLOAD_DIR e
+# os outros workers juntam-nos a cada UPLOAD_POLL_S segundos
+UPLOAD_DIR = '' if SNAPSHOT_FILE else os.environ.get('UPLOAD_DIR', 'carregamentos')
+UPLOAD_POLL_S = int(os.environ.get('UPLOAD_POLL_S', '5'))
+UPLOAD_CHUNK_ROWS = 50000  # Linhas validadas por bloco (progresso reportado a cada bloco)
+
+# Cache de Resultados dos Callbacks
+RESULT_CACHE_MAX_MB = float(os.environ.get('RESULT_CACHE_MAX_MB', '64'))  # Limite da cache em memória, por worker
+RESULT_CACHE_DB = os.environ.get('RESULT_CACHE_DB')  # Ficheiro SQLite partilhado entre workers (opcional)
+RESULT_CACHE_VISITS = os.environ.get('RESULT_CACHE_VISITS', 'cache_visitas.json')  # '' desactiva a contagem
+RESULT_CACHE_WARMUP = int(os.environ.get('RESULT_CACHE_WARMUP', '20'))  # Resultados pré-aquecidos no arranque
+
+# Leitura incremental dos Excel (cache de blocos de linhas; '' desactiva) e recarga automática (0 = desligada)
+EXCEL_CACHE_DIR = os.environ.get('EXCEL_CACHE_DIR', '.cache_excel')
+DATA_RELOAD_INTERVAL_S = 0 if SNAPSHOT_FILE else int(os.environ.get('DATA_RELOAD_INTERVAL_S', '0'))
+DAY_CHECK_INTERVAL_S = 60  # Verificação da mudança de dia (dias parados e KPIs referidos à data de hoje)
+
+# Alertas de inactividade: destino ('file:alertas.jsonl' ou 'webhook:URL'; vazio desactiva) e periodicidade
+ALERT_SINK = os.environ.get('ALERT_SINK', '')
+ALERT_INTERVAL_S = int(os.environ.get('ALERT_INTERVAL_S', '60'))
+ALERT_STATE_FILE = os.environ.get('ALERT_STATE_FILE', 'alertas_estado.json')
+
+# Difusão das actualizações de dados aos navegadores abertos (server-sent events em /eventos; '1' activa).
+# Cada ligação ocupa uma thread do worker durante PUSH_STREAM_MAX_S: usar com o worker gthread (--threads)
+PUSH_EVENTS = os.environ.get('PUSH_EVENTS', '0') == '1'
+PUSH_MAX_CLIENTS = int(os.environ.get('PUSH_MAX_CLIENTS', '32'))  # Ligações simultâneas por worker
+PUSH_STREAM_MAX_S = int(os.environ.get('PUSH_STREAM_MAX_S', '300'))
+
+# Armazenamento dos levantamentos consultado pelos callbacks: 'pandas' (em memória) ou 'sqlite' (ficheiro)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'pandas')
+STORAGE_DB = os.environ.get('STORAGE_DB', 'sinas_levantamentos.db')
+
+
+def quality_rules_for(codigo_col):
+    """Regras de qualidade (DAM) declarativas de uma infraestrutura."""
+    return [
+        {'nome': 'Campos obrigatórios em falta', 'tipo': 'obrigatorio',
+         'colunas': [PROVINCIA_COL, DISTRITO_COL, DATA_COL, codigo_col], 'orcamento_ms': QUALITY_RULE_BUDGET_MS},
+        {'nome': 'Código duplicado', 'tipo': 'duplicado', 'colunas': [codigo_col],
+         'orcamento_ms': QUALITY_RULE_BUDGET_MS},
+        {'nome': 'Data futura', 'tipo': 'data_futura', 'coluna': DATA_COL, 'orcamento_ms': QUALITY_RULE_BUDGET_MS},
+        {'nome': 'Data fora do intervalo', 'tipo': 'intervalo_datas', 'coluna': DATA_COL,
+         'minimo': DATA_MINIMA_PLAUSIVEL, 'orcamento_ms': QUALITY_RULE_BUDGET_MS},
+        {'nome': 'Distrito/Província inconsistente', 'tipo': 'hierarquia', 'filho': DISTRITO_COL,
+         'pai': PROVINCIA_COL, 'orcamento_ms': QUALITY_RULE_BUDGET_MS},
+    ]
+
+
+def read_workbook(file_name):
+    """Lê o livro Excel; com EXCEL_CACHE_DIR só os blocos de linhas novos ou alterados são interpretados."""
+    if not EXCEL_CACHE_DIR:
+        return pd.read_excel(file_name)
+    try:
+        df, estatisticas = read_excel_incremental(file_name, EXCEL_CACHE_DIR)
+    except FileNotFoundError:
+        raise
+    except Exception as e:
+        print(f"AVISO: Leitura incremental de '{file_name}' falhou ({e}). A ler o ficheiro completo.")
+        return pd.read_excel(file_name)
+    print(f"EXCEL ({file_name}): {estatisticas['novos']} de {estatisticas['blocos']} blocos de linhas "
+          f"interpretados, {estatisticas['removidos']} removidos.")
+    return df
+
+
+def data_file_for(infra_name):
+    """Ficheiro de dados da infra: o primeiro existente pela ordem de DATA_FORMATS (ou o último candidato)."""
+    candidatos = [f"{FICHEIROS_BASE[infra_name]}.{formato}" for formato in DATA_FORMATS]
+    return next((c for c in candidatos if os.path.exists(c)), candidatos[-1])
+
+
+def upload_files():
+    """Levantamentos aceites pela página de carregamento (CSV em UPLOAD_DIR), por ordem do nome do ficheiro."""
+    if not UPLOAD_DIR:
+        return []
+    return sorted(glob.glob(os.path.join(UPLOAD_DIR, "*.*.csv")))
+
+
+def upload_infra(caminho):
+    """Infra de um ficheiro aceite (o nome começa pelo nome base do ficheiro principal)."""
+    base = os.path.basename(caminho).split('.', 1)[0]
+    return next(infra for infra, nome in FICHEIROS_BASE.items() if nome == base)
+
+
+def data_version(carregamentos):
+    """Versão dos dados: ficheiros principais mais os carregamentos aceites já incluídos."""
+    return snapshot_version(FICHEIROS_DADOS + tuple(sorted(carregamentos)))
+
+
+def read_survey_file(file_name, colunas):
+    """Lê apenas as `colunas` usadas pelo dashboard, com o leitor adequado ao formato do ficheiro."""
+    formato = detect_format(file_name)
+    if formato == 'xlsx':
+        df = read_workbook(file_name)
+        return df[[c for c in df.columns if c in colunas]]
+    inicio = time.perf_counter()
+    df = read_columns(file_name, formato, colunas)
+    print(f"LEITURA ({file_name}): {formato.upper()}, {len(df)} linhas e {len(df.columns)} colunas "
+          f"em {time.perf_counter() - inicio:.2f} s.")
+    return df
+
 
-def load_and_clean(file_name, data_col_name):
+def load_and_clean(file_name, data_col_name, codigo_col=CODIGO_COL):
     """Carrega o ficheiro, padroniza as colunas de data e filtra Maputo Cidade."""
     try:
-        # Certifique-se de que os ficheiros 'fontes_cleaned.xlsx', 'saa_cleaned.xlsx',
-        # e 'comunidades_cleaned.xlsx' estão disponíveis na mesma pasta.
-        df = pd.read_excel(file_name)
+        # Certifique-se de que os ficheiros 'fontes_cleaned', 'saa_cleaned' e 'comunidades_cleaned'
+        # (.xlsx, .csv ou .parquet) estão disponíveis na mesma pasta.
+        df = read_survey_file(file_name, [PROVINCIA_COL, DISTRITO_COL, data_col_name, codigo_col] + OPTIONAL_COLS)
 
         if data_col_name not in df.columns:
             print(
                 f"ERRO DE COLUNA CRÍTICO no ficheiro '{file_name}': A coluna de data '{data_col_name}' não foi encontrada.")
             return pd.DataFrame(columns=[PROVINCIA_COL, DISTRITO_COL, DATA_COL, 'Ano', 'Mes', CODIGO_COL])
 
-        df[DATA_COL] = pd.to_datetime(df[data_col_name], errors='coerce')
-        df = df[df[PROVINCIA_COL] != 'Maputo Cidade'].copy()
+        df[DATA_COL], relatorio_datas = normalize_dates(df[data_col_name], minimo=DATA_MINIMA_PLAUSIVEL)
+        print(f"DATAS ({file_name}): {describe_report(relatorio_datas)}")
+        df = df[df[PROVINCIA_COL] != 'Maputo Cidade']
 
-        if file_name == "fontes_cleaned.xlsx" and CODIGO_COL not in df.columns:
+        if codigo_col == CODIGO_COL and CODIGO_COL not in df.columns:
             print(f"ERRO CRÍTICO: O ficheiro {file_name} não tem a coluna de código '{CODIGO_COL}'.")
             return pd.DataFrame(columns=[PROVINCIA_COL, DISTRITO_COL, DATA_COL, 'Ano', 'Mes', CODIGO_COL])
 
         df['Ano'] = df[DATA_COL].dt.year
         df['Mes'] = df[DATA_COL].dt.month
+        # Coordenadas (opcionais): texto ou células inválidas ficam NaN
+        for col in COORD_COLS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
 
         return df
     except FileNotFoundError:
@@ -56,100 +246,856 @@ def load_and_clean(file_name, data_col_name):
         return pd.DataFrame(columns=[PROVINCIA_COL, DISTRITO_COL, DATA_COL, 'Ano', 'Mes', CODIGO_COL])
 
 
-# Carregando as 3 Fontes de Dados
-df_fontes = load_and_clean("fontes_cleaned.xlsx", DATA_COL)
-df_saa = load_and_clean("saa_cleaned.xlsx", DATA_COL)
-df_comunidades = load_and_clean("comunidades_cleaned.xlsx", DATA_COL)
+def deduplicate(df_infra, infra_name):
+    """Detecta (e opcionalmente remove) levantamentos duplicados de uma infra, devolvendo as contagens por distrito."""
+    marcas = find_duplicates(df_infra, [CODIGO_COLS[infra_name], DISTRITO_COL], DATA_COL, DEDUP_JANELA_DIAS)
+    contagens = summarize_duplicates(df_infra, marcas, [PROVINCIA_COL, DISTRITO_COL])
 
-# SIMULAÇÃO DE ERRO DE QUALIDADE (DAM)
-if not df_fontes.empty:
-    df_fontes[ERROR_FLAG_COL] = df_fontes[CODIGO_COL].isna().astype(int)
+    remover = marcas[DUPLICADO_EXACTO_COL] if DEDUP_DROP else pd.Series(False, index=df_infra.index)
+    if DEDUP_DROP_NEAR:
+        remover = remover | marcas[DUPLICADO_PROXIMO_COL]
 
-# DataFrame de Levantamentos (usado para o Dashboard Geral e filtros)
-df = df_fontes.copy()
+    print(f"DEDUPLICAÇÃO ({infra_name}): {int(marcas[DUPLICADO_EXACTO_COL].sum())} duplicados exactos, "
+          f"{int(marcas[DUPLICADO_PROXIMO_COL].sum())} próximos (<= {DEDUP_JANELA_DIAS} dias); "
+          f"{int(remover.sum())} removidos.")
+    if remover.any():
+        df_infra = df_infra[~remover]
+    return df_infra, contagens
 
-# Determinação do Ano Alvo
-TARGET_YEAR = df['Ano'].max() if not df.empty else datetime.now().year
-df_2025 = df[df["Ano"] == TARGET_YEAR].copy()
+
+def evaluate_quality(dfs_infra, duplicados):
+    """Avalia as regras de qualidade (DAM) nas 3 infra e marca ERROR_FLAG_COL em cada registo."""
+    referencias = {
+        (DISTRITO_COL, PROVINCIA_COL): build_hierarchy_reference(dfs_infra, DISTRITO_COL, PROVINCIA_COL)
+    }
+    qualidade = {}
+    for infra_name, df_infra in zip(INFRA_NAMES, dfs_infra):
+        qualidade[infra_name] = evaluate_rules(df_infra, quality_rules_for(CODIGO_COLS[infra_name]),
+                                               [PROVINCIA_COL, DISTRITO_COL], referencias)
+        df_infra[ERROR_FLAG_COL] = qualidade[infra_name]['mascaras'].any(axis=1).astype(int)
+        # Os duplicados detectados entram no resumo de qualidade como linhas adicionais
+        qualidade[infra_name]['contagens'] = pd.concat(
+            [qualidade[infra_name]['contagens'], duplicados[infra_name]], axis=1).fillna(0).astype(int)
+    return qualidade
 
 
 # =========================
 # FUNÇÕES DE CÁLCULO DE INACTVIDADE E GERAIS
 # =========================
 
-def calculate_last_activity(df_base, infra_name):
-    """Calcula os dias parados por distrito para um dado dataframe."""
+def quality_summary(provincia=None, distrito=None):
+    """Erros DAM por regra (linhas) e infraestrutura (colunas), lidos das contagens pré-calculadas."""
+    resumo = {}
+    for infra_name, resultado in qualidade_infra.items():
+        contagens = resultado['contagens']
+        mascara = np.ones(len(contagens), dtype=bool)
+        if provincia:
+            mascara &= contagens.index.get_level_values(0) == provincia
+        if distrito:
+            mascara &= contagens.index.get_level_values(1) == distrito
+        resumo[infra_name] = contagens[mascara].sum()
+    return pd.DataFrame(resumo, columns=INFRA_NAMES).fillna(0).astype(int)
+
+
+def build_kpi_rollup(dfs_infra):
+    """
+    KPIs de todos os nós de HIERARCHY_LEVELS (país, províncias, distritos, postos), calculados de baixo
+    para cima numa passagem por infra; cada página lê o seu nó com uma consulta.
+    """
+    return build_rollup(dfs_infra, INFRA_NAMES, HIERARCHY_LEVELS, DATA_COL, ERROR_FLAG_COL, TARGET_YEAR,
+                        datetime.now().date(), DAYS_THRESHOLD, DAYS_ACTIVE_THRESHOLD)
+
+
+def calculate_windowed_activity(dfs_infra, windows=ACTIVITY_WINDOWS, indice=None):
+    """
+    Calcula, numa única passagem por infra, os dias parados e as contagens de levantamentos
+    de cada distrito para todas as janelas (registos com dias parados <= janela).
+    Com `indice` (de um cálculo anterior), devolve None se algum registo for de um distrito fora dele.
+    """
     hoje = pd.to_datetime(datetime.now().date())
+    janelas = np.asarray(sorted(windows), dtype=np.int64)
+
+    # Índice comum (Distrito, Provincia) para as 3 infraestruturas
+    indice_fixo = indice is not None
+    if not indice_fixo:
+        chaves = pd.concat([d[[DISTRITO_COL, PROVINCIA_COL]] for d in dfs_infra]).dropna().drop_duplicates()
+        indice = pd.MultiIndex.from_frame(chaves.sort_values([PROVINCIA_COL, DISTRITO_COL]))
+    n_distritos, n_janelas = len(indice), len(janelas)
+
+    contagens = np.zeros((n_distritos, len(dfs_infra), n_janelas), dtype=np.int64)
+    dias_parados = np.full((n_distritos, len(dfs_infra)), 9999, dtype=np.int64)
+    cadastro_ano = np.zeros(n_distritos, dtype=bool)
+
+    for j, df_base in enumerate(dfs_infra):
+        codigos = indice.get_indexer(pd.MultiIndex.from_frame(df_base[[DISTRITO_COL, PROVINCIA_COL]]))
+        com_chave = df_base[[DISTRITO_COL, PROVINCIA_COL]].notna().all(axis=1).to_numpy()
+        if indice_fixo and ((codigos < 0) & com_chave).any():
+            return None
+        validos = df_base[DATA_COL].notna().to_numpy() & (codigos >= 0)
+        codigos = codigos[validos]
+        dias = (hoje - df_base[DATA_COL][validos]).dt.days.to_numpy(dtype=np.int64)
+
+        # Cada registo cai na primeira janela que o contém; a soma acumulada dá a contagem por janela
+        balde = np.searchsorted(janelas, dias, side='left')
+        histograma = np.bincount(codigos * (n_janelas + 1) + balde,
+                                 minlength=n_distritos * (n_janelas + 1)).reshape(n_distritos, n_janelas + 1)
+        contagens[:, j, :] = np.cumsum(histograma[:, :n_janelas], axis=1)
+        np.minimum.at(dias_parados[:, j], codigos, dias)
+        cadastro_ano[codigos[df_base['Ano'].to_numpy()[validos] == TARGET_YEAR]] = True
+
+    return {
+        'indice': indice,
+        'janelas': janelas,
+        'contagens': contagens,
+        'dias_parados': dias_parados,
+        'cadastro_ano': cadastro_ano,
+        'referencia': hoje.date(),  # data a que os dias parados se referem
+    }
+
+
+def add_to_activity(actividade, dfs_novos):
+    """
+    Métricas de actividade com os levantamentos novos (um dataframe por infra) somados. None se trazem
+    distritos novos ou se os dias parados se referem a outro dia (é preciso recalcular tudo).
+    """
+    if actividade['referencia'] != datetime.now().date():
+        return None
+    novas = calculate_windowed_activity(dfs_novos, actividade['janelas'], indice=actividade['indice'])
+    if novas is None:
+        return None
+    return dict(actividade, contagens=actividade['contagens'] + novas['contagens'],
+                dias_parados=np.minimum(actividade['dias_parados'], novas['dias_parados']),
+                cadastro_ano=actividade['cadastro_ano'] | novas['cadastro_ano'])
 
-    last_reg = df_base.groupby([DISTRITO_COL, PROVINCIA_COL])[DATA_COL].max().reset_index()
-    last_reg[f'Dias Parados ({infra_name})'] = (hoje - last_reg[DATA_COL]).dt.days
 
-    return last_reg[[DISTRITO_COL, PROVINCIA_COL, f'Dias Parados ({infra_name})']]
+def calculate_breach_forecast(dfs_infra, actividade):
+    """
+    Dias (a partir da data de referência da `actividade`) até cada distrito/infra ultrapassar cada janela
+    de inactividade, estimados dos intervalos entre dias consecutivos com levantamentos. Forma
+    (distritos, infra, janelas); 0 se o limite já foi ultrapassado, NaN sem histórico suficiente ou se
+    nenhum intervalo passado excedeu o limite.
+
+    Cada intervalo futuro excede o limite T com a probabilidade p observada. O intervalo em curso (já com
+    d dias) excede-o com q = P(intervalo > T | intervalo > d); se não exceder, termina em média ao fim de
+    m_d dias e seguem-se (1 - p) / p intervalos curtos (média m) antes do intervalo longo:
+    E = q T + (1 - q) (m_d + (1 - p) / p m + T) dias depois do último levantamento.
+    """
+    indice, janelas, dias_parados = actividade['indice'], actividade['janelas'], actividade['dias_parados']
+    referencia = pd.Timestamp(actividade['referencia'])
+    n_distritos, n_janelas = len(indice), len(janelas)
+    previsao = np.full((n_distritos, len(dfs_infra), n_janelas), np.nan)
+
+    for j, df_base in enumerate(dfs_infra):
+        codigos = indice.get_indexer(pd.MultiIndex.from_frame(df_base[[DISTRITO_COL, PROVINCIA_COL]]))
+        validos = df_base[DATA_COL].notna().to_numpy() & (codigos >= 0)
+        codigos = codigos[validos]
+        dias = (df_base[DATA_COL][validos] - referencia).dt.days.to_numpy(dtype=np.int64)
+
+        # Intervalos entre dias distintos com levantamentos, por distrito, numa única ordenação
+        ordem = np.lexsort((dias, codigos))
+        codigos, dias = codigos[ordem], dias[ordem]
+        mesmo_distrito = codigos[1:] == codigos[:-1]
+        intervalos = np.diff(dias)
+        validos = mesmo_distrito & (intervalos > 0)
+        codigos, intervalos = codigos[1:][validos], intervalos[validos]
+
+        # Por distrito e janela: contagens e somas dos intervalos <= T (todos e só os > d, o intervalo em curso)
+        balde = np.searchsorted(janelas, intervalos, side='left')
+        chave = codigos * (n_janelas + 1) + balde
+        forma = (n_distritos, n_janelas + 1)
+        maior_d = intervalos > dias_parados[codigos, j]
+
+        def acumulado(pesos):
+            histograma = np.bincount(chave, weights=pesos, minlength=n_distritos * (n_janelas + 1))
+            return np.cumsum(histograma.reshape(forma)[:, :n_janelas], axis=1)
+
+        n_total = np.bincount(codigos, minlength=n_distritos)[:, None].astype(np.float64)
+        n_curtos, soma_curtos = acumulado(None), acumulado(intervalos)
+        n_maior_d = np.bincount(codigos, weights=maior_d, minlength=n_distritos)[:, None]
+        n_d_t, soma_d_t = acumulado(maior_d), acumulado(intervalos * maior_d)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_longos = n_total - n_curtos
+            p = n_longos / n_total
+            q = np.where(n_maior_d > 0, n_longos / np.maximum(n_maior_d, 1), 1.0)
+            m, m_d = soma_curtos / n_curtos, np.where(n_d_t > 0, soma_d_t / n_d_t, 0)
+            depois_do_curso = np.where(p > 0, m_d + (1 - p) / p * np.nan_to_num(m) + janelas, np.inf)
+            esperado = q * janelas + np.where(q < 1, (1 - q) * depois_do_curso, 0)
+
+        d = dias_parados[:, j][:, None]
+        # Sem intervalos passados acima de T (p = 0) não há base para prever quando o limite será excedido
+        com_previsao = (n_total >= BREACH_MIN_GAPS) & (p > 0) & np.isfinite(esperado)
+        previsao[:, j, :] = np.where(d >= janelas, 0, np.where(com_previsao, np.ceil(esperado - d), np.nan))
+        previsao[dias_parados[:, j] == 9999, j, :] = np.nan  # nunca registou: sem data de referência
+
+    return previsao
+
+
+def inatividade_por_janela(actividade, janela, provincia=None, previsao=None):
+    """
+    Monta a tabela de inactividade para um limite (dias) a partir das métricas pré-calculadas; com
+    `previsao` (calculate_breach_forecast), acrescenta a data prevista de ultrapassagem por infra.
+    """
+    indice = actividade['indice']
+    mascara = slice(None) if provincia is None else (indice.get_level_values(PROVINCIA_COL) == provincia)
+    dias = actividade['dias_parados'][mascara]
+    posicao_janela = int(np.searchsorted(actividade['janelas'], janela))
+
+    df_inatividade = indice[mascara].to_frame(index=False)
+    for j, col_name in enumerate(DAYS_COLS):
+        df_inatividade[col_name] = dias[:, j]
+
+    validos = np.where(dias != 9999, dias, -1)
+    df_inatividade['Max_Dias_Parados'] = dias.min(axis=1)
+    df_inatividade[INATIVIDADE_SCORE_NAME] = (dias >= janela).sum(axis=1)
+    df_inatividade['Inactividade_Media_Dias'] = np.where(validos.max(axis=1) >= 0, validos.max(axis=1), 9999)
+    df_inatividade['Levantamentos_Janela'] = actividade['contagens'][mascara][:, :, posicao_janela].sum(axis=1)
+    df_inatividade['Cadastro_Ano_Atual'] = actividade['cadastro_ano'][mascara]
+    if previsao is not None:
+        referencia = pd.Timestamp(actividade['referencia'])
+        for j, col_name in enumerate(FORECAST_COLS):
+            df_inatividade[col_name] = referencia + pd.to_timedelta(previsao[mascara][:, j, posicao_janela], unit='D')
+    return df_inatividade
 
 
-def calculate_inatividade_score(row):
-    """Calcula a pontuação de inactividade (0 a 3) com base nos 3 indicadores de Dias Parados (Limite: 14 dias)."""
-    parados = 0
-    for col_name in DAYS_COLS:
-        # Se o distrito tem valor 9999 (nunca registou) ou está acima do limite
-        if row[col_name] >= DAYS_THRESHOLD:
-            parados += 1
-    return parados
+def format_breach_date(data_prevista):
+    """Texto da data prevista de ultrapassagem do limite (tabelas de inactividade)."""
+    if pd.isna(data_prevista):
+        return "SEM PREVISÃO"
+    if data_prevista <= pd.Timestamp(actividade_janelas['referencia']):
+        return "ULTRAPASSADO"
+    return data_prevista.strftime('%d/%m/%Y')
 
 
-def get_full_inatividade_df(df_fontes, df_saa, df_comunidades):
-    """Cria e calcula o DataFrame de Inactividade de Cadastro para todos os distritos."""
+def format_inactivity_table(df_inatividade):
+    """Linhas da tabela de inactividade por distrito (ordenadas pelo PI), com os valores já formatados."""
+    df_tabela = df_inatividade[
+        [PROVINCIA_COL, DISTRITO_COL, INATIVIDADE_SCORE_NAME, 'Inactividade_Media_Dias', 'Levantamentos_Janela'] +
+        DAYS_COLS + FORECAST_COLS]
+    df_tabela = df_tabela.sort_values([INATIVIDADE_SCORE_NAME, 'Inactividade_Media_Dias'], ascending=[False, False])
 
-    # ----------------------------------------------------
-    # 1. CÁLCULO DE INACTIVIDADE TEMPORAL (PI)
-    # ----------------------------------------------------
-    df_dias_fontes = calculate_last_activity(df_fontes, 'Fontes')
-    df_dias_saa = calculate_last_activity(df_saa, 'SAA')
-    df_dias_comunidades = calculate_last_activity(df_comunidades, 'Comunidades')
+    # Formatando os números para a visualização
+    for col in DAYS_COLS + ['Inactividade_Media_Dias']:
+        df_tabela[col] = df_tabela[col].apply(lambda x: f"{int(x):,} dias" if x != 9999 else "NUNCA REGISTOU")
+    # Data prevista de ultrapassagem do limite (intervalos entre levantamentos)
+    for col in FORECAST_COLS:
+        df_tabela[col] = df_tabela[col].apply(format_breach_date)
+    return df_tabela
 
-    data_frames = [df_dias_fontes, df_dias_saa, df_dias_comunidades]
 
-    # Merge usando a constante PROVINCIA_COL
-    df_inatividade = reduce(lambda left, right: pd.merge(left, right, on=[DISTRITO_COL, PROVINCIA_COL], how='outer'),
-                            data_frames)
+def format_subdivision_table(df_filhos, janela):
+    """
+    Linhas da tabela dos nós abaixo de um distrito (postos administrativos), com o PI recalculado para o
+    limite seleccionado e os valores já formatados. Vazia se os ficheiros não trazem esse nível.
+    """
+    nivel = HIERARCHY_LEVELS[2] if len(HIERARCHY_LEVELS) > 2 else None
+    if nivel is None or df_filhos.empty or (df_filhos[nivel] == SEM_NOME).all():
+        return pd.DataFrame()
+    df_tabela = df_filhos.assign(**{INATIVIDADE_SCORE_NAME: (df_filhos[DAYS_COLS] >= janela).sum(axis=1)})
+    df_tabela = df_tabela.sort_values([INATIVIDADE_SCORE_NAME, 'Inactividade_Dias'], ascending=[False, False])
+    for col in DAYS_COLS:
+        df_tabela[col] = df_tabela[col].apply(lambda x: f"{int(x):,} dias" if x != NUNCA else "NUNCA REGISTOU")
+    df_tabela['Percent_Erros_DAM'] = df_tabela['Percent_Erros_DAM'].map(lambda x: f"{x:.1f}%")
+    df_tabela['Cadastro_Ano_Atual'] = np.where(df_tabela['Cadastro_Ano_Atual'], "SIM", "NÃO")
+    return df_tabela[[nivel, 'Total', INATIVIDADE_SCORE_NAME] + DAYS_COLS + ['Percent_Erros_DAM', 'Cadastro_Ano_Atual']]
 
-    # Max_Dias_Parados -> O número de dias mais recente (mínimo de dias parados) para o distrito entre as 3 infraestruturas
-    df_inatividade['Max_Dias_Parados'] = df_inatividade[DAYS_COLS].min(
-        axis=1)  # Usamos MIN para encontrar o registo MAIS RECENTE (menor n° de dias parados)
-    df_inatividade = df_inatividade.fillna(9999)
-    df_inatividade[INATIVIDADE_SCORE_NAME] = df_inatividade.apply(calculate_inatividade_score, axis=1)
 
-    def calculate_average_inactive_days(row):
-        # A média de dias parados SÓ para as infraestruturas que TÊM registo (valor != 9999)
-        valid_days = [row[col] for col in DAYS_COLS if row[col] != 9999]
-        # Aqui usamos MAX dos dias parados válidos, para ter a pior situação de inatividade
-        return max(valid_days) if valid_days else 9999
+def build_water_point_index(dfs_infra):
+    """Índice espacial da última posição conhecida de cada ponto de água (Fontes e SAA com coordenadas)."""
+    posicoes = pd.concat([latest_positions(df_base, CODIGO_COLS[infra_name], LATITUDE_COL, LONGITUDE_COL, DATA_COL)
+                          for infra_name, df_base in zip(INFRA_NAMES, dfs_infra) if infra_name in WATER_POINT_INFRA],
+                         ignore_index=True).dropna(subset=COORD_COLS)
+    return GridIndex(posicoes[LATITUDE_COL].to_numpy(dtype=np.float64),
+                     posicoes[LONGITUDE_COL].to_numpy(dtype=np.float64), celula_minima_km=COVERAGE_RADIUS_KM)
 
-    df_inatividade['Inactividade_Media_Dias'] = df_inatividade.apply(calculate_average_inactive_days, axis=1)
 
-    # ----------------------------------------------------
-    # 2. CÁLCULO DE INACTIVIDADE CRÍTICA ANUAL (CADASTRO)
-    # ----------------------------------------------------
+def calculate_coverage(df_comunidades, indice):
+    """
+    Cobertura de cada comunidade (última posição conhecida de cada código): distância ao ponto de água mais
+    próximo e pontos de água a COVERAGE_RADIUS_KM, consultados de uma vez no índice.
+    """
+    comunidades = latest_positions(df_comunidades, CODIGO_COLS['Comunidades'], LATITUDE_COL, LONGITUDE_COL, DATA_COL,
+                                   [PROVINCIA_COL, DISTRITO_COL])
+    return community_coverage(comunidades, indice, COVERAGE_RADIUS_KM, LATITUDE_COL, LONGITUDE_COL)
 
-    # Obter a lista de distritos que fizeram cadastro em CADA INFRA no ANO ATUAL
-    distritos_ativos_fontes_ano = df_fontes[df_fontes['Ano'] == TARGET_YEAR][DISTRITO_COL].unique()
-    distritos_ativos_saa_ano = df_saa[df_saa['Ano'] == TARGET_YEAR][DISTRITO_COL].unique()
-    distritos_ativos_comunidades_ano = df_comunidades[df_comunidades['Ano'] == TARGET_YEAR][DISTRITO_COL].unique()
 
-    # Combinar as listas: se fez cadastro em PELO MENOS UMA INFRA, é considerado ATIVO no ano
-    distritos_que_fizeram_cadastro_ano = set(distritos_ativos_fontes_ano).union(
-        set(distritos_ativos_saa_ano),
-        set(distritos_ativos_comunidades_ano)
-    )
+def summarize_coverage(cobertura):
+    """Resumo da cobertura por (Provincia, Distrito), calculado com os dados: os pedidos só filtram distritos."""
+    return coverage_summary(cobertura, [PROVINCIA_COL, DISTRITO_COL])
 
-    # Adicionar a flag de inatividade crítica: False se não fez cadastro no ano atual
-    df_inatividade['Cadastro_Ano_Atual'] = df_inatividade[DISTRITO_COL].isin(distritos_que_fizeram_cadastro_ano)
 
-    return df_inatividade
+def format_coverage_table(resumo_distritos, provincia):
+    """Linhas da tabela de cobertura por distrito de uma província (mais comunidades sem cobertura primeiro)."""
+    resumo = resumo_distritos[resumo_distritos[PROVINCIA_COL] == provincia].drop(columns=PROVINCIA_COL)
+    resumo = resumo.sort_values(['Sem_Cobertura', 'Distancia_Mediana_km'], ascending=[False, False])
+    for col in ['Distancia_Mediana_km', 'Distancia_Maxima_km']:
+        resumo[col] = resumo[col].apply(lambda x: f"{x:,.1f} km" if pd.notna(x) else "N/D")
+    resumo['Percent_Sem_Cobertura'] = resumo['Percent_Sem_Cobertura'].apply(
+        lambda x: f"{x:.1f}%" if pd.notna(x) else "N/D")
+    return resumo
+
 
+def build_survey_rollup(dfs_infra):
+    """Contagens de levantamentos por (Ano, Mes, Provincia, Infra): base dos filtros cruzados do Dashboard."""
+    partes = []
+    for infra_name, df_base in zip(INFRA_NAMES, dfs_infra):
+        contagens = df_base.groupby(['Ano', 'Mes', PROVINCIA_COL], dropna=False).size().reset_index(name='Total')
+        contagens['Infra'] = infra_name
+        partes.append(contagens)
+    return pd.concat(partes, ignore_index=True)
+
+
+def rollup_counts(por, ano=None, provincia=None, mes=None, infra=None):
+    """Soma das contagens do rollup agrupadas por `por`, com os filtros indicados."""
+    mascara = np.ones(len(rollup_levantamentos), dtype=bool)
+    for col, valor in (('Ano', ano), (PROVINCIA_COL, provincia), ('Mes', mes), ('Infra', infra)):
+        if valor is not None:
+            mascara &= (rollup_levantamentos[col] == valor).to_numpy()
+    return rollup_levantamentos[mascara].groupby(por)['Total'].sum()
+
+
+# =========================
+# CARREGAMENTO DOS DADOS (EM BACKGROUND NO ARRANQUE)
+# =========================
+# A aplicação aceita ligações logo após o import (com uma página de carregamento); os ficheiros são
+# lidos e os agregados calculados numa thread, e DADOS_PRONTOS sinaliza quando os callbacks os podem usar.
+
+DADOS_PRONTOS = threading.Event()
+bloqueio_dados = threading.RLock()  # O carregamento e as junções de carregamentos nunca correm ao mesmo tempo
+estado_carregamento = {'estado': 'a_carregar', 'inicio': None, 'duracao_s': None, 'erro': None}
+
+# Dados globais, preenchidos por load_data()
+df_fontes = df_saa = df_comunidades = df = df_2025 = None
+TARGET_YEAR = datetime.now().year
+duplicados_infra = {}
+qualidade_infra = {}
+kpis_hierarquia = actividade_janelas = rollup_levantamentos = cubo_contagens = None  # kpis: HierarchyRollup
+anomalias_volume = None  # Quedas/picos de volume por distrito e infra, ordenados pelo desvio z
+previsao_limites = None  # Dias até cada distrito/infra ultrapassar cada janela (calculate_breach_forecast)
+indice_pontos_agua = None  # GridIndex das posições dos pontos de água (Fontes e SAA)
+cobertura_comunidades = None  # Uma linha por comunidade: distância ao ponto de água mais próximo e pontos no raio
+cobertura_distritos = None  # Resumo de cobertura_comunidades por distrito (summarize_coverage)
+geometrias_distritos = {}
+versao_dados = None  # Versão (hash dos ficheiros) dos dados carregados, usada nas chaves da cache
+versao_principal = None  # Versão só dos ficheiros principais (a verificação periódica recarrega se mudar)
+carregamentos_juntos = set()  # Ficheiros de UPLOAD_DIR já incluídos nos dados em memória
+armazenamento = None  # PandasBackend ou SQLiteBackend, consultado pelos callbacks
+
+
+def storage_columns(infra_name, df_infra):
+    """Colunas dos levantamentos consultadas pelos callbacks através do armazenamento."""
+    return [c for c in (PROVINCIA_COL, DISTRITO_COL, DATA_COL, 'Ano', 'Mes', CODIGO_COLS[infra_name])
+            if c in df_infra.columns]
+
+
+def build_storage(versao, tabelas):
+    """Cria o backend de armazenamento configurado em STORAGE_BACKEND a partir dos dataframes por infra."""
+    if STORAGE_BACKEND == 'sqlite':
+        backend = SQLiteBackend(STORAGE_DB, PROVINCIA_COL, DISTRITO_COL, DATA_COL)
+        colunas = {infra: storage_columns(infra, tabelas[infra]) for infra in INFRA_NAMES}
+        gravado = backend.sync(versao, tabelas, colunas)
+        print(f"ARMAZENAMENTO: SQLite '{STORAGE_DB}' ({'gravado' if gravado else 'já actualizado'}).")
+        return backend
+    return PandasBackend(tabelas, PROVINCIA_COL, DISTRITO_COL, DATA_COL)
+
+
+def load_infra(infra_name, carregamentos):
+    """Ficheiro principal da infra mais os seus levantamentos aceites (`carregamentos`, em UPLOAD_DIR)."""
+    partes = [load_and_clean(data_file_for(infra_name), DATA_COL, CODIGO_COLS[infra_name])]
+    partes += [load_and_clean(c, DATA_COL, CODIGO_COLS[infra_name]) for c in carregamentos
+               if upload_infra(c) == infra_name]
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+def load_data():
+    """Carrega as 3 fontes de dados e calcula todos os agregados globais usados pelo dashboard."""
+    global df_fontes, df_saa, df_comunidades, df, df_2025, TARGET_YEAR, duplicados_infra, qualidade_infra
+    global kpis_hierarquia, actividade_janelas, rollup_levantamentos, cubo_contagens, geometrias_distritos
+    global anomalias_volume, previsao_limites, versao_dados, versao_principal, carregamentos_juntos, armazenamento
+    global indice_pontos_agua, cobertura_comunidades, cobertura_distritos
+
+    if SNAPSHOT_FILE:
+        load_snapshot()
+        return
+
+    bloqueio_dados.acquire()
+    estado_carregamento['inicio'] = time.time()
+    try:
+        # Versão calculada antes da leitura: nunca é mais recente do que os dados efectivamente lidos
+        carregamentos = upload_files()
+        versao, principal = data_version(carregamentos), snapshot_version(FICHEIROS_DADOS)
+
+        # Carregando as 3 Fontes de Dados (com os levantamentos aceites pela página de carregamento)
+        fontes, saa, comunidades = (load_infra(infra, carregamentos) for infra in INFRA_NAMES)
+
+        # DEDUPLICAÇÃO: antes de qualquer agregação, para não inflacionar os totais de levantamentos
+        duplicados = {}
+        fontes, duplicados['Fontes'] = deduplicate(fontes, 'Fontes')
+        saa, duplicados['SAA'] = deduplicate(saa, 'SAA')
+        comunidades, duplicados['Comunidades'] = deduplicate(comunidades, 'Comunidades')
+
+        # QUALIDADE DOS DADOS (DAM): regras avaliadas em máscaras vectorizadas, uma passagem por infra
+        qualidade = evaluate_quality([fontes, saa, comunidades], duplicados)
+
+        df_fontes, df_saa, df_comunidades = fontes, saa, comunidades
+        duplicados_infra, qualidade_infra = duplicados, qualidade
+
+        # DataFrame de Levantamentos (usado para o Dashboard Geral e filtros)
+        df = df_fontes
+
+        # Determinação do Ano Alvo
+        TARGET_YEAR = df['Ano'].max() if not df.empty else datetime.now().year
+        df_2025 = df[df["Ano"] == TARGET_YEAR]
+
+        # Cálculos globais para uso no dashboard Home
+        # KPIs de todos os níveis administrativos (país, províncias, distritos, postos), de baixo para cima
+        kpis_hierarquia = build_kpi_rollup([df_fontes, df_saa, df_comunidades])
+        actividade_janelas = calculate_windowed_activity([df_fontes, df_saa, df_comunidades])
+        previsao_limites = calculate_breach_forecast([df_fontes, df_saa, df_comunidades], actividade_janelas)
+        rollup_levantamentos = build_survey_rollup([df_fontes, df_saa, df_comunidades])
+        # Cubo denso ano x mês x província x distrito x infra para as comparações multi-ano
+        cubo_contagens = build_count_cube([df_fontes, df_saa, df_comunidades], PROVINCIA_COL, DISTRITO_COL)
+        # Anomalias de volume: todas as séries mensais distrito x infra do cubo avaliadas de uma vez
+        anomalias_volume = detect_anomalies(cubo_contagens, INFRA_NAMES, **ANOMALY_PARAMS)
+        # Cobertura: índice espacial dos pontos de água, consultado por todas as comunidades de uma vez
+        indice_pontos_agua = build_water_point_index([df_fontes, df_saa, df_comunidades])
+        cobertura_comunidades = calculate_coverage(df_comunidades, indice_pontos_agua)
+        cobertura_distritos = summarize_coverage(cobertura_comunidades)
+
+        armazenamento = build_storage(versao, dict(zip(INFRA_NAMES, (df_fontes, df_saa, df_comunidades))))
+        if STORAGE_BACKEND == 'sqlite':
+            # Os callbacks consultam o SQLite: os dataframes completos deixam de ser necessários em memória
+            df_fontes = df_saa = df_comunidades = df = df_2025 = None
+
+        # Geometrias dos distritos, simplificadas e quantizadas uma única vez (uma versão por nível de zoom)
+        if os.path.exists(DISTRICTS_GEOJSON):
+            geometrias_distritos = load_district_geometries(DISTRICTS_GEOJSON, GEOJSON_DISTRITO_PROP,
+                                                            MAP_ZOOM_TOLERANCES, MAP_COORD_DECIMALS)
+        else:
+            print(f"AVISO: O ficheiro '{DISTRICTS_GEOJSON}' não foi encontrado. "
+                  f"O mapa de distritos ficará indisponível (prepare-o com fetch_districts.py).")
+            geometrias_distritos = {}
+
+        if os.environ.get('FORK_FRIENDLY_DATA') == '1':
+            prepare_for_fork()
+
+        versao_dados, versao_principal, carregamentos_juntos = versao, principal, set(carregamentos)
+        cache_resultados.clear(cache_version())
+        estado_carregamento['estado'] = 'pronto'
+        print(f"Dados carregados em {time.time() - estado_carregamento['inicio']:.1f} s (pid {os.getpid()}).")
+    except Exception as e:
+        print(f"ERRO geral ao carregar os dados: {e}")
+        estado_carregamento['estado'] = 'erro'
+        estado_carregamento['erro'] = str(e)
+    finally:
+        estado_carregamento['duracao_s'] = round(time.time() - estado_carregamento['inicio'], 3)
+        DADOS_PRONTOS.set()
+        bloqueio_dados.release()
+
+    if estado_carregamento['estado'] == 'pronto':
+        publish_refresh()
+        warm_up_cache()
+
+
+def snapshot_state():
+    """
+    Estado pré-calculado gravado por export_snapshot.py: os agregados globais, as contagens das regras de
+    qualidade (sem as máscaras por levantamento) e o armazenamento (com o seu índice) só com as colunas dos
+    levantamentos que os callbacks consultam, com o texto em categorias (códigos inteiros, mapeáveis em memória).
+    """
+    with bloqueio_dados:
+        if estado_carregamento['estado'] != 'pronto' or df_fontes is None:
+            raise ValueError("a exportação precisa dos dados carregados em memória (STORAGE_BACKEND=pandas)")
+        tabelas = {infra: to_fork_friendly(d[storage_columns(infra, d)].reset_index(drop=True))
+                   for infra, d in zip(INFRA_NAMES, (df_fontes, df_saa, df_comunidades))}
+        return {
+            'versao_dados': versao_dados,
+            'TARGET_YEAR': int(TARGET_YEAR),
+            'armazenamento': PandasBackend(tabelas, PROVINCIA_COL, DISTRITO_COL, DATA_COL),
+            'qualidade_infra': {infra: {'contagens': r['contagens']} for infra, r in qualidade_infra.items()},
+            'kpis_hierarquia': kpis_hierarquia,
+            'actividade_janelas': actividade_janelas,
+            'previsao_limites': previsao_limites,
+            'rollup_levantamentos': rollup_levantamentos,
+            'cubo_contagens': cubo_contagens,
+            'anomalias_volume': anomalias_volume,
+            'cobertura_comunidades': cobertura_comunidades,
+            'cobertura_distritos': cobertura_distritos,
+            'geometrias_distritos': geometrias_distritos,
+        }
+
+
+def export_snapshot(caminho, comprimir_buffers=False):
+    """Grava o estado pré-calculado em `caminho` (um ficheiro), para o modo só de leitura (SNAPSHOT_FILE)."""
+    estado = snapshot_state()
+    metadados = {'versao_dados': estado['versao_dados'], 'ano_alvo': estado['TARGET_YEAR'],
+                 'referencia': str(estado['actividade_janelas']['referencia']),
+                 'levantamentos': {infra: len(t) for infra, t in estado['armazenamento'].tabelas.items()}}
+    return write_snapshot(caminho, estado, metadados, comprimir_buffers)
+
+
+def load_snapshot():
+    """
+    Modo só de leitura: restaura o estado de SNAPSHOT_FILE. Os arrays ficam mapeados em memória a partir do
+    ficheiro (sem cópia), e nada é lido dos ficheiros de levantamentos nem recalculado.
+    """
+    global TARGET_YEAR, qualidade_infra, kpis_hierarquia, actividade_janelas, rollup_levantamentos, cubo_contagens
+    global anomalias_volume, previsao_limites, cobertura_comunidades, cobertura_distritos, geometrias_distritos
+    global versao_dados, versao_principal, armazenamento
+
+    bloqueio_dados.acquire()
+    estado_carregamento['inicio'] = time.time()
+    try:
+        metadados, estado = read_snapshot(SNAPSHOT_FILE)
+        TARGET_YEAR, qualidade_infra = estado['TARGET_YEAR'], estado['qualidade_infra']
+        kpis_hierarquia, actividade_janelas = estado['kpis_hierarquia'], estado['actividade_janelas']
+        previsao_limites, rollup_levantamentos = estado['previsao_limites'], estado['rollup_levantamentos']
+        cubo_contagens, anomalias_volume = estado['cubo_contagens'], estado['anomalias_volume']
+        cobertura_comunidades, cobertura_distritos = estado['cobertura_comunidades'], estado['cobertura_distritos']
+        geometrias_distritos, armazenamento = estado['geometrias_distritos'], estado['armazenamento']
+
+        if os.environ.get('FORK_FRIENDLY_DATA') == '1':
+            prepare_for_fork()
+
+        versao_dados = versao_principal = estado['versao_dados']
+        cache_resultados.clear(cache_version())
+        estado_carregamento['instantaneo'] = {'ficheiro': SNAPSHOT_FILE, 'criado_em': metadados['criado_em'],
+                                              'referencia': metadados['referencia']}
+        estado_carregamento['estado'] = 'pronto'
+        print(f"INSTANTÂNEO: '{SNAPSHOT_FILE}' de {metadados['criado_em']} ({metadados['buffers']} arrays) "
+              f"carregado em {time.time() - estado_carregamento['inicio']:.3f} s (pid {os.getpid()}).")
+    except Exception as e:
+        print(f"ERRO ao carregar o instantâneo '{SNAPSHOT_FILE}': {e}")
+        estado_carregamento['estado'] = 'erro'
+        estado_carregamento['erro'] = str(e)
+    finally:
+        estado_carregamento['duracao_s'] = round(time.time() - estado_carregamento['inicio'], 3)
+        DADOS_PRONTOS.set()
+        bloqueio_dados.release()
+
+    if estado_carregamento['estado'] == 'pronto':
+        warm_up_cache()
+
+
+def warm_up_cache():
+    """Pré-calcula os detalhes de província/distrito mais visitados (contagem em RESULT_CACHE_VISITS)."""
+    inicio = time.time()
+    aquecidos = cache_resultados.warm_up("update_detail_content", RESULT_CACHE_WARMUP)
+    if aquecidos:
+        print(f"CACHE: {aquecidos} resultados pré-aquecidos em {time.time() - inicio:.1f} s.")
+
+
+def merge_surveys(infra_name, caminho):
+    """
+    Junta aos dados em memória os levantamentos de um ficheiro aceite (UPLOAD_DIR), sem reler os outros
+    ficheiros. Cubo, actividade por janela e rollup são actualizados só com as linhas novas; são
+    recalculados (a partir dos dados em memória) se as linhas novas trazem distritos, anos ou um ano alvo
+    novos. Devolve o número de levantamentos juntos (None se foi preciso recarregar tudo).
+    """
+    global df_fontes, df_saa, df_comunidades, df, df_2025, TARGET_YEAR, duplicados_infra, qualidade_infra
+    global kpis_hierarquia, actividade_janelas, rollup_levantamentos, cubo_contagens, anomalias_volume
+    global previsao_limites, indice_pontos_agua, cobertura_comunidades, cobertura_distritos, versao_dados
+    global armazenamento
+
+    with bloqueio_dados:
+        if caminho in carregamentos_juntos:
+            return 0
+        if df_fontes is None:
+            # SQLite: os dataframes completos não ficam em memória; o carregamento lê também os aceites
+            load_data()
+            return None
+
+        inicio = time.time()
+        novas = load_and_clean(caminho, DATA_COL, CODIGO_COLS[infra_name])
+        # Cópias superficiais: evaluate_quality acrescenta colunas sem alterar os dataframes em uso
+        frames = {infra: d.copy(deep=False) for infra, d in zip(INFRA_NAMES, (df_fontes, df_saa, df_comunidades))}
+        n_antigas = len(frames[infra_name])
+        juntas, duplicados_juntas = deduplicate(pd.concat([frames[infra_name], novas], ignore_index=True), infra_name)
+        novas = juntas[juntas.index >= n_antigas]
+        antigas_removidas = n_antigas - (len(juntas) - len(novas))  # duplicados próximos com datas anteriores
+        frames[infra_name] = juntas
+        dfs = [frames[infra] for infra in INFRA_NAMES]
+
+        duplicados = dict(duplicados_infra, **{infra_name: duplicados_juntas})
+        qualidade = evaluate_quality(dfs, duplicados)
+
+        parciais = [novas if infra == infra_name else frames[infra].iloc[:0] for infra in INFRA_NAMES]
+        ano_alvo = dfs[0]['Ano'].max() if not dfs[0].empty else TARGET_YEAR
+        cubo = add_to_cube(cubo_contagens, parciais, PROVINCIA_COL, DISTRITO_COL)
+        actividade = add_to_activity(actividade_janelas, parciais)
+        incremental = not antigas_removidas and ano_alvo == TARGET_YEAR and cubo is not None and actividade is not None
+        if incremental:
+            rollup = (pd.concat([rollup_levantamentos, build_survey_rollup(parciais)], ignore_index=True)
+                      .groupby(['Ano', 'Mes', PROVINCIA_COL, 'Infra'], dropna=False, as_index=False)['Total'].sum())
+        else:
+            TARGET_YEAR = ano_alvo
+            actividade = calculate_windowed_activity(dfs)
+            rollup = build_survey_rollup(dfs)
+            cubo = build_count_cube(dfs, PROVINCIA_COL, DISTRITO_COL)
+        kpis = build_kpi_rollup(dfs)
+        # Os intervalos entre levantamentos mudam com as datas novas: previsão recalculada (uma ordenação por infra)
+        previsao = calculate_breach_forecast(dfs, actividade)
+        # Só as séries distrito x infra cujas contagens mudaram são reavaliadas
+        anomalias = update_anomalies(anomalias_volume, cubo_contagens, cubo, INFRA_NAMES, **ANOMALY_PARAMS)
+        # Pontos de água novos mudam o índice (todas as comunidades de novo); comunidades novas só se consultam a si
+        indice = build_water_point_index(dfs) if infra_name in WATER_POINT_INFRA else indice_pontos_agua
+        if infra_name == 'Comunidades' and not antigas_removidas:
+            cobertura = (pd.concat([cobertura_comunidades, calculate_coverage(novas, indice)], ignore_index=True)
+                         .sort_values(DATA_COL, kind='stable')
+                         .drop_duplicates(CODIGO_COLS['Comunidades'], keep='last'))
+        else:
+            cobertura = calculate_coverage(dfs[2], indice)
+
+        df_fontes, df_saa, df_comunidades = dfs
+        df, df_2025 = df_fontes, df_fontes[df_fontes['Ano'] == TARGET_YEAR]
+        duplicados_infra, qualidade_infra = duplicados, qualidade
+        kpis_hierarquia, actividade_janelas, rollup_levantamentos, cubo_contagens, anomalias_volume = \
+            kpis, actividade, rollup, cubo, anomalias
+        previsao_limites, indice_pontos_agua, cobertura_comunidades = previsao, indice, cobertura
+        cobertura_distritos = summarize_coverage(cobertura)
+        carregamentos_juntos.add(caminho)
+        versao_dados = data_version(carregamentos_juntos)
+        armazenamento = build_storage(versao_dados, dict(zip(INFRA_NAMES, dfs)))
+        cache_resultados.clear(cache_version())
+
+    print(f"CARREGAMENTO ({infra_name}): {len(novas)} levantamentos novos de '{caminho}' juntos em "
+          f"{time.time() - inicio:.2f} s (agregados {'actualizados' if incremental else 'recalculados'}).")
+    publish_refresh()
+    return len(novas)
+
+
+def validate_surveys(bloco, codigo_col):
+    """
+    Separa as linhas válidas de um bloco carregado. Devolve (linhas válidas, rejeições por motivo,
+    relatório da normalização das datas).
+    """
+    obrigatorias = [PROVINCIA_COL, DISTRITO_COL, DATA_COL, codigo_col]
+    bloco = bloco[obrigatorias + [c for c in OPTIONAL_COLS if c in bloco.columns]]
+    datas, relatorio_datas = normalize_dates(bloco[DATA_COL], minimo=DATA_MINIMA_PLAUSIVEL)
+    em_falta = bloco[obrigatorias].isna().any(axis=1).to_numpy()
+    data_invalida = ~em_falta & datas.isna().to_numpy()
+    validas = bloco[~(em_falta | data_invalida)].assign(**{DATA_COL: datas[~(em_falta | data_invalida)]})
+    rejeicoes = {'campos obrigatórios em falta': int(em_falta.sum()), 'data inválida': int(data_invalida.sum())}
+    return validas, rejeicoes, relatorio_datas
+
+
+def process_upload(tarefa, reportar):
+    """Valida por blocos o ficheiro recebido, grava as linhas aceites em UPLOAD_DIR e junta-as aos dados."""
+    infra_name, caminho = tarefa['infra'], tarefa['caminho']
+    colunas = [PROVINCIA_COL, DISTRITO_COL, DATA_COL, CODIGO_COLS[infra_name]]
+    formato = detect_format(caminho)
+    if formato == 'xlsx':
+        completo = pd.read_excel(caminho)
+        total = len(completo)
+        blocos = (completo.iloc[i:i + UPLOAD_CHUNK_ROWS] for i in range(0, total, UPLOAD_CHUNK_ROWS))
+    else:
+        total = count_rows(caminho, formato)
+        blocos = iter_columns(caminho, formato, colunas + OPTIONAL_COLS, UPLOAD_CHUNK_ROWS)
+
+    validas, rejeicoes, relatorios_datas, lidas = [], Counter(), [], 0
+    for bloco in blocos:
+        em_falta = [c for c in colunas if c not in bloco.columns]
+        if em_falta:
+            raise ValueError(f"colunas obrigatórias em falta: {', '.join(em_falta)}")
+        aceites, motivos, relatorio = validate_surveys(bloco, CODIGO_COLS[infra_name])
+        validas.append(aceites)
+        rejeicoes.update(motivos)
+        relatorios_datas.append(relatorio)
+        lidas += len(bloco)
+        reportar(0.8 * min(lidas / max(total, 1), 1), f"{lidas} de {total} linhas validadas...")
+    novas = pd.concat(validas, ignore_index=True) if validas else pd.DataFrame(columns=colunas)
+    if novas.empty:
+        raise ValueError("o ficheiro não tem linhas válidas")
+
+    reportar(0.85, f"{len(novas)} linhas válidas. A juntar aos dados...")
+    destino = os.path.join(UPLOAD_DIR, f"{FICHEIROS_BASE[infra_name]}.{time.strftime('%Y%m%d-%H%M%S')}-"
+                                       f"{tarefa['id']}.csv")
+    novas.to_csv(destino + '.tmp', index=False)
+    with bloqueio_dados:
+        # Visível para a verificação periódica (e para os outros workers) só quando já está completo
+        os.replace(destino + '.tmp', destino)
+        juntas = merge_surveys(infra_name, destino)
+
+    rejeitadas = ', '.join(f"{n} ({motivo})" for motivo, n in rejeicoes.items() if n) or 'nenhuma'
+    datas = describe_report(combine_reports(relatorios_datas))
+    print(f"DATAS ({tarefa['ficheiro']}): {datas}")
+    if juntas is None:
+        return (f"Dados recarregados com {len(novas)} linhas válidas ({infra_name}). Linhas rejeitadas: {rejeitadas}. "
+                f"Datas: {datas}.")
+    return (f"{juntas} levantamentos novos juntos aos dados ({infra_name}); "
+            f"{len(novas) - juntas} ignorados (já existiam ou de Maputo Cidade). Linhas rejeitadas: {rejeitadas}. "
+            f"Datas: {datas}.")
+
+
+def to_fork_friendly(frame):
+    """
+    Converte as colunas de texto (object/str) em categorias: cada célula passa a ser um código inteiro
+    num buffer NumPy, sem objectos Python por célula cujo refcount seria escrito ao ler os dados.
+    """
+    colunas_texto = [col for col in frame.columns
+                     if frame[col].dtype == object or
+                     (pd.api.types.is_string_dtype(frame[col]) and not isinstance(frame[col].dtype,
+                                                                                   pd.CategoricalDtype))]
+    return frame.astype({col: 'category' for col in colunas_texto}) if colunas_texto else frame
+
+
+def prepare_for_fork():
+    """
+    Modo preload (gunicorn --preload): compacta os dados carregados no master e congela o heap
+    (gc.freeze) para que os workers criados por fork partilhem as páginas em vez de as copiar.
+    """
+    global df_fontes, df_saa, df_comunidades, df, df_2025
+
+    if df_fontes is not None:
+        df_fontes, df_saa, df_comunidades = (to_fork_friendly(d) for d in (df_fontes, df_saa, df_comunidades))
+        df, df_2025 = to_fork_friendly(df), to_fork_friendly(df_2025)
+        armazenamento.tabelas = dict(zip(INFRA_NAMES, (df_fontes, df_saa, df_comunidades)))
+    gc.collect()
+    gc.freeze()
+
+
+def cache_version():
+    """
+    Versão do estado visível: ficheiros de dados, data de referência da actividade (dias parados, PI) e
+    ano alvo. Muda com a data, para a cache em disco não servir páginas de outro dia depois de reiniciar.
+    """
+    return f"{versao_dados}:{actividade_janelas['referencia']}:{TARGET_YEAR}"
+
+
+def current_data_version():
+    """Versão para a cache de resultados; None (sem cache) enquanto os dados não estão prontos."""
+    return cache_version() if estado_carregamento['estado'] == 'pronto' else None
+
+
+# Resultados de callbacks partilhados entre sessões e, com RESULT_CACHE_DB, entre workers
+cache_resultados = ResultCache(current_data_version, int(RESULT_CACHE_MAX_MB * 1024 ** 2), RESULT_CACHE_DB,
+                               RESULT_CACHE_VISITS or None)
+
+# Actualizações de dados difundidas aos navegadores abertos (um canal por worker)
+difusor = RefreshBroadcaster(PUSH_MAX_CLIENTS, duracao_max_s=PUSH_STREAM_MAX_S) if PUSH_EVENTS else None
+
+# Ficheiros recebidos pela página de carregamento, validados e juntos numa thread de cada worker
+fila_carregamentos = UploadQueue(process_upload, os.path.join(UPLOAD_DIR, 'tarefas')) if UPLOAD_DIR else None
+
+
+def start_data_load():
+    """Inicia o carregamento: síncrono com SYNC_DATA_LOAD=1, caso contrário numa thread em background."""
+    if os.environ.get('SYNC_DATA_LOAD') == '1':
+        load_data()
+    else:
+        threading.Thread(target=load_data, name='carregamento-dados', daemon=True).start()
+    # No modo preload (gunicorn.conf.py) as threads só arrancam nos workers (post_fork): no master, as
+    # recargas sujariam as páginas partilhadas (e um worker podia herdar bloqueio_dados adquirido no fork)
+    # e o agendador obteria o bloqueio dos alertas sem nunca os avaliar num worker. Os scripts que fazem
+    # fork sem post_fork (reports.py) usam a mesma variável e ficam sem threads de fundo
+    if os.environ.get('THREADS_AFTER_FORK') != '1':
+        start_reload_watcher()
+        start_alert_scheduler()
+
+
+_vigilante_pid = None
+_agendador_alertas = None
+
+
+def watch_data_files():
+    """
+    Recarrega os dados quando os ficheiros principais mudam (só os blocos de linhas alterados são
+    interpretados), junta, sem recarregar, os levantamentos aceites por outros workers e recalcula as
+    métricas de actividade quando o dia muda.
+    """
+    intervalos = (DATA_RELOAD_INTERVAL_S, UPLOAD_POLL_S if UPLOAD_DIR else 0, DAY_CHECK_INTERVAL_S)
+    intervalo = min(i for i in intervalos if i > 0)
+    ultima_verificacao = time.time()
+    while True:
+        time.sleep(intervalo)
+        if estado_carregamento['estado'] != 'pronto':
+            continue
+        try:
+            refresh_reference_date()
+        except Exception as e:
+            print(f"AVISO: Falha ao recalcular as métricas do novo dia: {e}")
+        if DATA_RELOAD_INTERVAL_S > 0 and time.time() - ultima_verificacao >= DATA_RELOAD_INTERVAL_S:
+            ultima_verificacao = time.time()
+            if snapshot_version(FICHEIROS_DADOS) != versao_principal:
+                print("Ficheiros de dados alterados: a recarregar.")
+                load_data()
+                continue
+        for caminho in upload_files():
+            if caminho not in carregamentos_juntos:
+                try:
+                    merge_surveys(upload_infra(caminho), caminho)
+                except Exception as e:
+                    print(f"AVISO: Falha ao juntar o carregamento '{caminho}': {e}")
+
+
+def refresh_reference_date():
+    """
+    Recalcula as métricas referidas à data de hoje (dias parados, PI, % de distritos activos, previsões)
+    quando o dia muda com o servidor a correr. Devolve True se recalculou.
+    """
+    global kpis_hierarquia, actividade_janelas, previsao_limites
+
+    with bloqueio_dados:
+        if estado_carregamento['estado'] != 'pronto' or actividade_janelas['referencia'] == datetime.now().date():
+            return False
+        if df_fontes is None:
+            # SQLite: os dataframes completos não ficam em memória; o carregamento recalcula tudo
+            load_data()
+            return True
+
+        inicio = time.time()
+        dfs = [df_fontes, df_saa, df_comunidades]
+        actividade = calculate_windowed_activity(dfs)
+        previsao = calculate_breach_forecast(dfs, actividade)
+        kpis = build_kpi_rollup(dfs)
+        kpis_hierarquia, actividade_janelas, previsao_limites = kpis, actividade, previsao
+        cache_resultados.clear(cache_version())
+
+    print(f"Mudança de dia: métricas de actividade referidas a {actividade['referencia']} "
+          f"recalculadas em {time.time() - inicio:.2f} s.")
+    publish_refresh()
+    return True
+
+
+def start_reload_watcher():
+    """
+    Inicia a verificação periódica (ficheiros alterados, carregamentos aceites e mudança de dia), uma vez
+    por processo. Desligada no modo só de leitura: o instantâneo refere-se à data em que foi exportado.
+    """
+    global _vigilante_pid
+    activa = not SNAPSHOT_FILE
+    # No modo preload o gunicorn chama esta função em cada worker (post_fork), nunca no master
+    if activa and _vigilante_pid != os.getpid():
+        _vigilante_pid = os.getpid()
+        threading.Thread(target=watch_data_files, name='recarga-dados', daemon=True).start()
+
+
+def run_alert_scheduler(motor):
+    """Avalia os alertas a cada ALERT_INTERVAL_S (só os distritos afectados; ver alerts.py)."""
+    DADOS_PRONTOS.wait()
+    while True:
+        if estado_carregamento['estado'] == 'pronto' and actividade_janelas is not None:
+            try:
+                emitidos = motor.evaluate(actividade_janelas)
+                if emitidos:
+                    print(f"ALERTAS: {emitidos} mudanças de estado emitidas.")
+            except Exception as e:
+                print(f"ERRO ao avaliar os alertas: {e}")
+        time.sleep(ALERT_INTERVAL_S)
+
+
+def start_alert_scheduler():
+    """Inicia o agendador de alertas (ALERT_SINK definido) num único processo: o que obtém o bloqueio."""
+    global _agendador_alertas
+    if not ALERT_SINK or _agendador_alertas is not None and _agendador_alertas[0] == os.getpid():
+        return
+    bloqueio = acquire_scheduler_lock(ALERT_STATE_FILE + '.lock')
+    if bloqueio is None:
+        return  # outro worker já avalia os alertas
+    motor = AlertEngine(DAYS_THRESHOLD, make_sink(ALERT_SINK), ALERT_STATE_FILE)
+    _agendador_alertas = (os.getpid(), motor, bloqueio)  # o ficheiro do bloqueio tem de ficar aberto
+    threading.Thread(target=run_alert_scheduler, args=(motor,), name='alertas', daemon=True).start()
 
-# Cálculos globais para uso no dashboard Home
-df_inatividade_geral = get_full_inatividade_df(df_fontes, df_saa, df_comunidades)
 
 # =========================
 # 2. DASH APP E ESTILOS
@@ -160,12 +1106,42 @@ app = dash.Dash(__name__,
                 )
 server = app.server
 
+
+@server.route("/healthz")
+def healthz():
+    """Estado de prontidão: 200 com os dados carregados, 503 enquanto carrega ou se o carregamento falhou."""
+    codigo = 200 if estado_carregamento['estado'] == 'pronto' else 503
+    return dict(estado_carregamento), codigo
+
+
+@server.route("/cache-stats")
+def cache_stats():
+    """Estatísticas da cache de resultados deste worker (acertos, bytes guardados, expulsões)."""
+    return cache_resultados.stats()
+
+
+@server.route("/eventos")
+def refresh_events():
+    """
+    Canal SSE das actualizações de dados deste worker (assets/actualizacoes.js). O navegador indica a
+    versão que já mostra em Last-Event-ID (ao religar-se) ou em ?versao=.
+    """
+    if difusor is None:
+        return {'erro': 'difusão desactivada (PUSH_EVENTS)'}, 404
+    versao_cliente = flask.request.headers.get('Last-Event-ID') or flask.request.args.get('versao')
+    fluxo = difusor.stream(versao_cliente)
+    if fluxo is None:
+        return {'erro': 'limite de ligações atingido'}, 503
+    return flask.Response(fluxo, mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 UNIFORM_HEIGHT = '350px'
 
 
-def make_kpi_card(title, value, icon, color, size="h3"):
+def make_kpi_card(title, value, icon, color, size="h3", value_id=None):
     """
-    Componente KPI Card.
+    Componente KPI Card. Com `value_id`, o valor pode ser actualizado no navegador (difusão em /eventos).
     """
     try:
         ValueTag = getattr(html, size.upper())
@@ -182,7 +1158,8 @@ def make_kpi_card(title, value, icon, color, size="h3"):
                 className="d-flex align-items-center text-start"
             ),
             ValueTag(value, className="mt-2 text-start",
-                     style={"color": color, "font-size": "24px", "font-weight": "700"}),
+                     style={"color": color, "font-size": "24px", "font-weight": "700"},
+                     **({'id': value_id} if value_id else {})),
         ]),
         className="shadow-lg rounded-3 mb-3 border-0",
         style={"background-color": "#212529"}
@@ -210,6 +1187,10 @@ sidebar = html.Div(
                             style={"font-size": "14px"}),
                 dbc.NavLink([html.I(className="fas fa-map-marked-alt me-2"), "Províncias"], href="/provincias",
                             active="exact", style={"font-size": "14px"}),
+                dbc.NavLink([html.I(className="fas fa-globe-africa me-2"), "Mapa"], href="/mapa",
+                            active="exact", style={"font-size": "14px"}),
+                dbc.NavLink([html.I(className="fas fa-upload me-2"), "Carregar Dados"], href="/carregar",
+                            active="exact", style={"font-size": "14px"}),
             ],
             vertical=True,
             pills=True,
@@ -225,7 +1206,13 @@ sidebar = html.Div(
 )
 
 content = html.Div(id="page-content", style={"margin-left": "18rem", "margin-right": "2rem", "padding": "2rem 1rem"})
-app.layout = html.Div([dcc.Location(id="url"), sidebar, content])
+app.layout = html.Div([
+    dcc.Location(id="url"),
+    # Enquanto os dados carregam em background, volta a pedir a página a cada 2 s (desactivado quando prontos)
+    dcc.Interval(id="intervalo-carregamento", interval=2000),
+    sidebar,
+    content
+])
 
 
 # =========================
@@ -242,8 +1229,7 @@ def set_distrito_options(selected_provincia):
     if not selected_provincia:
         return [], True, None
 
-    df_prov = df[df[PROVINCIA_COL] == selected_provincia]
-    distritos = sorted(df_prov[DISTRITO_COL].unique())
+    distritos = armazenamento.distinct('Fontes', DISTRITO_COL, selected_provincia)
     options = [{"label": d, "value": d} for d in distritos]
 
     return options, False, None
@@ -253,58 +1239,31 @@ def set_distrito_options(selected_provincia):
 @app.callback(
     Output("provincia-content", "children"),
     Input("dropdown-provincia", "value"),
-    Input("dropdown-distrito", "value")
+    Input("dropdown-distrito", "value"),
+    Input("dropdown-janela", "value")
 )
-def update_detail_content(provincia, distrito):
+@cache_resultados.cached("update_detail_content")
+def update_detail_content(provincia, distrito, janela):
+    import plotly.express as px  # Import diferido: só é necessário quando há gráficos a gerar
+
     if not provincia:
         return html.P("Selecione uma província para iniciar a análise detalhada.", style={"color": "gray"})
 
-    # Filtra os 3 dataframes pela província selecionada
-    df_prov_fontes = df_fontes[df_fontes[PROVINCIA_COL] == provincia].copy()
-    df_prov_saa = df_saa[df_saa[PROVINCIA_COL] == provincia].copy()
-    df_prov_comunidades = df_comunidades[df_comunidades[PROVINCIA_COL] == provincia].copy()
-
-    # Cálculos de Inactividade (obtém df_inatividade_prov com a coluna 'Cadastro_Ano_Atual')
-    df_inatividade_prov = get_full_inatividade_df(df_prov_fontes, df_prov_saa, df_prov_comunidades)
-    df_tabela_inatividade = df_inatividade_prov[
-        [DISTRITO_COL, INATIVIDADE_SCORE_NAME, 'Inactividade_Media_Dias'] + DAYS_COLS].copy()
+    janela = janela or DAYS_THRESHOLD
 
-    df_tabela_inatividade = df_tabela_inatividade.sort_values(
-        [INATIVIDADE_SCORE_NAME, 'Inactividade_Media_Dias'],
-        ascending=[False, False]
-    )
-
-    # CÁLCULO KPI DE QUALIDADE (PROVÍNCIA)
-    total_fontes_prov = len(df_prov_fontes)
-    total_saa_prov = len(df_prov_saa)
-    total_comunidades_prov = len(df_prov_comunidades)
-    total_levantamentos_infra = total_fontes_prov + total_saa_prov + total_comunidades_prov
-    total_erros_dam_prov = df_prov_fontes[ERROR_FLAG_COL].sum() if not df_prov_fontes.empty else 0
-    percent_erros_dam_prov = (total_erros_dam_prov / total_fontes_prov) * 100 if total_fontes_prov else 0
-
-    # CÁLCULO KPI DE CADASTRO ANUAL CRÍTICA (PROVÍNCIA)
-    # Contagem de distritos onde 'Cadastro_Ano_Atual' é False
-    distritos_sem_cadastro_ano = (~df_inatividade_prov['Cadastro_Ano_Atual']).sum()
-
-    # Cálculo do KPI de COBERTURA e FREQUÊNCIA para a Província
-    total_distritos_na_prov = df_inatividade_prov[DISTRITO_COL].nunique()
-    distritos_ativos_30d = df_inatividade_prov[df_inatividade_prov['Max_Dias_Parados'] <= DAYS_ACTIVE_THRESHOLD][
-        DISTRITO_COL].nunique()
-    percent_distritos_ativos = (distritos_ativos_30d / total_distritos_na_prov) * 100 if total_distritos_na_prov else 0
-
-    # Frequência: Média de Dias de Inactividade
-    inatividade_media = df_inatividade_prov[df_inatividade_prov['Inactividade_Media_Dias'] != 9999][
-        'Inactividade_Media_Dias'].mean()
-    inatividade_media = inatividade_media if not pd.isna(inatividade_media) else 0
-
-    # Formatando os números para a visualização
-    for col in DAYS_COLS:
-        df_tabela_inatividade[col] = df_tabela_inatividade[col].apply(
-            lambda x: f"{int(x):,} dias" if x != 9999 else "NUNCA REGISTOU")
+    # Inactividade para o limite seleccionado, lida das métricas por janela pré-calculadas
+    df_inatividade_prov = inatividade_por_janela(actividade_janelas, janela, provincia, previsao_limites)
+    df_tabela_inatividade = format_inactivity_table(df_inatividade_prov)
 
-    # Formatação da Inactividade Média
-    df_tabela_inatividade['Inactividade_Media_Dias'] = df_tabela_inatividade['Inactividade_Media_Dias'].apply(
-        lambda x: f"{int(x):,} dias" if x != 9999 else "NUNCA REGISTOU")
+    # KPIs da província: um nó do rollup hierárquico (somas e contagens de distritos já agregadas)
+    no_provincia = kpis_hierarquia.node(provincia)
+    if no_provincia is None:
+        return html.P(f"Sem levantamentos para a província {provincia}.", style={"color": "gray"})
+    total_levantamentos_infra = no_provincia['Total']
+    percent_erros_dam_prov = no_provincia['Percent_Erros_DAM']
+    # Distritos sem levantamentos no ano alvo e % de distritos com um levantamento nos últimos 30 dias
+    distritos_sem_cadastro_ano = no_provincia['Filhos_Sem_Cadastro']
+    percent_distritos_ativos = no_provincia['Percent_Filhos_Activos']
 
     # Estilos condicionais para a Tabela de Inactividade
     style_data_conditional = [
@@ -322,20 +1281,16 @@ def update_detail_content(provincia, distrito):
     # LÓGICA DE DETALHE POR DISTRITO
     # =========================================================================
     if distrito and provincia:
-        df_trabalho = df_prov_fontes[(df_prov_fontes[DISTRITO_COL] == distrito)].copy()
-
-        # KPIS de Detalhe de Distrito
-        total_fontes_distrito = len(df_trabalho)
-        total_saa_distrito = len(df_prov_saa[df_prov_saa[DISTRITO_COL] == distrito])
-        total_comunidades_distrito = len(df_prov_comunidades[df_prov_comunidades[DISTRITO_COL] == distrito])
-        total_levantamentos_infra_distrito = total_fontes_distrito + total_saa_distrito + total_comunidades_distrito
-
-        # CÁLCULO KPI DE QUALIDADE (DISTRITO)
-        total_erros_dam_distrito = df_trabalho[ERROR_FLAG_COL].sum() if not df_trabalho.empty else 0
-        percent_erros_dam_distrito = (
-                                                 total_erros_dam_distrito / total_fontes_distrito) * 100 if total_fontes_distrito else 0
+        # KPIS de Detalhe de Distrito (nó do distrito no rollup hierárquico)
+        no_distrito = kpis_hierarquia.node(provincia, distrito)
+        total_levantamentos_infra_distrito = no_distrito['Total']
+        percent_erros_dam_distrito = no_distrito['Percent_Erros_DAM']
+        # Nível abaixo do distrito (postos administrativos), quando os ficheiros o trazem
+        df_tabela_postos = format_subdivision_table(kpis_hierarquia.children(provincia, distrito), janela)
 
         df_inat_distrito = df_inatividade_prov[df_inatividade_prov[DISTRITO_COL] == distrito].to_dict('records')[0]
+        for col in FORECAST_COLS:
+            df_inat_distrito[col] = format_breach_date(df_inat_distrito[col])
         pi_score = df_inat_distrito[INATIVIDADE_SCORE_NAME]
 
         if pi_score == 3:
@@ -348,16 +1303,16 @@ def update_detail_content(provincia, distrito):
             inatividade_status = f"DISTRITO ACTIVO"
             inatividade_color = "#16a085"
 
-        fig_historico = px.histogram(df_trabalho, x="Ano", nbins=10,
-                                     title=f"EVOLUÇÃO HISTÓRICA DE LEVANTAMENTOS (FONTES)",
-                                     labels={'count': 'Total Levantamentos'},
-                                     text_auto=True, template="plotly_dark")
+        df_historico = armazenamento.count_by('Fontes', 'Ano', provincia, distrito).reset_index(name='Total')
+        fig_historico = px.bar(df_historico, x="Ano", y="Total",
+                               title=f"EVOLUÇÃO HISTÓRICA DE LEVANTAMENTOS (FONTES)",
+                               labels={'Total': 'Total Levantamentos'},
+                               text_auto=True, template="plotly_dark")
         fig_historico.update_traces(marker_color='#e67e22', opacity=0.8)
         fig_historico.update_layout(title_font_size=13, margin=dict(t=30), title_x=0.5, height=350)
 
-        df_tabela = df_trabalho[[DATA_COL, CODIGO_COL, DISTRITO_COL]].copy()
+        df_tabela = armazenamento.latest('Fontes', [DATA_COL, CODIGO_COL, DISTRITO_COL], 10, provincia, distrito)
         df_tabela[DATA_COL] = df_tabela[DATA_COL].dt.strftime('%Y-%m-%d')
-        df_tabela = df_tabela.sort_values(DATA_COL, ascending=False).head(10).reset_index(drop=True)
         df_tabela.columns = ['Data', 'Código', 'Distrito']
 
         return html.Div([
@@ -367,7 +1322,7 @@ def update_detail_content(provincia, distrito):
             dbc.Row([
                 dbc.Col(make_kpi_card("Total Levantamentos (3 INFRA)", f"{total_levantamentos_infra_distrito:,}",
                                       "fa-database", "#16a085"), md=3),
-                dbc.Col(make_kpi_card("Qualidade: % Erros DAM (FONTES)", f"{percent_erros_dam_distrito:.1f}%",
+                dbc.Col(make_kpi_card("Qualidade: % Erros DAM (3 INFRA)", f"{percent_erros_dam_distrito:.1f}%",
                                       "fa-check-circle", "#f1c40f"), md=3),
                 dbc.Col(make_kpi_card("Inactividade Média", df_inat_distrito['Inactividade_Media_Dias'], "fa-clock",
                                       "#e67e22"), md=3),
@@ -376,7 +1331,7 @@ def update_detail_content(provincia, distrito):
 
             dbc.Row([
                 dbc.Col(html.Div([
-                    html.H5(f"🚨 DIAS PARADOS POR INFRAESTRUTURA (Limite: {DAYS_THRESHOLD} Dias)",
+                    html.H5(f"🚨 DIAS PARADOS POR INFRAESTRUTURA (Limite: {janela} Dias)",
                             className="mb-3 text-center text-uppercase",
                             style={"color": "white", "font-weight": "500", "font-size": "13px"}),
                     dash_table.DataTable(
@@ -386,7 +1341,10 @@ def update_detail_content(provincia, distrito):
                             {"name": "Média Inactividade", "id": 'Inactividade_Media_Dias'},
                             {"name": "Fontes", "id": "Dias Parados (Fontes)"},
                             {"name": "SAA", "id": "Dias Parados (SAA)"},
-                            {"name": "Comunidades", "id": "Dias Parados (Comunidades)"}
+                            {"name": "Comunidades", "id": "Dias Parados (Comunidades)"},
+                            {"name": "Limite Previsto: Fontes", "id": FORECAST_COLS[0]},
+                            {"name": "Limite Previsto: SAA", "id": FORECAST_COLS[1]},
+                            {"name": "Limite Previsto: Comunidades", "id": FORECAST_COLS[2]}
                         ],
                         data=[df_inat_distrito],
                         style_table={'height': '100%'},
@@ -399,6 +1357,33 @@ def update_detail_content(provincia, distrito):
                 ], style={'height': '150px'}), md=12),
             ], className="mt-3"),
 
+            dbc.Row([
+                dbc.Col(html.Div([
+                    html.H5(f"🗺️ POSTOS ADMINISTRATIVOS DO DISTRITO (Limite: {janela} Dias)",
+                            className="mb-3 text-center text-uppercase",
+                            style={"color": "white", "font-weight": "500", "font-size": "13px"}),
+                    dash_table.DataTable(
+                        id='table-postos-distrito',
+                        columns=[
+                            {"name": "Posto Administrativo", "id": POSTO_COL},
+                            {"name": "Levantamentos (3 INFRA)", "id": 'Total'},
+                            {"name": "Pontos (PI)", "id": INATIVIDADE_SCORE_NAME},
+                            {"name": "Fontes", "id": "Dias Parados (Fontes)"},
+                            {"name": "SAA", "id": "Dias Parados (SAA)"},
+                            {"name": "Comunidades", "id": "Dias Parados (Comunidades)"},
+                            {"name": "% Erros DAM", "id": 'Percent_Erros_DAM'},
+                            {"name": f"Cadastro {TARGET_YEAR}", "id": 'Cadastro_Ano_Atual'}
+                        ],
+                        data=df_tabela_postos.to_dict('records'),
+                        style_header={'backgroundColor': '#34495e', 'fontWeight': 'bold', 'color': 'white',
+                                      'border': '1px solid #1c2125'},
+                        style_data={'backgroundColor': '#212529', 'color': 'white', 'border': '1px solid #1c2125'},
+                        style_cell={'textAlign': 'center', 'fontSize': '12px', 'padding': '8px'},
+                        style_data_conditional=style_data_conditional
+                    )
+                ]), md=12),
+            ], className="mt-3") if not df_tabela_postos.empty else html.Div(),
+
             dbc.Row([
                 dbc.Col(dcc.Graph(figure=fig_historico, style={'height': UNIFORM_HEIGHT}), md=6),
                 dbc.Col(
@@ -423,14 +1408,15 @@ def update_detail_content(provincia, distrito):
         # 2. Caso: Selecionou APENAS a PROVÍNCIA (Padrão)
 
         # GRÁFICOS (Baseados apenas em Fontes para histórico)
-        fig_anos = px.histogram(df_prov_fontes, x="Ano", nbins=10,
-                                title=f"EVOLUÇÃO HISTÓRICA DE LEVANTAMENTOS (FONTES)",
-                                labels={'count': 'Total Levantamentos'},
-                                text_auto=True, template="plotly_dark")
+        df_anos = armazenamento.count_by('Fontes', 'Ano', provincia).reset_index(name='Total')
+        fig_anos = px.bar(df_anos, x="Ano", y="Total",
+                          title=f"EVOLUÇÃO HISTÓRICA DE LEVANTAMENTOS (FONTES)",
+                          labels={'Total': 'Total Levantamentos'},
+                          text_auto=True, template="plotly_dark")
         fig_anos.update_traces(marker_color='#e67e22', opacity=0.8)
         fig_anos.update_layout(title_font_size=13, margin=dict(t=30), title_x=0.5, height=350)
 
-        df_ranking_distrito = df_prov_fontes.groupby(DISTRITO_COL).size().reset_index(name='Total')
+        df_ranking_distrito = armazenamento.count_by('Fontes', DISTRITO_COL, provincia).reset_index(name='Total')
         df_ranking_distrito = df_ranking_distrito.sort_values('Total', ascending=True)
 
         fig_ranking_dist = px.bar(df_ranking_distrito, x='Total', y=DISTRITO_COL, orientation='h',
@@ -441,6 +1427,16 @@ def update_detail_content(provincia, distrito):
         fig_ranking_dist.update_layout(yaxis_title=None, xaxis_title="Total", margin=dict(t=30), title_font_size=13,
                                        title_x=0.5, height=350)
 
+        # Erros DAM por regra e infraestrutura (sem as linhas de totais)
+        df_tabela_qualidade = quality_summary(provincia).drop(index=['Registos_Com_Erro', 'Total_Registos'])
+        df_tabela_qualidade = df_tabela_qualidade.rename(index={
+            DUPLICADO_EXACTO_COL: 'Duplicados exactos',
+            DUPLICADO_PROXIMO_COL: f'Duplicados próximos (<= {DEDUP_JANELA_DIAS} dias)',
+        }).rename_axis('Regra').reset_index()
+
+        # Cobertura das comunidades por pontos de água, por distrito (só com coordenadas nos ficheiros)
+        df_tabela_cobertura = format_coverage_table(cobertura_distritos, provincia)
+
         # LAYOUT DE RESUMO DE PROVÍNCIA
         return html.Div([
             html.H4(f"RESUMO GERAL DA PROVÍNCIA: {provincia.upper()}", className="mb-4 text-uppercase",
@@ -451,7 +1447,7 @@ def update_detail_content(provincia, distrito):
                                       "#16a085"), md=3),
                 dbc.Col(make_kpi_card("% Distritos Activos (30d)", f"{percent_distritos_ativos:.1f}%", "fa-sitemap",
                                       "#3498db"), md=3),
-                dbc.Col(make_kpi_card("Qualidade: % Erros DAM (FONTES)", f"{percent_erros_dam_prov:.1f}%",
+                dbc.Col(make_kpi_card("Qualidade: % Erros DAM (3 INFRA)", f"{percent_erros_dam_prov:.1f}%",
                                       "fa-check-circle", "#f1c40f"), md=3),
                 dbc.Col(
                     make_kpi_card(f"Distritos Sem Cadastro (Ano {TARGET_YEAR})", distritos_sem_cadastro_ano, "fa-fire",
@@ -459,15 +1455,19 @@ def update_detail_content(provincia, distrito):
             ], className="mb-4"),
 
             dbc.Row([
-                dbc.Col(dcc.Graph(figure=fig_anos, style={'height': UNIFORM_HEIGHT}), md=6),
-                dbc.Col(dcc.Graph(figure=fig_ranking_dist, style={'height': UNIFORM_HEIGHT}), md=6),
+                dbc.Col(dcc.Graph(id="grafico-anos-provincia", figure=fig_anos, style={'height': UNIFORM_HEIGHT}),
+                        md=6),
+                dbc.Col(dcc.Graph(id="grafico-ranking-distritos", figure=fig_ranking_dist,
+                                  style={'height': UNIFORM_HEIGHT}), md=6),
             ], className="mt-3"),
+            # Distrito seleccionado no ranking (filtro cruzado da página da província)
+            dcc.Store(id="filtro-distrito", data=None),
 
             dbc.Row([
                 dbc.Col(
                     html.Div([
                         html.H5(
-                            f"🚨 PONTOS DE INACTIVIDADE (PI) - Distritos Sem Levantamento Recente (Limite: {DAYS_THRESHOLD} Dias)",
+                            f"🚨 PONTOS DE INACTIVIDADE (PI) - Distritos Sem Levantamento Recente (Limite: {janela} Dias)",
                             className="mb-3 text-center text-uppercase",
                             style={"color": "white", "font-weight": "500", "font-size": "13px"}),
                         dash_table.DataTable(
@@ -476,9 +1476,13 @@ def update_detail_content(provincia, distrito):
                                 {"name": "Distrito", "id": DISTRITO_COL},
                                 {"name": "Pontos (PI)", "id": INATIVIDADE_SCORE_NAME},
                                 {"name": "Média Inactividade", "id": 'Inactividade_Media_Dias'},
+                                {"name": f"Levantamentos ({janela}d)", "id": 'Levantamentos_Janela'},
                                 {"name": "Fontes", "id": "Dias Parados (Fontes)"},
                                 {"name": "SAA", "id": "Dias Parados (SAA)"},
-                                {"name": "Comunidades", "id": "Dias Parados (Comunidades)"}
+                                {"name": "Comunidades", "id": "Dias Parados (Comunidades)"},
+                                {"name": "Limite Previsto: Fontes", "id": FORECAST_COLS[0]},
+                                {"name": "Limite Previsto: SAA", "id": FORECAST_COLS[1]},
+                                {"name": "Limite Previsto: Comunidades", "id": FORECAST_COLS[2]}
                             ],
                             data=df_tabela_inatividade.to_dict('records'),
                             style_table={'height': '100%', 'overflowY': 'auto'},
@@ -491,75 +1495,506 @@ def update_detail_content(provincia, distrito):
                     ], style={'height': UNIFORM_HEIGHT}),
                     md=12
                 ),
-            ], className="mt-3")
+            ], className="mt-3"),
+
+            dbc.Row([
+                dbc.Col(
+                    html.Div([
+                        html.H5(f"💧 COBERTURA DAS COMUNIDADES - Sem Fonte/SAA a Menos de {COVERAGE_RADIUS_KM} km",
+                                className="mb-3 text-center text-uppercase",
+                                style={"color": "white", "font-weight": "500", "font-size": "13px"}),
+                        dash_table.DataTable(
+                            id='table-cobertura-comunidades',
+                            columns=[
+                                {"name": "Distrito", "id": DISTRITO_COL},
+                                {"name": "Comunidades", "id": 'Comunidades'},
+                                {"name": "Com Coordenadas", "id": 'Com_Coordenadas'},
+                                {"name": "Sem Cobertura", "id": 'Sem_Cobertura'},
+                                {"name": "% Sem Cobertura", "id": 'Percent_Sem_Cobertura'},
+                                {"name": "Distância Mediana", "id": 'Distancia_Mediana_km'},
+                                {"name": "Distância Máxima", "id": 'Distancia_Maxima_km'}
+                            ],
+                            data=df_tabela_cobertura.to_dict('records'),
+                            style_header={'backgroundColor': '#34495e', 'fontWeight': 'bold', 'color': 'white',
+                                          'border': '1px solid #1c2125'},
+                            style_data={'backgroundColor': '#212529', 'color': 'white', 'border': '1px solid #1c2125'},
+                            style_cell={'textAlign': 'center', 'fontSize': '12px', 'padding': '8px'},
+                            style_data_conditional=[
+                                {'if': {'filter_query': '{Sem_Cobertura} > 0'}, 'color': '#e74c3c'},
+                            ]
+                        ) if df_tabela_cobertura['Com_Coordenadas'].sum() else
+                        html.P("As comunidades desta província não têm coordenadas: a cobertura não pode ser "
+                               "calculada.", className="text-center", style={"color": "gray"})
+                    ]),
+                    md=12
+                ),
+            ], className="mt-5"),
+
+            dbc.Row([
+                dbc.Col(
+                    html.Div([
+                        html.H5("🔍 QUALIDADE DAM - ERROS POR REGRA E INFRAESTRUTURA",
+                                className="mb-3 text-center text-uppercase",
+                                style={"color": "white", "font-weight": "500", "font-size": "13px"}),
+                        dash_table.DataTable(
+                            id='table-qualidade-regras',
+                            columns=[{"name": i, "id": i} for i in df_tabela_qualidade.columns],
+                            data=df_tabela_qualidade.to_dict('records'),
+                            style_header={'backgroundColor': '#34495e', 'fontWeight': 'bold', 'color': 'white',
+                                          'border': '1px solid #1c2125'},
+                            style_data={'backgroundColor': '#212529', 'color': 'white', 'border': '1px solid #1c2125'},
+                            style_cell={'textAlign': 'center', 'fontSize': '12px', 'padding': '8px'}
+                        )
+                    ]),
+                    md=12
+                ),
+            ], className="mt-5")
         ])
 
 
-@app.callback(Output("page-content", "children"), [Input("url", "pathname")])
-def render_page_content(pathname):
-    # Lógica do Dashboard Geral
-    if pathname == "/":
+def map_values(janela, ids_distritos):
+    """Pontuação PI por distrito para o limite dado, alinhada com a ordem das features do GeoJSON."""
+    df_inatividade = inatividade_por_janela(actividade_janelas, janela)
+    pi_por_nome = df_inatividade.groupby(df_inatividade[DISTRITO_COL].map(normalize_name))[
+        INATIVIDADE_SCORE_NAME].max()
+    return pi_por_nome.reindex(ids_distritos).astype(float).replace({np.nan: None}).tolist()
+
+
+def make_map_figure(janela):
+    """Figura base do mapa (geometria do nível de zoom inicial + valores PI)."""
+    nivel = zoom_level_for(geometrias_distritos, MAP_INITIAL_ZOOM)
+    geojson = geometrias_distritos[nivel]
+    ids_distritos = [feature['id'] for feature in geojson['features']]
+
+    fig = go.Figure(go.Choroplethmap(
+        geojson=geojson, locations=ids_distritos, z=map_values(janela, ids_distritos),
+        zmin=0, zmax=3, colorscale=[[0, '#27ae60'], [0.34, '#f39c12'], [0.67, '#e67e22'], [1, '#c0392b']],
+        marker_opacity=0.75, marker_line_width=0.5,
+        colorbar=dict(title='PI'), hovertemplate='%{location}<br>PI: %{z}<extra></extra>'
+    ))
+    fig.update_layout(map_style='carto-darkmatter', map_zoom=MAP_INITIAL_ZOOM, map_center=MAP_CENTER,
+                      margin=dict(t=30, l=0, r=0, b=0), template='plotly_dark', uirevision='mapa',
+                      title=f"🗺️ PONTOS DE INACTIVIDADE (PI) POR DISTRITO (Limite: {janela} Dias)",
+                      title_font_size=13, title_x=0.5)
+    return fig, nivel
+
+
+# 3.3 Filtros cruzados do Dashboard: cada gráfico depende apenas de duas dimensões do filtro
+CROSS_FILTER_DEPENDENCIES = {
+    'ranking': ('mes', 'infra'),
+    'mensal': ('provincia', 'infra'),
+    'distribuicao': ('provincia', 'mes'),
+}
+
+
+def cross_filter_suffix(filtro, dimensoes):
+    """Texto com os filtros activos que afectam um gráfico."""
+    nomes = {'provincia': 'Província', 'mes': 'Mês', 'infra': 'Infra'}
+    partes = [f"{nomes[d]}: {filtro[d]}" for d in dimensoes if filtro.get(d) is not None]
+    return f" [{', '.join(partes)}]" if partes else ""
+
+
+def cross_filter_ranking(filtro):
+    """Ranking de províncias (ano alvo) para o mês/infra seleccionados."""
+    totais = rollup_counts(PROVINCIA_COL, ano=TARGET_YEAR, mes=filtro.get('mes'),
+                           infra=filtro.get('infra') or 'Fontes')
+    totais = totais[totais > 0].sort_values(ascending=True)
+    titulo = f"📈 RANKING DE TOTAL DE LEVANTAMENTOS POR PROVÍNCIA (ANO {TARGET_YEAR})" + \
+             cross_filter_suffix(filtro, CROSS_FILTER_DEPENDENCIES['ranking'])
+    return totais, titulo
+
+
+def cross_filter_monthly(filtro):
+    """Consistência mensal (ano alvo) para a província/infra seleccionadas."""
+    infra = filtro.get('infra') or 'Fontes'
+    totais = rollup_counts('Mes', ano=TARGET_YEAR, provincia=filtro.get('provincia'), infra=infra)
+    totais = totais[totais > 0].sort_index()
+    titulo = f"📉 CONSISTÊNCIA MENSAL (TENDÊNCIA) DE LEVANTAMENTOS ({infra.upper()})" + \
+             cross_filter_suffix(filtro, ('provincia',))
+    return totais, titulo
+
+
+def cross_filter_distribution(filtro):
+    """Distribuição por infra para a província/mês seleccionados (o mês refere-se ao ano alvo)."""
+    ano = TARGET_YEAR if filtro.get('mes') is not None else None
+    totais = rollup_counts('Infra', ano=ano, provincia=filtro.get('provincia'), mes=filtro.get('mes'))
+    titulo = 'DISTRIBUIÇÃO DOS LEVANTAMENTOS (3 INFRA.)' + \
+             cross_filter_suffix(filtro, CROSS_FILTER_DEPENDENCIES['distribuicao'])
+    return totais.reindex(INFRA_NAMES, fill_value=0), titulo
 
-        # CÁLCULOS TOTAIS MULTI-INFRA (Geral)
-        total_fontes_geral = len(df_fontes)
-        total_saa_geral = len(df_saa)
-        total_comunidades_geral = len(df_comunidades)
-        total_levantamentos_geral = total_fontes_geral + total_saa_geral + total_comunidades_geral
 
-        # KPIS de Desempenho (Baseados em df_inatividade_geral)
-        total_distritos_pais = df_inatividade_geral[DISTRITO_COL].nunique()
-        total_provincias_pais = df_inatividade_geral[PROVINCIA_COL].nunique()
+@app.callback(
+    Output("filtro-cruzado", "data"),
+    Output("grafico-ranking-provincias", "figure"),
+    Output("grafico-consistencia-mensal", "figure"),
+    Output("grafico-distribuicao-infra", "figure"),
+    Output("filtro-cruzado-info", "children"),
+    Input("grafico-ranking-provincias", "clickData"),
+    Input("grafico-consistencia-mensal", "clickData"),
+    Input("grafico-distribuicao-infra", "clickData"),
+    Input("btn-limpar-filtros", "n_clicks"),
+    State("filtro-cruzado", "data"),
+    prevent_initial_call=True
+)
+def update_cross_filter(click_provincia, click_mes, click_infra, n_limpar, filtro_anterior):
+    filtro_anterior = filtro_anterior or {}
+    filtro = dict(filtro_anterior)
+    origem = dash.ctx.triggered_id
+
+    # Um clique no valor já seleccionado remove esse filtro
+    if origem == "grafico-ranking-provincias" and click_provincia:
+        valor = click_provincia['points'][0]['y']
+        filtro['provincia'] = None if filtro.get('provincia') == valor else valor
+    elif origem == "grafico-consistencia-mensal" and click_mes:
+        valor = int(click_mes['points'][0]['x'])
+        filtro['mes'] = None if filtro.get('mes') == valor else valor
+    elif origem == "grafico-distribuicao-infra" and click_infra:
+        valor = click_infra['points'][0]['label']
+        filtro['infra'] = None if filtro.get('infra') == valor else valor
+    elif origem == "btn-limpar-filtros":
+        filtro = {}
+
+    def mudou(grafico):
+        return any(filtro.get(d) != filtro_anterior.get(d) for d in CROSS_FILTER_DEPENDENCIES[grafico])
+
+    # Só os traços dos gráficos afectados são actualizados (Patch), e só com os arrays alterados
+    patch_ranking = dash.no_update
+    if mudou('ranking'):
+        totais, titulo = cross_filter_ranking(filtro)
+        patch_ranking = Patch()
+        patch_ranking['data'][0]['x'] = totais.tolist()
+        patch_ranking['data'][0]['y'] = totais.index.tolist()
+        patch_ranking['data'][0]['marker']['color'] = totais.tolist()
+        patch_ranking['layout']['title']['text'] = titulo
+
+    patch_mensal = dash.no_update
+    if mudou('mensal'):
+        totais, titulo = cross_filter_monthly(filtro)
+        patch_mensal = Patch()
+        patch_mensal['data'][0]['x'] = [int(m) for m in totais.index]
+        patch_mensal['data'][0]['y'] = totais.tolist()
+        patch_mensal['layout']['title']['text'] = titulo
+
+    patch_distribuicao = dash.no_update
+    if mudou('distribuicao'):
+        totais, titulo = cross_filter_distribution(filtro)
+        patch_distribuicao = Patch()
+        patch_distribuicao['data'][0]['values'] = totais.tolist()
+        patch_distribuicao['layout']['title']['text'] = titulo
+
+    info = cross_filter_suffix(filtro, ('provincia', 'mes', 'infra')).strip(" []") or "Nenhum filtro activo"
+    return filtro, patch_ranking, patch_mensal, patch_distribuicao, f"Filtros: {info}"
 
-        # CÁLCULO KPI DE INATIVIDADE ANUAL CRÍTICA (GERAL) - NOVO FOCO PROVINCIAL
 
-        # 1. Contar Distritos Sem Cadastro (Cadastro_Ano_Atual == False) por Província
-        df_ranking_prov_sem_cadastro = df_inatividade_geral[~df_inatividade_geral['Cadastro_Ano_Atual']] \
-            .groupby(PROVINCIA_COL).size().reset_index(name='Distritos Sem Cadastro')
+@app.callback(
+    Output("filtro-distrito", "data"),
+    Output("grafico-anos-provincia", "figure"),
+    Output("grafico-ranking-distritos", "figure"),
+    Input("grafico-ranking-distritos", "clickData"),
+    State("filtro-distrito", "data"),
+    State("dropdown-provincia", "value"),
+    prevent_initial_call=True
+)
+def update_district_filter(click_distrito, distrito_anterior, provincia):
+    """
+    Filtro cruzado da página da província: um clique num distrito do ranking filtra a evolução histórica
+    para esse distrito (lida do cubo de contagens) e destaca a sua barra; um novo clique remove o filtro.
+    """
+    if not click_distrito or not provincia:
+        return dash.no_update, dash.no_update, dash.no_update
+    ponto = click_distrito['points'][0]
+    distrito = None if distrito_anterior == ponto['y'] else ponto['y']
 
-        # Renomear para a exibição na tabela (usando o acento para melhor visualização)
-        df_ranking_prov_tabela = df_ranking_prov_sem_cadastro.copy()
-        df_ranking_prov_tabela.columns = ['Província', f'Distritos Sem Cadastro (Ano {TARGET_YEAR})']
-        df_ranking_prov_tabela = df_ranking_prov_tabela.sort_values(f'Distritos Sem Cadastro (Ano {TARGET_YEAR})',
-                                                                    ascending=False)
+    # Evolução histórica (Fontes) da província ou do distrito, só com os anos com levantamentos
+    totais = yearly_totals(cubo_contagens, provincia, distrito)[:, INFRA_NAMES.index('Fontes')]
+    com_levantamentos = totais > 0
+    patch_anos = Patch()
+    patch_anos['data'][0]['x'] = cubo_contagens['anos'][com_levantamentos].tolist()
+    patch_anos['data'][0]['y'] = totais[com_levantamentos].tolist()
+    patch_anos['layout']['title']['text'] = "EVOLUÇÃO HISTÓRICA DE LEVANTAMENTOS (FONTES)" + \
+                                            (f" [Distrito: {distrito}]" if distrito else "")
 
-        # 2. Identificar Províncias Sem Cadastro Total (100% dos distritos inativos no ano)
-        # Total de distritos por província
-        df_distritos_por_prov = df_inatividade_geral.groupby(PROVINCIA_COL)[DISTRITO_COL].nunique().reset_index(
-            name='Total Distritos')
+    # No ranking só muda a selecção: as outras barras ficam esbatidas
+    patch_ranking = Patch()
+    patch_ranking['data'][0]['selectedpoints'] = [ponto['pointIndex']] if distrito else None
+    return distrito, patch_anos, patch_ranking
 
-        # Merge usando PROVINCIA_COL (Sem acento)
-        df_analise_prov = pd.merge(df_distritos_por_prov, df_ranking_prov_sem_cadastro, on=PROVINCIA_COL,
-                                   how='left').fillna(0)
-        df_analise_prov['Distritos Sem Cadastro'] = df_analise_prov['Distritos Sem Cadastro'].astype(int)
 
-        # Contagem: Se Total Distritos == Distritos Sem Cadastro, a província está 'morta' no ano
-        provincias_sem_cadastro_anual = len(
-            df_analise_prov[df_analise_prov['Total Distritos'] == df_analise_prov['Distritos Sem Cadastro']])
+# 3.4 Comparação anual: KPIs de variação (YoY) e rankings de crescimento lidos do cubo de contagens
+_template_escuro = None
 
-        # CÁLCULO KPI DE QUALIDADE (GERAL)
-        total_erros_dam_geral = df_fontes[ERROR_FLAG_COL].sum() if not df_fontes.empty else 0
-        percent_erros_dam_geral = (total_erros_dam_geral / total_fontes_geral) * 100 if total_fontes_geral else 0
 
-        # KPI de COBERTURA (AGORA POR PROVÍNCIA)
-        # Províncias ativas são aquelas que têm pelo menos um distrito com Max_Dias_Parados <= 30
-        df_activos = df_inatividade_geral[df_inatividade_geral['Max_Dias_Parados'] <= DAYS_ACTIVE_THRESHOLD]
-        provincias_activas = df_activos[PROVINCIA_COL].nunique()
-        percent_provincias_activas = (provincias_activas / total_provincias_pais) * 100 if total_provincias_pais else 0
+def comparison_figure(traces, titulo, **layout):
+    """
+    Figura em dicionário simples (sem validação do plotly): o recorte do cubo custa < 1 ms e a construção
+    de go.Figure com template="plotly_dark" custava ~30 ms por gráfico (cópia profunda do template).
+    """
+    global _template_escuro
+    if _template_escuro is None:
+        import plotly.io as pio
+        _template_escuro = pio.templates['plotly_dark'].to_plotly_json()
+    return {'data': traces,
+            'layout': dict({'title': {'text': titulo, 'x': 0.5, 'font': {'size': 13}}, 'margin': {'t': 30},
+                            'template': _template_escuro}, **layout)}
 
-        # KPIS ANUAIS (Baseados em Fontes)
 
-        # CORREÇÃO: Usar o valor mínimo de Max_Dias_Parados no df_inatividade_geral (garante a consistência multi-infra)
-        if df_inatividade_geral.empty or df_inatividade_geral['Max_Dias_Parados'].min() == 9999:
-            dias_desde_ult = "N/A"
-        else:
-            # O dia mais recente é o menor Max_Dias_Parados
-            dias_desde_ult = int(df_inatividade_geral['Max_Dias_Parados'].min())
+@app.callback(
+    Output("comparacao-anual-content", "children"),
+    Input("dropdown-ano-comparacao", "value")
+)
+def update_year_comparison(ano):
+    if ano is None or year_position(cubo_contagens, ano) is None:
+        return html.P("Sem levantamentos para o ano seleccionado.", style={"color": "gray"})
+
+    actual = province_totals(cubo_contagens, ano)  # (províncias, infra)
+    anterior = province_totals(cubo_contagens, ano - 1)
+
+    def variacao(novo, antigo):
+        return f"{(novo - antigo) / antigo * 100:+.1f}%" if antigo else "N/A"
+
+    total_actual, total_anterior = int(actual.sum()), int(anterior.sum())
+    cards = [dbc.Col(make_kpi_card(f"Total Levantamentos {ano} (3 INFRA)", f"{total_actual:,}", "fa-calendar",
+                                   "#16a085"), md=3)]
+    cards.append(dbc.Col(make_kpi_card(f"Variação vs {ano - 1} (3 INFRA)", variacao(total_actual, total_anterior),
+                                       "fa-exchange-alt", "#3498db"), md=3))
+    # Uma variação por infra (3 x md=2): a linha de cards continua com 12 colunas
+    for i, (infra_name, cor) in enumerate(zip(INFRA_NAMES, ['#3498db', '#e67e22', '#8e44ad'])):
+        cards.append(dbc.Col(make_kpi_card(f"Variação {infra_name} vs {ano - 1}",
+                                           variacao(actual[:, i].sum(), anterior[:, i].sum()),
+                                           "fa-chart-line", cor), md=2))
+
+    # Ranking de crescimento por província (só províncias com levantamentos no ano anterior)
+    por_prov_actual, por_prov_anterior = actual.sum(axis=1), anterior.sum(axis=1)
+    com_base = por_prov_anterior > 0
+    crescimento = (por_prov_actual[com_base] - por_prov_anterior[com_base]) / por_prov_anterior[com_base] * 100
+    provincias = np.asarray(cubo_contagens['provincias'])[com_base]
+    ordem = np.argsort(crescimento)
+    fig_crescimento = comparison_figure(
+        [{'type': 'bar', 'x': crescimento[ordem].tolist(), 'y': provincias[ordem].tolist(), 'orientation': 'h',
+          'marker': {'color': np.where(crescimento[ordem] >= 0, '#16a085', '#c0392b').tolist()},
+          'text': [f"{c:+.0f}%" for c in crescimento[ordem]], 'textposition': 'auto'}],
+        f"📊 CRESCIMENTO POR PROVÍNCIA ({ano} vs {ano - 1}, 3 INFRA)", xaxis={'title': {'text': "Variação (%)"}})
+
+    # Evolução anual por infra (todos os anos) e comparação mensal ano vs ano anterior
+    series_anuais = yearly_totals(cubo_contagens)
+    fig_anual = comparison_figure(
+        [{'type': 'scatter', 'x': cubo_contagens['anos'].tolist(), 'y': series_anuais[:, i].tolist(),
+          'mode': 'lines+markers', 'name': infra_name, 'line': {'color': cor, 'width': 3}}
+         for i, (infra_name, cor) in enumerate(zip(INFRA_NAMES, ['#3498db', '#e67e22', '#8e44ad']))],
+        "📈 EVOLUÇÃO ANUAL DE LEVANTAMENTOS POR INFRA", xaxis={'title': {'text': "Ano"}},
+        yaxis={'title': {'text': "Total Levantamentos"}},
+        shapes=[{'type': 'line', 'x0': ano, 'x1': ano, 'xref': 'x', 'y0': 0, 'y1': 1, 'yref': 'y domain',
+                 'line': {'dash': 'dot', 'color': '#f1c40f'}}])
+
+    fig_mensal = comparison_figure(
+        [{'type': 'scatter', 'x': list(range(1, 13)), 'y': monthly_totals(cubo_contagens, a).sum(axis=1).tolist(),
+          'mode': 'lines+markers', 'name': str(a), 'line': {'color': cor, 'width': 3, 'dash': traco}}
+         for a, cor, traco in ((ano, '#f1c40f', 'solid'), (ano - 1, '#95a5a6', 'dot'))],
+        f"📉 LEVANTAMENTOS MENSAIS {ano} vs {ano - 1} (3 INFRA)",
+        xaxis={'title': {'text': "Mês"}, 'tickmode': 'array', 'tickvals': list(range(1, 13))},
+        yaxis={'title': {'text': "Total Levantamentos"}})
+
+    return html.Div([
+        dbc.Row(cards, className="mb-4"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(figure=fig_crescimento, style={'height': UNIFORM_HEIGHT}), md=6),
+            dbc.Col(dcc.Graph(figure=fig_mensal, style={'height': UNIFORM_HEIGHT}), md=6),
+        ], className="mt-3"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(figure=fig_anual, style={'height': UNIFORM_HEIGHT}), md=12),
+        ], className="mt-3"),
+    ])
+
+
+# 3.5 Mapa: ao mudar o limite só o vector de valores (z) é enviado, nunca a geometria
+@app.callback(
+    Output("mapa-distritos", "figure"),
+    Input("dropdown-janela-mapa", "value"),
+    prevent_initial_call=True
+)
+def update_map_values(janela):
+    patch = Patch()
+    ids_distritos = [feature['id'] for feature in next(iter(geometrias_distritos.values()))['features']]
+    patch['data'][0]['z'] = map_values(janela, ids_distritos)
+    patch['layout']['title']['text'] = f"🗺️ PONTOS DE INACTIVIDADE (PI) POR DISTRITO (Limite: {janela} Dias)"
+    return patch
+
+
+# 3.6 Mapa: a geometria só é trocada quando o zoom atravessa um nível da cache
+@app.callback(
+    Output("mapa-distritos", "figure", allow_duplicate=True),
+    Output("mapa-nivel-zoom", "data"),
+    Input("mapa-distritos", "relayoutData"),
+    State("mapa-nivel-zoom", "data"),
+    prevent_initial_call=True
+)
+def update_map_geometry(relayout_data, nivel_actual):
+    zoom = (relayout_data or {}).get('map.zoom')
+    if zoom is None or not geometrias_distritos:
+        return dash.no_update, dash.no_update
+
+    nivel = zoom_level_for(geometrias_distritos, zoom)
+    if nivel == nivel_actual:
+        return dash.no_update, dash.no_update
+
+    patch = Patch()
+    patch['data'][0]['geojson'] = geometrias_distritos[nivel]
+    return patch, nivel
+
+
+def upload_status(tarefa):
+    """Barra de progresso e mensagem de uma tarefa de carregamento."""
+    cor = {'concluido': 'success', 'erro': 'danger'}.get(tarefa['estado'], 'info')
+    a_correr = tarefa['estado'] not in ('concluido', 'erro')
+    return html.Div([
+        html.P(f"{tarefa['ficheiro']} ({tarefa['infra']})", className="mb-2", style={"color": "white"}),
+        dbc.Progress(value=tarefa['progresso'] * 100, label=f"{tarefa['progresso']:.0%}", color=cor,
+                     striped=a_correr, animated=a_correr),
+        html.P(tarefa['mensagem'], className="mt-2", style={"color": "#e74c3c" if cor == 'danger' else "gray"}),
+    ])
+
+
+@app.callback(
+    Output("carregamento-tarefa", "data"),
+    Output("carregamento-intervalo", "disabled"),
+    Output("carregamento-estado", "children"),
+    Input("carregamento-ficheiro", "contents"),
+    Input("carregamento-intervalo", "n_intervals"),
+    State("carregamento-ficheiro", "filename"),
+    State("carregamento-infra", "value"),
+    State("carregamento-tarefa", "data"),
+    prevent_initial_call=True
+)
+def handle_upload(conteudo, n_intervals, nome_ficheiro, infra_name, tarefa_id):
+    """Recebe o ficheiro (grava-o e põe-no na fila) e depois mostra o progresso da validação e junção."""
+    if dash.ctx.triggered_id == "carregamento-ficheiro":
+        if not conteudo:
+            return dash.no_update, dash.no_update, dash.no_update
+        caminho = save_upload(conteudo, os.path.join(UPLOAD_DIR, 'recebidos'), nome_ficheiro)
+        tarefa_id = fila_carregamentos.submit(infra_name, caminho, nome_ficheiro)
+
+    tarefa = fila_carregamentos.status(tarefa_id) if tarefa_id else None
+    if tarefa is None:
+        return tarefa_id, True, html.P("Tarefa de carregamento não encontrada.", style={"color": "gray"})
+    return tarefa_id, tarefa['estado'] in ('concluido', 'erro'), upload_status(tarefa)
+
+
+def home_kpis():
+    """Valores (já formatados) dos KPIs nacionais do Dashboard Geral, pelo id do elemento de cada valor."""
+    # Nó do país no rollup hierárquico: totais e contagens de províncias já agregados dos níveis abaixo
+    pais = kpis_hierarquia.node()
+    total_fontes_geral, total_saa_geral, total_comunidades_geral = (pais[f'Total_{i}'] for i in INFRA_NAMES)
+    total_levantamentos_geral = pais['Total']
+
+    # Províncias Sem Cadastro Total: nenhum levantamento no ano alvo em nenhum dos seus distritos
+    provincias_sem_cadastro_anual = int(pais.get('Filhos_Sem_Cadastro', 0))
+
+    # CÁLCULO KPI DE QUALIDADE (GERAL)
+    percent_erros_dam_geral = pais['Percent_Erros_DAM']
+
+    # KPI de COBERTURA (POR PROVÍNCIA): activa com pelo menos um levantamento nos últimos 30 dias
+    percent_provincias_activas = pais.get('Percent_Filhos_Activos', 0)
+
+    # O levantamento mais recente (menor número de dias parados entre todas as infra)
+    dias_desde_ult = "N/A" if pais['Max_Dias_Parados'] == NUNCA else int(pais['Max_Dias_Parados'])
+
+    return {
+        'kpi-total-levantamentos': f"{total_levantamentos_geral:,}",
+        'kpi-total-fontes': f"{total_fontes_geral:,}",
+        'kpi-total-saa': f"{total_saa_geral:,}",
+        'kpi-total-comunidades': f"{total_comunidades_geral:,}",
+        'kpi-provincias-activas': f"{percent_provincias_activas:.1f}%",
+        'kpi-erros-dam': f"{percent_erros_dam_geral:.1f}%",
+        'kpi-provincias-sem-cadastro': provincias_sem_cadastro_anual,
+        'kpi-dias-desde-ultimo': f"{dias_desde_ult} dias",
+    }
+
+
+def refresh_snapshot():
+    """
+    Estado visível das páginas para a difusão: KPIs nacionais e, por janela de inactividade, as linhas
+    (formatadas) da tabela de distritos de /provincias, pela chave 'província|distrito'.
+    """
+    linhas = {}
+    for janela in ACTIVITY_WINDOWS:
+        tabela = format_inactivity_table(inatividade_por_janela(actividade_janelas, janela, None, previsao_limites))
+        linhas[f"table-distrito-inatividade:{janela}"] = {
+            f"{linha[PROVINCIA_COL]}|{linha[DISTRITO_COL]}": linha for linha in tabela.to_dict('records')}
+    # Um ano alvo novo ou distritos novos mudam títulos e linhas das tabelas: a página é desenhada de novo
+    estrutura = {'ano': int(TARGET_YEAR), 'distritos': len(actividade_janelas['indice'])}
+    return {'estrutura': estrutura, 'kpis': home_kpis(), 'linhas': linhas}
+
+
+def publish_refresh():
+    """Difunde aos navegadores ligados a este worker a diferença do estado visível (com PUSH_EVENTS=1)."""
+    if difusor is None:
+        return
+    try:
+        with bloqueio_dados:
+            versao, estado = cache_version(), refresh_snapshot()
+        difusor.publish(versao, estado)
+    except Exception as e:
+        print(f"AVISO: Falha ao difundir a actualização dos dados: {e}")
+
+
+def loading_shell():
+    """Página mostrada enquanto os dados carregam (o intervalo do layout volta a pedir a página)."""
+    return html.Div([
+        html.H4("A CARREGAR DADOS...", className="mb-4 text-uppercase",
+                style={"color": "#16a085", "font-weight": "500"}),
+        dbc.Spinner(color="info"),
+        html.P("Os ficheiros de levantamentos estão a ser processados. A página actualiza automaticamente.",
+               className="mt-3", style={"color": "gray"}),
+    ])
+
+
+@app.callback(Output("intervalo-carregamento", "disabled"), Input("intervalo-carregamento", "n_intervals"))
+def stop_loading_interval(n_intervals):
+    return DADOS_PRONTOS.is_set()
+
+
+@app.callback(Output("page-content", "children"),
+              [Input("url", "pathname"), Input("intervalo-carregamento", "n_intervals")])
+def render_page_content(pathname, n_intervals=None):
+    if not DADOS_PRONTOS.is_set():
+        return loading_shell()
+    if estado_carregamento['estado'] == 'erro':
+        return html.P(f"Erro ao carregar os dados: {estado_carregamento['erro']}", style={"color": "#e74c3c"})
+
+    # Versão lida antes das agregações (a página nunca é mais recente do que ela): assets/actualizacoes.js
+    # liga-se a /eventos com esta versão e recebe as actualizações difundidas entretanto
+    versao = cache_version()
+    return html.Div([render_page(pathname), html.Div(id="versao-pagina", hidden=True, **{'data-versao': versao})])
+
 
-        df_mes_geral = df_2025.groupby('Mes').size().reset_index(name='Total_Levantamentos')
+def render_page(pathname):
+    """Conteúdo da página `pathname`, com os dados já carregados."""
+    import plotly.express as px  # Import diferido: só é necessário quando há gráficos a gerar
+
+    # Lógica do Dashboard Geral
+    if pathname == "/":
+
+        # KPIs nacionais (os mesmos valores que a difusão em /eventos actualiza no navegador)
+        kpis = home_kpis()
+
+        # 1. Distritos Sem Cadastro (sem levantamentos no ano alvo) por Província, lidos dos nós das províncias
+        df_provincias = kpis_hierarquia.children()
+        df_ranking_prov_sem_cadastro = df_provincias.loc[df_provincias['Filhos_Sem_Cadastro'] > 0,
+                                                         [PROVINCIA_COL, 'Filhos_Sem_Cadastro']] \
+            .rename(columns={'Filhos_Sem_Cadastro': 'Distritos Sem Cadastro'}).reset_index(drop=True)
+
+        # Renomear para a exibição na tabela (usando o acento para melhor visualização)
+        df_ranking_prov_tabela = df_ranking_prov_sem_cadastro.set_axis(
+            ['Província', f'Distritos Sem Cadastro (Ano {TARGET_YEAR})'], axis=1)
+        df_ranking_prov_tabela = df_ranking_prov_tabela.sort_values(f'Distritos Sem Cadastro (Ano {TARGET_YEAR})',
+                                                                    ascending=False)
+
+        df_mes_geral = armazenamento.count_by('Fontes', 'Mes', ano=TARGET_YEAR).reset_index(name='Total_Levantamentos')
 
         # Figuras (gráficos)
         fig_ranking = px.bar(
-            df_2025.groupby(PROVINCIA_COL).size().reset_index(name='Total').sort_values('Total', ascending=True),
+            armazenamento.count_by('Fontes', PROVINCIA_COL, ano=TARGET_YEAR).reset_index(name='Total').sort_values(
+                'Total', ascending=True),
             x='Total', y=PROVINCIA_COL, orientation='h',
             title=f"📈 RANKING DE TOTAL DE LEVANTAMENTOS POR PROVÍNCIA (ANO {TARGET_YEAR})",
             color='Total', color_continuous_scale="Plotly3",
@@ -584,25 +2019,29 @@ def render_page_content(pathname):
 
             # LINHA 1: KPIS TOTAIS MULTI-INFRA
             dbc.Row([
-                dbc.Col(make_kpi_card("TOTAL LEVANTAMENTOS (3 INFRA)", f"{total_levantamentos_geral:,}", "fa-globe",
-                                      "#16a085"), md=3),
-                dbc.Col(make_kpi_card("Total Fontes", f"{total_fontes_geral:,}", "fa-tint", "#3498db"), md=3),
-                dbc.Col(make_kpi_card("Total SAA", f"{total_saa_geral:,}", "fa-building", "#e67e22"), md=3),
-                dbc.Col(make_kpi_card("Total Comunidades", f"{total_comunidades_geral:,}", "fa-users", "#8e44ad"),
-                        md=3),
+                dbc.Col(make_kpi_card("TOTAL LEVANTAMENTOS (3 INFRA)", kpis['kpi-total-levantamentos'], "fa-globe",
+                                      "#16a085", value_id='kpi-total-levantamentos'), md=3),
+                dbc.Col(make_kpi_card("Total Fontes", kpis['kpi-total-fontes'], "fa-tint", "#3498db",
+                                      value_id='kpi-total-fontes'), md=3),
+                dbc.Col(make_kpi_card("Total SAA", kpis['kpi-total-saa'], "fa-building", "#e67e22",
+                                      value_id='kpi-total-saa'), md=3),
+                dbc.Col(make_kpi_card("Total Comunidades", kpis['kpi-total-comunidades'], "fa-users", "#8e44ad",
+                                      value_id='kpi-total-comunidades'), md=3),
             ], className="mb-4"),
 
             # LINHA 2: KPIS DE DESEMPENHO (COBERTURA, QUALIDADE, PRIORIZAÇÃO, DATA)
             dbc.Row([
-                dbc.Col(make_kpi_card("% Províncias Activas (30d)", f"{percent_provincias_activas:.1f}%", "fa-sitemap",
-                                      "#3498db"), md=3),
-                dbc.Col(make_kpi_card("Qualidade: % Erros DAM (FONTES)", f"{percent_erros_dam_geral:.1f}%",
-                                      "fa-check-circle", "#f1c40f"), md=3),
+                dbc.Col(make_kpi_card("% Províncias Activas (30d)", kpis['kpi-provincias-activas'], "fa-sitemap",
+                                      "#3498db", value_id='kpi-provincias-activas'), md=3),
+                dbc.Col(make_kpi_card("Qualidade: % Erros DAM (3 INFRA)", kpis['kpi-erros-dam'],
+                                      "fa-check-circle", "#f1c40f", value_id='kpi-erros-dam'), md=3),
                 dbc.Col(
-                    make_kpi_card(f"Províncias Sem Cadastro Total (Ano {TARGET_YEAR})", provincias_sem_cadastro_anual,
-                                  "fa-fire", "#e74c3c"), md=3),
+                    make_kpi_card(f"Províncias Sem Cadastro Total (Ano {TARGET_YEAR})",
+                                  kpis['kpi-provincias-sem-cadastro'], "fa-fire", "#e74c3c",
+                                  value_id='kpi-provincias-sem-cadastro'), md=3),
                 dbc.Col(
-                    make_kpi_card("Dias Desde Levantamento Recente", f"{dias_desde_ult} dias", "fa-bell", "#c0392b"),
+                    make_kpi_card("Dias Desde Levantamento Recente", kpis['kpi-dias-desde-ultimo'], "fa-bell",
+                                  "#c0392b", value_id='kpi-dias-desde-ultimo'),
                     md=3),
             ]),
 
@@ -626,19 +2065,47 @@ def render_page_content(pathname):
                     ], style={'height': UNIFORM_HEIGHT}),
                     md=6
                 ),
-                dbc.Col(dcc.Graph(figure=fig_ranking, style={'height': UNIFORM_HEIGHT}), md=6),
+                dbc.Col(dcc.Graph(id="grafico-ranking-provincias", figure=fig_ranking,
+                                  style={'height': UNIFORM_HEIGHT}), md=6),
             ], className="mt-3"),
+
+            # FILTROS CRUZADOS: clicar numa barra, ponto ou fatia filtra os outros gráficos
+            dcc.Store(id="filtro-cruzado", data={}),
             dbc.Row([
-                dbc.Col(dcc.Graph(figure=fig_consistencia_line, style={'height': UNIFORM_HEIGHT}), md=6),
-                dbc.Col(dcc.Graph(figure=go.Figure(data=[go.Pie(
+                dbc.Col(html.Div("Filtros: Nenhum filtro activo", id="filtro-cruzado-info",
+                                 style={"color": "gray", "font-size": "13px"}), md=10),
+                dbc.Col(dbc.Button("Limpar filtros", id="btn-limpar-filtros", size="sm", color="secondary"),
+                        md=2, className="text-end"),
+            ], className="mt-3"),
+
+            dbc.Row([
+                dbc.Col(dcc.Graph(id="grafico-consistencia-mensal", figure=fig_consistencia_line,
+                                  style={'height': UNIFORM_HEIGHT}), md=6),
+                dbc.Col(dcc.Graph(id="grafico-distribuicao-infra", figure=go.Figure(data=[go.Pie(
                     labels=['Fontes', 'SAA', 'Comunidades'],
-                    values=[total_fontes_geral, total_saa_geral, total_comunidades_geral],
+                    values=[kpis_hierarquia.node()[f'Total_{infra}'] for infra in INFRA_NAMES],
                     hole=.3,
                     marker=dict(colors=['#3498db', '#e67e22', '#8e44ad'])
                 )]).update_layout(title_text='DISTRIBUIÇÃO DOS LEVANTAMENTOS (3 INFRA.)', title_font_size=13,
                                   title_x=0.5, template='plotly_dark'), style={'height': UNIFORM_HEIGHT}), md=6),
 
-            ], className="mt-3")
+            ], className="mt-3"),
+
+            # COMPARAÇÃO MULTI-ANO (servida por fatias do cubo de contagens)
+            html.H4("COMPARAÇÃO ANUAL DE LEVANTAMENTOS", className="mt-5 mb-4 text-uppercase",
+                    style={"color": "#16a085", "font-weight": "500"}),
+            dbc.Row([
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="dropdown-ano-comparacao",
+                        options=[{"label": f"Ano {int(a)}", "value": int(a)} for a in cubo_contagens['anos'][::-1]],
+                        value=int(TARGET_YEAR),
+                        clearable=False,
+                        style={"color": "#212529", "font-size": "14px"}
+                    ), md=4
+                ),
+            ]),
+            html.Div(id="comparacao-anual-content", className="mt-4")
         ])
 
 
@@ -650,7 +2117,7 @@ def render_page_content(pathname):
                 dbc.Col(
                     dcc.Dropdown(
                         id="dropdown-provincia",
-                        options=[{"label": prov, "value": prov} for prov in sorted(df[PROVINCIA_COL].unique())],
+                        options=[{"label": prov, "value": prov} for prov in armazenamento.distinct('Fontes', PROVINCIA_COL)],
                         placeholder="1. Selecione a Província (Obrigatório)",
                         style={"color": "#212529", "font-size": "14px"}
                     ), md=4
@@ -662,9 +2129,116 @@ def render_page_content(pathname):
                         disabled=True,
                         style={"color": "#212529", "font-size": "14px"}
                     ), md=4
+                ),
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="dropdown-janela",
+                        options=[{"label": f"Limite de inactividade: {j} dias", "value": j} for j in ACTIVITY_WINDOWS],
+                        value=DAYS_THRESHOLD,
+                        clearable=False,
+                        style={"color": "#212529", "font-size": "14px"}
+                    ), md=4
                 )
             ]),
-            html.Div(id="provincia-content", className="mt-4")
+            html.Div(id="provincia-content", className="mt-4"),
+
+            dbc.Row([
+                dbc.Col(
+                    html.Div([
+                        html.H5(f"📉 ANOMALIAS DE VOLUME MENSAL POR DISTRITO (|z| ≥ {ANOMALY_Z_THRESHOLD}, "
+                                f"Últimos {ANOMALY_MONTHS} Meses Completos)",
+                                className="mb-3 text-center text-uppercase",
+                                style={"color": "white", "font-weight": "500", "font-size": "13px"}),
+                        dash_table.DataTable(
+                            id='table-anomalias-volume',
+                            columns=[
+                                {"name": "Província", "id": "Provincia"},
+                                {"name": "Distrito", "id": "Distrito"},
+                                {"name": "Infra", "id": "Infra"},
+                                {"name": "Mês", "id": "Mes"},
+                                {"name": "Levantamentos", "id": "Levantamentos"},
+                                {"name": "Esperado", "id": "Esperado"},
+                                {"name": "Desvio (z)", "id": "Desvio (z)"},
+                                {"name": "Tipo", "id": "Tipo"}
+                            ],
+                            data=anomalias_volume.to_dict('records'),
+                            page_size=15,
+                            style_header={'backgroundColor': '#34495e', 'fontWeight': 'bold', 'color': 'white',
+                                          'border': '1px solid #1c2125'},
+                            style_data={'backgroundColor': '#212529', 'color': 'white', 'border': '1px solid #1c2125'},
+                            style_cell={'textAlign': 'center', 'fontSize': '12px', 'padding': '8px'},
+                            style_data_conditional=[
+                                {'if': {'filter_query': '{Tipo} = "Queda"'}, 'color': '#e74c3c'},
+                                {'if': {'filter_query': '{Tipo} = "Pico"'}, 'color': '#f39c12'},
+                            ]
+                        ) if len(anomalias_volume) else
+                        html.P("Nenhuma anomalia de volume nos meses recentes.", className="text-center",
+                               style={"color": "gray"})
+                    ]),
+                    md=12
+                ),
+            ], className="mt-5")
+        ])
+
+    elif pathname == "/mapa":
+        if not geometrias_distritos:
+            return html.P(f"Mapa indisponível: o ficheiro '{DISTRICTS_GEOJSON}' não foi encontrado "
+                          f"(prepare-o com fetch_districts.py e reinicie a aplicação).", style={"color": "gray"})
+
+        fig_mapa, nivel_zoom = make_map_figure(DAYS_THRESHOLD)
+        return html.Div([
+            html.H4("MAPA DE INACTIVIDADE POR DISTRITO", className="mb-4 text-uppercase",
+                    style={"color": "#16a085", "font-weight": "500"}),
+            dbc.Row([
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="dropdown-janela-mapa",
+                        options=[{"label": f"Limite de inactividade: {j} dias", "value": j} for j in ACTIVITY_WINDOWS],
+                        value=DAYS_THRESHOLD,
+                        clearable=False,
+                        style={"color": "#212529", "font-size": "14px"}
+                    ), md=4
+                ),
+            ]),
+            dcc.Store(id="mapa-nivel-zoom", data=nivel_zoom),
+            dcc.Graph(id="mapa-distritos", figure=fig_mapa, style={'height': '700px'}, className="mt-4"),
+        ])
+
+    elif pathname == "/carregar":
+        if SNAPSHOT_FILE:
+            return html.P("Modo só de leitura: os dados vêm de um instantâneo e não aceitam carregamentos.",
+                          style={"color": "gray"})
+        if fila_carregamentos is None:
+            return html.P("O carregamento de ficheiros está desactivado (UPLOAD_DIR vazio).", style={"color": "gray"})
+        return html.Div([
+            html.H4("CARREGAR NOVOS LEVANTAMENTOS", className="mb-4 text-uppercase",
+                    style={"color": "#16a085", "font-weight": "500"}),
+            dbc.Row([
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="carregamento-infra",
+                        options=[{"label": infra, "value": infra} for infra in INFRA_NAMES],
+                        value=INFRA_NAMES[0],
+                        clearable=False,
+                        style={"color": "#212529", "font-size": "14px"}
+                    ), md=4
+                ),
+            ]),
+            dcc.Upload(
+                id="carregamento-ficheiro",
+                children=html.Div([html.I(className="fas fa-upload me-2"),
+                                   "Arraste ou seleccione um ficheiro (.xlsx, .csv ou .parquet)"]),
+                multiple=False,
+                className="mt-4",
+                style={"border": "1px dashed #16a085", "border-radius": "6px", "padding": "2rem",
+                       "text-align": "center", "color": "gray", "cursor": "pointer"}
+            ),
+            html.P(f"Colunas obrigatórias: {PROVINCIA_COL}, {DISTRITO_COL}, {DATA_COL} e o código da infra "
+                   f"({', '.join(CODIGO_COLS.values())}). Os levantamentos já existentes são ignorados.",
+                   className="mt-2 small", style={"color": "gray"}),
+            dcc.Store(id="carregamento-tarefa"),
+            dcc.Interval(id="carregamento-intervalo", interval=1000, disabled=True),
+            html.Div(id="carregamento-estado", className="mt-4"),
         ])
 
     return dbc.Jumbotron([
@@ -674,5 +2248,8 @@ def render_page_content(pathname):
     ])
 
 
+# Arranque do carregamento só depois de todos os callbacks registados (o pré-aquecimento da cache usa-os)
+start_data_load()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8050, debug=True)
\ No newline at end of file
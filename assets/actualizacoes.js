@@ -0,0 +1,87 @@
+// Actualizações de dados difundidas pelo servidor (/eventos, com PUSH_EVENTS=1).
+// Cada mensagem traz só o que mudou desde a versão anterior: o texto dos KPIs e as linhas alteradas da
+// tabela de distritos. São aplicadas com dash_clientside.set_props nos componentes que estão na página,
+// sem pedir de novo render_page_content. Sem o canal (404), o EventSource fecha-se e nada acontece.
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+    var versao = null;
+
+    function props(id) {
+        var api = window.dash_component_api;
+        var componente = api && api.getLayout ? api.getLayout(id) : null;
+        return componente ? componente.props : null;
+    }
+
+    function redesenhar() {
+        // O intervalo de carregamento é uma entrada de render_page_content: a página é pedida uma vez
+        var intervalo = props('intervalo-carregamento');
+        if (intervalo) {
+            window.dash_clientside.set_props('intervalo-carregamento', {n_intervals: (intervalo.n_intervals || 0) + 1});
+        }
+    }
+
+    function aplicar(delta) {
+        var set_props = window.dash_clientside.set_props;
+        Object.keys(delta.kpis || {}).forEach(function (id) {
+            if (document.getElementById(id)) {
+                set_props(id, {children: delta.kpis[id]});
+            }
+        });
+        Object.keys(delta.linhas || {}).forEach(function (grupo) {
+            var partes = grupo.split(':');
+            var tabela = props(partes[0]);
+            var janela = props('dropdown-janela');
+            var provincia = props('dropdown-provincia');
+            if (!tabela || !janela || !provincia || String(janela.value) !== partes[1]) {
+                return;
+            }
+            var novas = {};
+            delta.linhas[grupo].forEach(function (linha) {
+                if (linha.Provincia === provincia.value) {
+                    novas[linha.Distrito] = linha;
+                }
+            });
+            if (Object.keys(novas).length) {
+                set_props(partes[0], {data: (tabela.data || []).map(function (linha) {
+                    return novas[linha.Distrito] || linha;
+                })});
+            }
+        });
+    }
+
+    function ligar() {
+        // A página é desenhada pelo Dash depois de este script correr: espera pela versão com que foi desenhada,
+        // para que uma actualização difundida entre o desenho e a ligação não se perca
+        var desenhada = document.getElementById('versao-pagina');
+        if (!desenhada) {
+            setTimeout(ligar, 500);
+            return;
+        }
+        versao = desenhada.getAttribute('data-versao');
+        var fonte = new EventSource('/eventos?versao=' + encodeURIComponent(versao));
+        fonte.addEventListener('versao', function (e) {
+            versao = JSON.parse(e.data).para;
+        });
+        fonte.addEventListener('delta', function (e) {
+            var delta = JSON.parse(e.data);
+            if (versao !== null && delta.de !== versao) {
+                redesenhar();  // perdeu-se uma actualização intermédia
+            } else {
+                aplicar(delta);
+            }
+            versao = delta.para;
+        });
+        fonte.addEventListener('recarregar', function (e) {
+            versao = JSON.parse(e.data).para;
+            redesenhar();
+        });
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', ligar);
+    } else {
+        ligar();
+    }
+})();
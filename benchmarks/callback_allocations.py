@@ -0,0 +1,122 @@
+"""
+Benchmark das alocações de memória por pedido dos callbacks (tracemalloc).
+
+Gera levantamentos sintéticos em vários volumes (os mesmos distritos, mais histórico) e, para cada
+volume, carrega-os no dashboard (CSV numa pasta temporária) e mede o pico de memória alocada por uma
+chamada de cada callback, sem a cache de resultados. O tamanho da resposta (JSON enviado ao navegador)
+é medido ao mesmo tempo.
+
+Os callbacks lêem agregados pré-calculados e vistas dos dados (copy-on-write), sem cópias defensivas:
+entre o menor e o maior volume, o pico de cada callback só pode crescer com a resposta. O benchmark
+falha (código de saída 1) se o pico crescer mais do que `--fator` vezes o crescimento da resposta, com
+uma tolerância de `--tolerancia-kb`.
+
+Nota: as alocações do pyarrow (colunas de texto do pandas 3) não são vistas pelo tracemalloc.
+
+Uso:
+    python /caminho/para/benchmarks/callback_allocations.py [--linhas 20000 80000 320000] [--anos 10]
+"""
+import argparse
+import gc
+import inspect
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import FICHEIROS, generate_all  # noqa: E402
+
+PROVINCIA = 'Nampula'
+DISTRITO = 'Nampula Distrito 00'
+JANELA = 14
+
+
+def write_csv(pasta, n_linhas, anos):
+    """Escreve os três ficheiros *_cleaned.csv sintéticos em `pasta`."""
+    for nome, df in zip(FICHEIROS, generate_all(n_linhas, anos)):
+        df.drop(columns=['Ano', 'Mes']).to_csv(os.path.join(pasta, nome.replace('.xlsx', '.csv')), index=False)
+
+
+def callbacks(app):
+    """Chamadas medidas: funções originais dos callbacks (sem a cache de resultados)."""
+    detalhe = inspect.unwrap(app.update_detail_content)
+    return {
+        'render_page_content (/)': lambda: app.render_page_content('/'),
+        'render_page_content (/provincias)': lambda: app.render_page_content('/provincias'),
+        'set_distrito_options': lambda: app.set_distrito_options(PROVINCIA),
+        'update_detail_content (província)': lambda: detalhe(PROVINCIA, None, JANELA),
+        'update_detail_content (distrito)': lambda: detalhe(PROVINCIA, DISTRITO, JANELA),
+        'update_year_comparison': lambda: app.update_year_comparison(int(app.TARGET_YEAR)),
+    }
+
+
+def measure(chamada):
+    """(pico de memória alocada durante a chamada, bytes da resposta em JSON)."""
+    from plotly.utils import PlotlyJSONEncoder
+
+    chamada()  # imports diferidos e templates das figuras fora da medição
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        resultado = chamada()
+        pico = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return pico, len(json.dumps(resultado, cls=PlotlyJSONEncoder))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[20_000, 80_000, 320_000],
+                        help='Volumes (total de levantamentos nas 3 infra)')
+    parser.add_argument('--anos', type=int, default=10)
+    parser.add_argument('--fator', type=float, default=20.0,
+                        help='Crescimento do pico permitido por byte de crescimento da resposta')
+    parser.add_argument('--tolerancia-kb', type=float, default=256.0)
+    args = parser.parse_args()
+    volumes = sorted(args.linhas)
+
+    os.environ.update(SYNC_DATA_LOAD='1', DATA_FORMATS='csv', UPLOAD_DIR='', RESULT_CACHE_VISITS='',
+                      STORAGE_BACKEND='pandas', EXCEL_CACHE_DIR='')
+    os.environ.pop('SNAPSHOT_FILE', None)
+    resultados = {}
+    app = None
+    with tempfile.TemporaryDirectory() as pasta_base:
+        for n_linhas in volumes:
+            pasta = os.path.join(pasta_base, str(n_linhas))
+            os.makedirs(pasta)
+            write_csv(pasta, n_linhas, args.anos)
+            os.chdir(pasta)
+            inicio = time.perf_counter()
+            if app is None:
+                import app  # o import carrega os dados da pasta actual
+            else:
+                app.load_data()
+            print(f"{n_linhas:,} levantamentos carregados em {time.perf_counter() - inicio:.1f} s")
+            for nome, chamada in callbacks(app).items():
+                resultados.setdefault(nome, {})[n_linhas] = measure(chamada)
+        os.chdir(PASTA_REPO)
+
+    print(f"\n{'callback':36}" + ''.join(f"{f'{n:,} linhas':>22}" for n in volumes) + "   crescimento")
+    falhou = False
+    for nome, por_volume in resultados.items():
+        (pico_menor, resposta_menor), (pico_maior, resposta_maior) = por_volume[volumes[0]], por_volume[volumes[-1]]
+        crescimento = pico_maior - pico_menor
+        permitido = max(args.tolerancia_kb * 1024, args.fator * (resposta_maior - resposta_menor))
+        estado = 'OK' if crescimento <= permitido else 'CRESCE COM OS DADOS'
+        falhou |= crescimento > permitido
+        celulas = ''.join(f"{por_volume[n][0] / 1024:>10.0f} KB/{por_volume[n][1] / 1024:>5.0f} KB" for n in volumes)
+        print(f"{nome:36}{celulas}   {crescimento / 1024:+.0f} KB [{estado}]")
+    print("\n(pico alocado / resposta JSON, por volume)")
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark do índice espacial da cobertura das comunidades (coverage.GridIndex).
+
+Gera pontos de água e comunidades sintéticos em Moçambique (em aglomerados, como aldeias à volta das
+sedes de distrito) e compara, para todas as comunidades de uma vez, a distância ao ponto de água mais
+próximo e os pontos de água dentro do raio calculados:
+  - por distâncias par a par (todas as comunidades contra todos os pontos, em blocos);
+  - pelo índice em grelha (construção + consultas).
+Os resultados das duas abordagens têm de ser iguais.
+
+Uso:
+    python /caminho/para/benchmarks/coverage_index.py [--pontos 50000] [--comunidades 100000] [--raio-km 0.5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_REPO)
+
+from coverage import GridIndex, chord_to_km, km_to_chord, to_cartesian  # noqa: E402
+
+LIMITES = {'lat': (-26.9, -10.5), 'lon': (30.2, 40.8)}
+
+
+def clustered_points(n, centros, dispersao_graus, rng):
+    """`n` pontos à volta de `centros` (lat, lon), com dispersão normal de `dispersao_graus`."""
+    escolha = rng.integers(0, len(centros), n)
+    return (centros[escolha, 0] + rng.normal(0, dispersao_graus, n),
+            centros[escolha, 1] + rng.normal(0, dispersao_graus, n))
+
+
+def pairwise(lat, lon, lat_pontos, lon_pontos, raio_km, bloco=500):
+    """Distância ao mais próximo e contagem no raio por comparação com todos os pontos."""
+    consultas, pontos = to_cartesian(lat, lon), to_cartesian(lat_pontos, lon_pontos)
+    corda2 = km_to_chord(raio_km) ** 2
+    melhor, contagem = np.empty(len(consultas)), np.empty(len(consultas), dtype=np.int64)
+    for i in range(0, len(consultas), bloco):
+        d2 = ((consultas[i:i + bloco, None, :] - pontos[None, :, :]) ** 2).sum(axis=2)
+        melhor[i:i + bloco], contagem[i:i + bloco] = d2.min(axis=1), (d2 <= corda2).sum(axis=1)
+    return chord_to_km(np.sqrt(melhor)), contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pontos', type=int, default=50_000, help='Pontos de água (Fontes + SAA)')
+    parser.add_argument('--comunidades', type=int, default=100_000)
+    parser.add_argument('--raio-km', type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centros = np.column_stack([rng.uniform(*LIMITES['lat'], 150), rng.uniform(*LIMITES['lon'], 150)])
+    lat_pontos, lon_pontos = clustered_points(args.pontos, centros, 0.15, rng)
+    lat, lon = clustered_points(args.comunidades, centros, 0.2, rng)
+    print(f"{args.pontos} pontos de água, {args.comunidades} comunidades, raio de {args.raio_km} km")
+
+    inicio = time.perf_counter()
+    indice = GridIndex(lat_pontos, lon_pontos, celula_minima_km=args.raio_km)
+    construcao = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    distancia, contagem = indice.nearest(lat, lon), indice.count_within(lat, lon, args.raio_km)
+    consultas = time.perf_counter() - inicio
+    print(f"índice em grelha: construção {construcao:.3f} s (células de {indice.celula:.1f} km), "
+          f"consultas {consultas:.3f} s")
+
+    inicio = time.perf_counter()
+    distancia_pares, contagem_pares = pairwise(lat, lon, lat_pontos, lon_pontos, args.raio_km)
+    pares = time.perf_counter() - inicio
+    print(f"par a par: {pares:.3f} s ({pares / (construcao + consultas):.0f}x mais lento)")
+
+    iguais = np.allclose(distancia, distancia_pares) and np.array_equal(contagem, contagem_pares)
+    print(f"resultados iguais: {'sim' if iguais else 'NÃO'}; comunidades sem cobertura: "
+          f"{int((contagem == 0).sum())}; distância mediana: {np.median(distancia):.2f} km")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark do cubo de contagens (ano x mês x província x distrito x infra) e da comparação anual.
+
+Gera levantamentos sintéticos nacionais (10 anos por omissão), mede a construção do cubo, o seu tamanho,
+as consultas por recorte (totais por província, por ano e por mês) e o callback completo de comparação
+anual do dashboard, que deve responder em menos de `--limite-ms` (50 ms).
+
+Uso:
+    python /caminho/para/benchmarks/cube_comparisons.py [--linhas 1000000] [--anos 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cube import build_count_cube, monthly_totals, province_totals, yearly_totals  # noqa: E402
+from synthetic_data import generate_all  # noqa: E402
+
+
+def timed_ms(funcao, repeticoes):
+    """Mediana (ms) de `repeticoes` chamadas."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return float(np.median(tempos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=1_000_000, help='Total de levantamentos (3 infra)')
+    parser.add_argument('--anos', type=int, default=10)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--limite-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    dfs_infra = generate_all(args.linhas, args.anos)
+    inicio = time.perf_counter()
+    cubo = build_count_cube(dfs_infra, 'Provincia', 'Distrito')
+    construcao_s = time.perf_counter() - inicio
+    contagens = cubo['contagens']
+    assert int(contagens.sum()) == sum(len(d) for d in dfs_infra)
+    print(f"Levantamentos: {args.linhas:,} em {args.anos} anos")
+    print(f"Cubo: forma {contagens.shape}, {contagens.nbytes / 1024:.0f} KB, construído em {construcao_s:.2f} s")
+
+    ano = int(cubo['anos'][-1])
+    provincia = cubo['provincias'][0]
+    consultas = {
+        'province_totals (ano)': lambda: province_totals(cubo, ano),
+        'yearly_totals (nacional)': lambda: yearly_totals(cubo),
+        'yearly_totals (província)': lambda: yearly_totals(cubo, provincia),
+        'monthly_totals (ano, província)': lambda: monthly_totals(cubo, ano, provincia),
+    }
+    for nome, consulta in consultas.items():
+        print(f"  {nome:34} {timed_ms(consulta, args.repeticoes):8.3f} ms")
+
+    # Callback completo (KPIs + 3 figuras) com o cubo sintético no lugar do cubo carregado
+    os.environ['SYNC_DATA_LOAD'] = '1'
+    import app
+    app.cubo_contagens = cubo
+    app.update_year_comparison(ano)  # primeira chamada prepara o template das figuras
+    callback_ms = timed_ms(lambda: app.update_year_comparison(ano), args.repeticoes)
+    estado = 'OK' if callback_ms < args.limite_ms else 'ACIMA DO LIMITE'
+    print(f"  {'update_year_comparison (callback)':34} {callback_ms:8.3f} ms  [{estado}: < {args.limite_ms:.0f} ms]")
+
+
+if __name__ == '__main__':
+    main()
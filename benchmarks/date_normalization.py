@@ -0,0 +1,103 @@
+"""
+Benchmark da normalização de datas em formatos mistos (Data_Levantamento).
+
+Gera uma coluna com N valores misturados como aparecem nos ficheiros (datas do Excel, números de série
+do Excel, texto ISO, texto dd/mm/aaaa com e sem hora, aaaammdd e algum lixo) e compara, em tempo,
+valores/s e valores convertidos correctamente:
+  - pd.to_datetime(errors='coerce'), que infere um único formato a partir do primeiro valor;
+  - pd.to_datetime(format='mixed', dayfirst=True), que interpreta valor a valor;
+  - dates.normalize_dates, que classifica os valores por família e converte cada família de uma vez.
+
+Uso:
+    python /caminho/para/benchmarks/date_normalization.py [--valores 1000000] [--repeticoes 3] [--texto]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_REPO)
+
+from dates import ORIGEM_EXCEL, describe_report, normalize_dates  # noqa: E402
+
+# Proporção de cada família na coluna gerada
+MISTURA = {'iso': 0.40, 'dd/mm/aaaa': 0.25, 'dd/mm/aaaa hh:mm': 0.05, 'serie_excel': 0.10,
+           'data_hora': 0.10, 'aaaammdd': 0.05, 'lixo': 0.05}
+
+
+def generate_mixed(n_valores, semente=0, so_texto=False):
+    """(coluna de valores mistos, datas esperadas). Com `so_texto`, tudo como texto (como num CSV)."""
+    rng = np.random.default_rng(semente)
+    esperadas = pd.Series(pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, n_valores), unit='D'))
+    familias = rng.choice(list(MISTURA), size=n_valores, p=list(MISTURA.values()))
+    valores = pd.Series(pd.NA, index=esperadas.index, dtype=object)
+
+    def preencher(familia, funcao):
+        mascara = familias == familia
+        valores[mascara] = funcao(esperadas[mascara]).to_numpy(dtype=object)
+
+    preencher('iso', lambda d: d.dt.strftime('%Y-%m-%d'))
+    preencher('dd/mm/aaaa', lambda d: d.dt.strftime('%d/%m/%Y'))
+    preencher('dd/mm/aaaa hh:mm', lambda d: d.dt.strftime('%d/%m/%Y 00:00'))
+    preencher('aaaammdd', lambda d: d.dt.strftime('%Y%m%d'))
+    preencher('serie_excel', lambda d: (d - pd.Timestamp(ORIGEM_EXCEL)).dt.days)
+    preencher('data_hora', lambda d: pd.Series([t.to_pydatetime() for t in d], index=d.index))
+    preencher('lixo', lambda d: pd.Series('sem data', index=d.index))
+    esperadas[familias == 'lixo'] = pd.NaT
+    if so_texto:
+        valores = valores.astype(str)
+    return valores, esperadas
+
+
+def best_time(funcao, repeticoes):
+    melhor, resultado = float('inf'), None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--valores', type=int, default=1_000_000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--texto', action='store_true', help='Todos os valores como texto (como num CSV)')
+    args = parser.parse_args()
+
+    valores, esperadas = generate_mixed(args.valores, so_texto=args.texto)
+    validos = int(esperadas.notna().sum())
+    print(f"{len(valores)} valores ({'texto' if args.texto else 'objectos mistos'}), {validos} datas válidas")
+
+    def coerce():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # "Could not infer format": é precisamente o caso medido
+            return pd.to_datetime(valores, errors='coerce')
+
+    def mixed():
+        return pd.to_datetime(valores.astype(str), format='mixed', dayfirst=True, errors='coerce')
+
+    relatorio = {}
+
+    def normalizado():
+        datas, relatorio_datas = normalize_dates(valores, minimo='2000-01-01')
+        relatorio.update(relatorio_datas)
+        return datas
+
+    print(f"{'método':40} {'tempo (s)':>10} {'valores/s':>12} {'correctas':>10}")
+    for nome, funcao in [("pd.to_datetime(errors='coerce')", coerce),
+                         ("pd.to_datetime(format='mixed')", mixed),
+                         ('normalize_dates', normalizado)]:
+        tempo, datas = best_time(funcao, args.repeticoes)
+        correctas = int((datas.dt.normalize() == esperadas).sum())
+        print(f"{nome:40} {tempo:>10.3f} {len(valores) / tempo:>12,.0f} {correctas / validos:>10.1%}")
+    print(f"normalize_dates: {describe_report(relatorio)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Relatório de tempo de arranque do dashboard, baseado em `python -X importtime`.
+
+Mede, num processo novo, o tempo de import de `app` (o que o gunicorn espera antes de aceitar
+ligações), os módulos mais pesados e, opcionalmente, o tempo até os dados ficarem prontos.
+
+Uso (a partir da pasta com os ficheiros *_cleaned.xlsx):
+    python /caminho/para/benchmarks/import_time.py [--top 15] [--ate-pronto]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT_ATE_PRONTO = """
+import sys, time
+sys.path.insert(0, {repo!r})
+inicio = time.perf_counter()
+import app
+import_s = time.perf_counter() - inicio
+app.DADOS_PRONTOS.wait()
+print(f"{{import_s:.3f}} {{time.perf_counter() - inicio:.3f}} {{app.estado_carregamento['estado']}}")
+"""
+
+
+def parse_importtime(stderr):
+    """Converte as linhas 'import time: self | cumulative | módulo' em tuplos (self_us, cumulativo_us, módulo)."""
+    linhas = []
+    for linha in stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        self_us, cumulativo_us, modulo = linha[len('import time:'):].split('|')
+        linhas.append((int(self_us), int(cumulativo_us), modulo.rstrip()))
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15, help='Número de pacotes de topo a listar')
+    parser.add_argument('--ate-pronto', action='store_true', help='Mede também o tempo até DADOS_PRONTOS')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop('SYNC_DATA_LOAD', None)
+    codigo = f"import sys; sys.path.insert(0, {PASTA_REPO!r}); import app"
+    resultado = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                               capture_output=True, text=True, env=env)
+    linhas = parse_importtime(resultado.stderr)
+    if not linhas:
+        print(resultado.stderr)
+        sys.exit(1)
+
+    total_app = next(cumulativo for _, cumulativo, modulo in linhas if modulo.strip() == 'app')
+    # Pacotes importados directamente por app (nível de indentação 1 na árvore do -X importtime)
+    directos = [(cumulativo, modulo.strip()) for _, cumulativo, modulo in linhas
+                if len(modulo) - len(modulo.lstrip()) == 3]
+    importados = {modulo.strip() for _, _, modulo in linhas}
+
+    print(f"Import de 'app': {total_app / 1e6:.3f} s")
+    print(f"plotly.express importado no arranque: {'sim' if 'plotly.express' in importados else 'não'}")
+    print(f"\nTop {args.top} imports directos (cumulativo):")
+    for cumulativo, modulo in sorted(directos, reverse=True)[:args.top]:
+        print(f"  {cumulativo / 1e3:10.1f} ms  {modulo}")
+
+    if args.ate_pronto:
+        resultado = subprocess.run([sys.executable, '-c', SCRIPT_ATE_PRONTO.format(repo=PASTA_REPO)],
+                                   capture_output=True, text=True, env=env)
+        import_s, pronto_s, estado = resultado.stdout.strip().splitlines()[-1].split()
+        print(f"\nImport (novo processo): {float(import_s):.3f} s; dados prontos após {float(pronto_s):.3f} s "
+              f"(estado: {estado})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark de leitura dos levantamentos por formato (Excel, CSV, Parquet) com os dados sintéticos.
+
+Escreve o mesmo dataframe sintético (Fontes) em .xlsx, .csv e .parquet numa pasta temporária e mede,
+para cada leitor, o tempo de leitura das colunas usadas pelo dashboard (Provincia, Distrito,
+Data_Levantamento, Codigo_Fonte) e o débito em linhas/s. Os leitores pyarrow (CSV e Parquet) lêem só
+essas colunas, com várias threads; os leitores de Excel interpretam sempre o ficheiro inteiro.
+
+Uso:
+    python /caminho/para/benchmarks/ingest_formats.py [--linhas 50000] [--anos 10] [--repeticoes 3]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_REPO)
+
+from excel_incremental import read_excel_incremental  # noqa: E402
+from ingest import read_csv_columns, read_parquet_columns  # noqa: E402
+from synthetic_data import generate_surveys  # noqa: E402
+
+COLUNAS = ['Provincia', 'Distrito', 'Data_Levantamento', 'Codigo_Fonte']
+
+
+def best_time(funcao, repeticoes):
+    """Melhor tempo (s) de `repeticoes` execuções e o número de linhas lidas."""
+    melhor, linhas = float('inf'), 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        linhas = len(funcao())
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=50000)
+    parser.add_argument('--anos', type=int, default=10)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='sinas_formatos_')
+    try:
+        df = generate_surveys(args.linhas, args.anos).drop(columns=['Ano', 'Mes'])
+        caminhos = {formato: os.path.join(pasta, f'fontes_cleaned.{formato}') for formato in ('xlsx', 'csv', 'parquet')}
+        df.to_excel(caminhos['xlsx'], index=False)
+        df.to_csv(caminhos['csv'], index=False)
+        df.to_parquet(caminhos['parquet'], index=False)
+        pasta_cache = os.path.join(pasta, 'cache_excel')
+
+        leitores = [
+            ('xlsx', 'pd.read_excel', lambda: pd.read_excel(caminhos['xlsx'], usecols=COLUNAS)),
+            # Sem cache: cada repetição interpreta todos os blocos (primeira leitura)
+            ('xlsx', 'incremental (frio)', lambda: (shutil.rmtree(pasta_cache, ignore_errors=True),
+                                                    read_excel_incremental(caminhos['xlsx'], pasta_cache)[0])[1]),
+            ('xlsx', 'incremental (sem alterações)', lambda: read_excel_incremental(caminhos['xlsx'], pasta_cache)[0]),
+            ('csv', 'pd.read_csv (todas as colunas)', lambda: pd.read_csv(caminhos['csv'])),
+            ('csv', 'pd.read_csv (usecols)', lambda: pd.read_csv(caminhos['csv'], usecols=COLUNAS)),
+            ('csv', 'pyarrow (colunas, threads)', lambda: read_csv_columns(caminhos['csv'], COLUNAS)),
+            ('parquet', 'pyarrow (colunas, threads)', lambda: read_parquet_columns(caminhos['parquet'], COLUNAS)),
+        ]
+
+        print(f"{len(df)} linhas sintéticas; tamanhos: " +
+              ', '.join(f"{f} {os.path.getsize(c) / 1024 ** 2:.1f} MB" for f, c in caminhos.items()))
+        print(f"{'formato':8} {'leitor':32} {'tempo (s)':>10} {'linhas/s':>12} {'MB/s':>8}")
+        for formato, nome, funcao in leitores:
+            tempo, linhas = best_time(funcao, args.repeticoes)
+            mb = os.path.getsize(caminhos[formato]) / 1024 ** 2
+            print(f"{formato:8} {nome:32} {tempo:>10.3f} {linhas / tempo:>12,.0f} {mb / tempo:>8.1f}")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
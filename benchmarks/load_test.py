@@ -0,0 +1,251 @@
+"""
+Teste de carga: utilizadores simultâneos a navegar no dashboard, para várias configurações do gunicorn.
+
+Cada utilizador simulado repete sessões realistas contra /_dash-update-component: abre a página
+inicial, abre a página de províncias, escolhe uma província (opções de distrito + resumo) e desce a
+alguns distritos, com pausas aleatórias entre cliques. Para cada combinação de workers e threads
+arranca o gunicorn com a configuração do projecto e mede o débito, as latências p50/p95/p99 por
+callback e a taxa de erros.
+
+Uso (a partir da pasta com os ficheiros *_cleaned.xlsx, ou com dados sintéticos):
+    python /caminho/para/benchmarks/load_test.py [--workers 1 2 4] [--threads 1 4] [--utilizadores 20]
+        [--duracao 30] [--pausa 0.5] [--sintetico 100000] [--preload] [--json resultados.json]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from memory_workers import PASTA_REPO, free_port
+
+JANELA = 14
+
+
+def page_request(pathname):
+    return {'output': 'page-content.children', 'outputs': {'id': 'page-content', 'property': 'children'},
+            'inputs': [{'id': 'url', 'property': 'pathname', 'value': pathname},
+                       {'id': 'intervalo-carregamento', 'property': 'n_intervals', 'value': None}],
+            'changedPropIds': ['url.pathname']}
+
+
+def district_options_request(provincia):
+    propriedades = ('options', 'disabled', 'value')
+    return {'output': '..' + '...'.join(f'dropdown-distrito.{p}' for p in propriedades) + '..',
+            'outputs': [{'id': 'dropdown-distrito', 'property': p} for p in propriedades],
+            'inputs': [{'id': 'dropdown-provincia', 'property': 'value', 'value': provincia}],
+            'changedPropIds': ['dropdown-provincia.value']}
+
+
+def detail_request(provincia, distrito, janela=JANELA):
+    return {'output': 'provincia-content.children', 'outputs': {'id': 'provincia-content', 'property': 'children'},
+            'inputs': [{'id': 'dropdown-provincia', 'property': 'value', 'value': provincia},
+                       {'id': 'dropdown-distrito', 'property': 'value', 'value': distrito},
+                       {'id': 'dropdown-janela', 'property': 'value', 'value': janela}],
+            'changedPropIds': ['dropdown-distrito.value' if distrito else 'dropdown-provincia.value']}
+
+
+def post_callback(porta, pedido, timeout_s=120):
+    dados = json.dumps(pedido).encode()
+    req = urllib.request.Request(f'http://127.0.0.1:{porta}/_dash-update-component', data=dados,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout_s) as resposta:
+        return json.loads(resposta.read())
+
+
+def find_component(arvore, id_componente):
+    """Procura (em profundidade) as props do componente com o id dado na resposta JSON de um callback."""
+    if isinstance(arvore, dict):
+        props = arvore.get('props')
+        if isinstance(props, dict) and props.get('id') == id_componente:
+            return props
+        valores = arvore.values()
+    elif isinstance(arvore, list):
+        valores = arvore
+    else:
+        return None
+    for valor in valores:
+        encontrado = find_component(valor, id_componente)
+        if encontrado is not None:
+            return encontrado
+    return None
+
+
+def discover_districts(porta):
+    """{província: [distritos]} lido das próprias respostas do dashboard (como um utilizador veria)."""
+    resposta = post_callback(porta, page_request('/provincias'))
+    dropdown = find_component(resposta, 'dropdown-provincia') or {}
+    distritos = {}
+    for opcao in dropdown.get('options', []):
+        provincia = opcao['value'] if isinstance(opcao, dict) else opcao
+        saida = post_callback(porta, district_options_request(provincia))['response']['dropdown-distrito']
+        distritos[provincia] = [o['value'] if isinstance(o, dict) else o for o in saida['options']]
+    return distritos
+
+
+def session_steps(distritos, rng, max_distritos=3):
+    """Sequência de (callback, pedido) de uma sessão: início, províncias, uma província e alguns distritos."""
+    provincia = rng.choice(sorted(distritos))
+    passos = [('render_page_content /', page_request('/')),
+              ('render_page_content /provincias', page_request('/provincias')),
+              ('set_distrito_options', district_options_request(provincia)),
+              ('update_detail_content (provincia)', detail_request(provincia, None))]
+    opcoes = distritos[provincia]
+    for distrito in rng.sample(opcoes, min(len(opcoes), rng.randint(1, max_distritos))):
+        passos.append(('update_detail_content (distrito)', detail_request(provincia, distrito)))
+    return passos
+
+
+def simulated_user(porta, distritos, fim, pausa_s, semente, registos):
+    """Repete sessões até `fim`; cada pedido é registado como (callback, latência em s, sucesso)."""
+    rng = random.Random(semente)
+    while time.time() < fim:
+        for callback, pedido in session_steps(distritos, rng):
+            if time.time() >= fim:
+                return
+            inicio = time.perf_counter()
+            try:
+                post_callback(porta, pedido)
+                sucesso = True
+            except (urllib.error.URLError, OSError, ValueError):
+                sucesso = False
+            registos.append((callback, time.perf_counter() - inicio, sucesso))
+            if pausa_s:
+                time.sleep(rng.uniform(0, 2 * pausa_s))  # pausa média de `pausa_s` entre cliques
+
+
+def wait_ready(porta, processo, n_workers, timeout_s):
+    """Espera até /healthz responder 200 várias vezes seguidas (cada pedido pode cair num worker diferente)."""
+    limite, seguidos = time.time() + timeout_s, 0
+    while seguidos < 2 * n_workers:
+        if time.time() > limite or processo.poll() is not None:
+            raise RuntimeError("gunicorn não ficou pronto")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{porta}/healthz', timeout=10):
+                seguidos += 1
+        except (urllib.error.URLError, OSError):
+            seguidos = 0
+            time.sleep(0.5)
+
+
+def percentile(valores_ordenados, p):
+    if not valores_ordenados:
+        return float('nan')
+    return valores_ordenados[min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))]
+
+
+def summarize(registos, duracao_s):
+    """Por callback (e total): pedidos, débito (pedidos/s), latências p50/p95/p99 (ms) e taxa de erros."""
+    grupos = defaultdict(list)
+    for callback, latencia, sucesso in registos:
+        grupos[callback].append((latencia, sucesso))
+        grupos['TOTAL'].append((latencia, sucesso))
+    resumo = {}
+    for callback, valores in grupos.items():
+        latencias = sorted(l for l, ok in valores if ok)
+        erros = sum(1 for _, ok in valores if not ok)
+        resumo[callback] = {
+            'pedidos': len(valores),
+            'debito': len(valores) / duracao_s,
+            'p50_ms': percentile(latencias, 50) * 1000,
+            'p95_ms': percentile(latencias, 95) * 1000,
+            'p99_ms': percentile(latencias, 99) * 1000,
+            'erros': erros / len(valores),
+        }
+    return resumo
+
+
+def run_case(pasta, n_workers, n_threads, args):
+    porta = free_port()
+    env = dict(os.environ)
+    env['PYTHONUNBUFFERED'] = '1'
+    env.pop('PRELOAD_APP', None)
+    if args.preload:
+        env['PRELOAD_APP'] = '1'
+    else:
+        env['SYNC_DATA_LOAD'] = '1'
+    if args.sem_cache:
+        env['RESULT_CACHE_MAX_MB'] = '0'
+        env.pop('RESULT_CACHE_DB', None)
+
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', os.path.join(PASTA_REPO, 'gunicorn.conf.py'),
+           '--pythonpath', PASTA_REPO, '--workers', str(n_workers), '--threads', str(n_threads),
+           '--bind', f'127.0.0.1:{porta}']
+    processo = subprocess.Popen(cmd, cwd=pasta, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(porta, processo, n_workers, args.timeout)
+        distritos = discover_districts(porta)
+        if not distritos:
+            raise RuntimeError("nenhuma província encontrada na página de províncias")
+
+        registos = []  # list.append é atómico: partilhada pelas threads dos utilizadores
+        fim = time.time() + args.duracao
+        utilizadores = [threading.Thread(target=simulated_user,
+                                         args=(porta, distritos, fim, args.pausa, args.semente + i, registos))
+                        for i in range(args.utilizadores)]
+        inicio = time.perf_counter()
+        for u in utilizadores:
+            u.start()
+        for u in utilizadores:
+            u.join()
+        return summarize(registos, time.perf_counter() - inicio)
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def prepare_synthetic(n_linhas, anos):
+    """Escreve os três ficheiros sintéticos numa pasta temporária (sem geojson: o mapa fica indisponível)."""
+    from synthetic_data import FICHEIROS, generate_all
+
+    pasta = tempfile.mkdtemp(prefix='sinas_carga_')
+    for nome, df in zip(FICHEIROS, generate_all(n_linhas, anos)):
+        df.drop(columns=['Ano', 'Mes']).to_excel(os.path.join(pasta, nome), index=False)
+    print(f"Dados sintéticos ({n_linhas} linhas) em {pasta}")
+    return pasta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4], help='Threads por worker (gthread)')
+    parser.add_argument('--utilizadores', type=int, default=20, help='Utilizadores simultâneos')
+    parser.add_argument('--duracao', type=float, default=30, help='Duração (s) de cada configuração')
+    parser.add_argument('--pausa', type=float, default=0.5, help='Pausa média (s) entre cliques; 0 = sem pausas')
+    parser.add_argument('--sintetico', type=int, default=0, help='Gera N linhas sintéticas em vez de usar a pasta actual')
+    parser.add_argument('--anos', type=int, default=10, help='Anos dos dados sintéticos')
+    parser.add_argument('--preload', action='store_true', help='Arranca o gunicorn com PRELOAD_APP=1')
+    parser.add_argument('--sem-cache', action='store_true', help='Desactiva a cache de resultados dos callbacks')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--timeout', type=int, default=600, help='Tempo máximo (s) para os dados carregarem')
+    parser.add_argument('--json', help='Grava também os resultados completos neste ficheiro')
+    args = parser.parse_args()
+
+    pasta = prepare_synthetic(args.sintetico, args.anos) if args.sintetico else os.getcwd()
+
+    resultados = []
+    print(f"{'workers':>7} {'threads':>7} {'callback':34} {'pedidos':>8} {'pedidos/s':>9} "
+          f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'erros':>7}")
+    for n_workers in args.workers:
+        for n_threads in args.threads:
+            resumo = run_case(pasta, n_workers, n_threads, args)
+            resultados.append({'workers': n_workers, 'threads': n_threads, 'callbacks': resumo})
+            for callback in sorted(resumo, key=lambda c: (c == 'TOTAL', c)):
+                r = resumo[callback]
+                print(f"{n_workers:>7} {n_threads:>7} {callback:34} {r['pedidos']:>8} {r['debito']:>9.1f} "
+                      f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['erros']:>7.1%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark de memória por worker do gunicorn (RSS e PSS), com e sem o modo preload.
+
+Para cada número de workers arranca o gunicorn com a configuração do projecto, espera que os dados
+estejam carregados, faz alguns pedidos reais aos callbacks (para os workers lerem os dados) e lê
+/proc/<pid>/smaps_rollup do master e de cada worker. O PSS divide as páginas partilhadas pelos
+processos que as usam: com preload + dados compactados, o PSS total deve crescer pouco por worker.
+
+Só funciona em Linux. Uso (a partir da pasta com os ficheiros *_cleaned.xlsx):
+    python /caminho/para/benchmarks/memory_workers.py [--workers 1 4 8] [--modos preload normal]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+PASTA_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pedidos de aquecimento: página inicial e resumo de uma província
+PEDIDOS_AQUECIMENTO = [
+    {'output': 'page-content.children', 'outputs': {'id': 'page-content', 'property': 'children'},
+     'inputs': [{'id': 'url', 'property': 'pathname', 'value': '/'},
+                {'id': 'intervalo-carregamento', 'property': 'n_intervals', 'value': None}],
+     'changedPropIds': ['url.pathname']},
+    {'output': 'provincia-content.children', 'outputs': {'id': 'provincia-content', 'property': 'children'},
+     'inputs': [{'id': 'dropdown-provincia', 'property': 'value', 'value': None},
+                {'id': 'dropdown-distrito', 'property': 'value', 'value': None},
+                {'id': 'dropdown-janela', 'property': 'value', 'value': 14}],
+     'changedPropIds': ['dropdown-provincia.value']},
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid):
+    """Rss e Pss (kB) de um processo, a partir de /proc/<pid>/smaps_rollup."""
+    valores = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for linha in f:
+            partes = linha.split()
+            if partes[0] in ('Rss:', 'Pss:'):
+                valores[partes[0][:-1]] = int(partes[1])
+    return valores
+
+
+def child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def first_province(porta):
+    """Primeira província disponível (lida da página de províncias) para os pedidos de aquecimento."""
+    pedido = dict(PEDIDOS_AQUECIMENTO[0])
+    pedido['inputs'] = [{'id': 'url', 'property': 'pathname', 'value': '/provincias'},
+                        {'id': 'intervalo-carregamento', 'property': 'n_intervals', 'value': None}]
+    resposta = post_callback(porta, pedido)
+    texto = json.dumps(resposta)
+    inicio = texto.index('"options": [{"label": "') + len('"options": [{"label": "')
+    return texto[inicio:texto.index('"', inicio)]
+
+
+def post_callback(porta, pedido):
+    dados = json.dumps(pedido).encode()
+    req = urllib.request.Request(f'http://127.0.0.1:{porta}/_dash-update-component', data=dados,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=120) as resposta:
+        return json.loads(resposta.read())
+
+
+def run_case(modo, n_workers, n_pedidos, timeout_s):
+    porta = free_port()
+    env = dict(os.environ)
+    env.pop('PRELOAD_APP', None)
+    env['PYTHONUNBUFFERED'] = '1'
+    if modo == 'preload':
+        env['PRELOAD_APP'] = '1'
+    else:
+        # Cada worker carrega os dados no seu próprio import
+        env['SYNC_DATA_LOAD'] = '1'
+
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', os.path.join(PASTA_REPO, 'gunicorn.conf.py'),
+           '--pythonpath', PASTA_REPO, '--workers', str(n_workers), '--bind', f'127.0.0.1:{porta}']
+    processo = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    carregados = []
+    threading.Thread(target=lambda: [carregados.append(l) for l in processo.stdout if 'Dados carregados' in l],
+                     daemon=True).start()
+    esperados = 1 if modo == 'preload' else n_workers
+    try:
+        limite = time.time() + timeout_s
+        while len(carregados) < esperados:
+            if time.time() > limite or processo.poll() is not None:
+                raise RuntimeError(f"gunicorn ({modo}, {n_workers} workers) não ficou pronto")
+            time.sleep(0.5)
+
+        provincia = first_province(porta)
+        PEDIDOS_AQUECIMENTO[1]['inputs'][0]['value'] = provincia
+        for i in range(n_pedidos):
+            post_callback(porta, PEDIDOS_AQUECIMENTO[i % len(PEDIDOS_AQUECIMENTO)])
+        time.sleep(1)
+
+        master = memory_kb(processo.pid)
+        workers = [memory_kb(pid) for pid in child_pids(processo.pid)]
+        return master, workers
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--modos', nargs='+', default=['preload', 'normal'], choices=['preload', 'normal'])
+    parser.add_argument('--pedidos', type=int, default=40, help='Pedidos de aquecimento por configuração')
+    parser.add_argument('--timeout', type=int, default=600, help='Tempo máximo (s) para os dados carregarem')
+    args = parser.parse_args()
+
+    print(f"{'modo':8} {'workers':>7} {'RSS/worker (MB)':>16} {'PSS/worker (MB)':>16} "
+          f"{'PSS master (MB)':>16} {'PSS total (MB)':>15}")
+    for modo in args.modos:
+        for n_workers in args.workers:
+            master, workers = run_case(modo, n_workers, args.pedidos, args.timeout)
+            rss_medio = sum(w['Rss'] for w in workers) / len(workers) / 1024
+            pss_medio = sum(w['Pss'] for w in workers) / len(workers) / 1024
+            pss_total = (master['Pss'] + sum(w['Pss'] for w in workers)) / 1024
+            print(f"{modo:8} {n_workers:>7} {rss_medio:>16.1f} {pss_medio:>16.1f} "
+                  f"{master['Pss'] / 1024:>16.1f} {pss_total:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
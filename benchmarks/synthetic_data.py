@@ -0,0 +1,82 @@
+"""
+Gerador de levantamentos sintéticos com a estrutura dos ficheiros *_cleaned.xlsx.
+
+Usado pelos benchmarks para simular volumes nacionais (vários anos, todas as províncias) sem depender
+dos dados reais. Também pode escrever os três ficheiros numa pasta:
+    python /caminho/para/benchmarks/synthetic_data.py --pasta /tmp/sinas --linhas 200000 --anos 10
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+PROVINCIAS = ['Cabo Delgado', 'Gaza', 'Inhambane', 'Manica', 'Maputo Provincia', 'Nampula', 'Niassa', 'Sofala',
+              'Tete', 'Zambezia']
+DISTRITOS_POR_PROVINCIA = 16
+
+# Nome do ficheiro e coluna de código de cada infra (como no app.py)
+FICHEIROS = {
+    'fontes_cleaned.xlsx': 'Codigo_Fonte',
+    'saa_cleaned.xlsx': 'Codigo_SAA',
+    'comunidades_cleaned.xlsx': 'Codigo_Comunidade',
+}
+
+
+def generate_surveys(n_linhas, anos=10, codigo_col='Codigo_Fonte', ano_final=2025, n_codigos=None, seed=0):
+    """
+    Levantamentos aleatórios distribuídos por `anos` anos (até `ano_final`), províncias e distritos.
+
+    Cada código de infra pertence a um único distrito, como nos dados reais. Devolve as colunas
+    Data_Levantamento, Posto_Administrativo, Provincia, Distrito, Localidade, `codigo_col`, Ano e Mes.
+    """
+    rng = np.random.default_rng(seed)
+    n_codigos = n_codigos or max(1, n_linhas // 4)
+    n_distritos = len(PROVINCIAS) * DISTRITOS_POR_PROVINCIA
+
+    distrito_codigo = rng.integers(0, n_distritos, n_codigos)
+    codigos = rng.integers(0, n_codigos, n_linhas)
+    distrito = distrito_codigo[codigos]
+    provincia = distrito // DISTRITOS_POR_PROVINCIA
+
+    inicio = np.datetime64(f'{ano_final - anos + 1}-01-01')
+    dias = (np.datetime64(f'{ano_final + 1}-01-01') - inicio).astype(int)
+    datas = pd.to_datetime(inicio + rng.integers(0, dias, n_linhas).astype('timedelta64[D]'))
+
+    nomes_provincia = np.asarray(PROVINCIAS, dtype=object)[provincia]
+    df = pd.DataFrame({
+        'Data_Levantamento': datas,
+        'Posto_Administrativo': [f'Posto {d % 4}' for d in distrito],
+        'Provincia': nomes_provincia,
+        'Distrito': [f'{p} Distrito {d % DISTRITOS_POR_PROVINCIA:02d}' for p, d in zip(nomes_provincia, distrito)],
+        'Localidade': [f'Localidade {c % 7}' for c in codigos],
+        codigo_col: [f'{codigo_col[7:10].upper()}-{c:07d}' for c in codigos],
+    })
+    df['Ano'] = df['Data_Levantamento'].dt.year
+    df['Mes'] = df['Data_Levantamento'].dt.month
+    return df
+
+
+def generate_all(n_linhas, anos=10, seed=0):
+    """Os três dataframes (Fontes, SAA, Comunidades), com metade das linhas em Fontes."""
+    partes = (n_linhas // 2, n_linhas // 5, n_linhas - n_linhas // 2 - n_linhas // 5)
+    return [generate_surveys(n, anos, codigo_col, seed=seed + i)
+            for i, (n, codigo_col) in enumerate(zip(partes, FICHEIROS.values()))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pasta', required=True, help='Pasta onde escrever os ficheiros *_cleaned.xlsx')
+    parser.add_argument('--linhas', type=int, default=100000, help='Total de linhas (3 infra)')
+    parser.add_argument('--anos', type=int, default=10)
+    args = parser.parse_args()
+
+    os.makedirs(args.pasta, exist_ok=True)
+    for nome, df in zip(FICHEIROS, generate_all(args.linhas, args.anos)):
+        caminho = os.path.join(args.pasta, nome)
+        df.drop(columns=['Ano', 'Mes']).to_excel(caminho, index=False)
+        print(f"{caminho}: {len(df)} linhas")
+
+
+if __name__ == '__main__':
+    main()
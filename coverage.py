@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# COBERTURA DAS COMUNIDADES POR PONTOS DE ÁGUA (ÍNDICE ESPACIAL EM GRELHA)
+# =========================
+# Os pontos de água (Fontes e SAA com coordenadas) são arrumados numa grelha de células cúbicas sobre as
+# coordenadas cartesianas (km) na esfera terrestre. A distância em linha recta (corda) cresce com a
+# distância ao longo da superfície, por isso a grelha dá resultados exactos, sem projecção. Todas as
+# comunidades são consultadas de uma vez e cada uma só é comparada com os pontos das células vizinhas:
+# a contagem dentro do raio olha para as células à volta; o ponto mais próximo é procurado em anéis de
+# células cada vez maiores até estar garantido, e as poucas comunidades longe de tudo são resolvidas
+# por força bruta.
+
+RAIO_TERRA_KM = 6371.0088
+PONTOS_POR_CELULA = 8  # Ocupação média (vista por cada ponto) a partir da qual a grelha é refinada
+COLUNAS_COBERTURA = ['Com_Coordenadas', 'Distancia_km', 'Pontos_no_Raio']
+
+
+def to_cartesian(lat, lon):
+    """Coordenadas (km) de cada ponto na esfera terrestre, forma (n, 3)."""
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return RAIO_TERRA_KM * np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(km):
+    return 2 * RAIO_TERRA_KM * np.sin(np.minimum(np.asarray(km, dtype=np.float64), np.pi * RAIO_TERRA_KM)
+                                      / (2 * RAIO_TERRA_KM))
+
+
+def chord_to_km(corda):
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.clip(np.asarray(corda) / (2 * RAIO_TERRA_KM), 0, 1))
+
+
+def valid_coordinates(lat, lon):
+    """Máscara das coordenadas utilizáveis: preenchidas, dentro dos limites e diferentes de (0, 0)."""
+    lat = pd.to_numeric(pd.Series(lat), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = pd.to_numeric(pd.Series(lon), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return ((np.abs(lat) <= 90) & (np.abs(lon) <= 180) & ~((lat == 0) & (lon == 0)))
+
+
+def _cube_offsets(alcance, so_anel=False):
+    """Deslocamentos (células) até `alcance` em cada eixo; com `so_anel`, só os da camada exterior."""
+    passos = np.arange(-alcance, alcance + 1)
+    deslocamentos = np.stack(np.meshgrid(passos, passos, passos, indexing='ij'), axis=-1).reshape(-1, 3)
+    if so_anel:
+        deslocamentos = deslocamentos[np.abs(deslocamentos).max(axis=1) == alcance]
+    return deslocamentos
+
+
+def typical_spacing(lat, lon):
+    """Espaçamento médio (km) entre os pontos se estivessem espalhados uniformemente no seu rectângulo."""
+    if len(lat) < 2:
+        return 0.0
+    lat, lon = np.radians(lat), np.radians(lon)
+    area = RAIO_TERRA_KM ** 2 * (np.ptp(lon) or 1e-3) * (abs(np.sin(lat.max()) - np.sin(lat.min())) or 1e-3)
+    return float(np.sqrt(area / len(lat)))
+
+
+class GridIndex:
+    """
+    Índice dos pontos (lat, lon) numa grelha de células de `celula_km`, nunca menores do que
+    `celula_minima_km`. Por omissão parte do dobro do espaçamento médio dos pontos e divide a célula ao meio
+    enquanto os pontos estiverem muito concentrados (aldeias). As células são codificadas num inteiro e os
+    pontos ordenados por célula: os pontos de uma célula são um intervalo contíguo, encontrado por pesquisa
+    binária.
+    """
+
+    def __init__(self, lat, lon, celula_km=None, celula_minima_km=0.1):
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        pontos = to_cartesian(lat, lon)
+        celula = max(float(celula_km or 2 * typical_spacing(lat, lon)), celula_minima_km)
+        while not celula_km and celula / 2 >= celula_minima_km:
+            _, ocupacao = np.unique(np.floor(pontos / celula), axis=0, return_counts=True)
+            if (ocupacao ** 2).sum() <= PONTOS_POR_CELULA * len(pontos):
+                break
+            celula /= 2
+        self._build(pontos, celula)
+
+    def _build(self, pontos, celula):
+        self.celula = celula
+        self._desvio = int(np.ceil(RAIO_TERRA_KM / self.celula)) + 2  # células sempre >= 0, mesmo as vizinhas
+        self._base = 2 * self._desvio + 1
+        chaves = self._keys(self._cells(pontos))
+        ordem = np.argsort(chaves, kind='stable')
+        self._chaves, self._pontos = chaves[ordem], pontos[ordem]
+        self._grosseiro = None
+        return self
+
+    def _coarser(self, factor):
+        """O mesmo índice com células `factor` vezes maiores (construído uma vez, quando é preciso)."""
+        if self._grosseiro is None:
+            self._grosseiro = GridIndex.__new__(GridIndex)._build(self._pontos, self.celula * factor)
+        return self._grosseiro
+
+    def __len__(self):
+        return len(self._pontos)
+
+    def _cells(self, pontos):
+        return np.floor(pontos / self.celula).astype(np.int64)
+
+    def _keys(self, celulas):
+        c = celulas + self._desvio
+        return (c[..., 0] * self._base + c[..., 1]) * self._base + c[..., 2]
+
+    def _pairs(self, celulas, deslocamentos):
+        """Pares (consulta, ponto) com o ponto numa das células vizinhas (`deslocamentos`) de cada consulta."""
+        # As pesquisas são feitas uma vez por célula distinta; as consultas na mesma célula partilham-nas
+        unicas, inversa = np.unique(self._keys(celulas), return_inverse=True)
+        vizinhas = unicas[:, None] + self._keys(deslocamentos - self._desvio)[None, :]
+        inicio = np.searchsorted(self._chaves, vizinhas, side='left')
+        n = (np.searchsorted(self._chaves, vizinhas, side='right') - inicio)[inversa].ravel()
+        inicio = inicio[inversa].ravel()
+        consulta = np.repeat(np.arange(len(celulas)).repeat(len(deslocamentos)), n)
+        ponto = np.repeat(inicio, n) + (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n))
+        return consulta, ponto
+
+    def count_within(self, lat, lon, raio_km):
+        """Número de pontos a no máximo `raio_km` de cada consulta."""
+        consultas = to_cartesian(lat, lon)
+        corda = float(km_to_chord(raio_km))
+        alcance = max(int(np.ceil(corda / self.celula)), 1)
+        consulta, ponto = self._pairs(self._cells(consultas), _cube_offsets(alcance))
+        dentro = ((consultas[consulta] - self._pontos[ponto]) ** 2).sum(axis=1) <= corda ** 2
+        return np.bincount(consulta[dentro], minlength=len(consultas))
+
+    def nearest(self, lat, lon, max_aneis=4, bloco_pares=2_000_000):
+        """Distância (km) de cada consulta ao ponto mais próximo (NaN se o índice não tem pontos)."""
+        if not len(self._pontos):
+            return np.full(len(lat), np.nan)
+        return chord_to_km(np.sqrt(self._nearest_squared(to_cartesian(lat, lon), max_aneis, bloco_pares)))
+
+    def _nearest_squared(self, consultas, max_aneis, bloco_pares):
+        """
+        Quadrado da corda até ao ponto mais próximo. Depois de percorrer os anéis até k, a distância mínima
+        fica garantida se não passar de k células: qualquer ponto fora desses anéis está mais longe. As
+        consultas ainda por resolver passam para uma grelha `max_aneis` vezes mais grossa.
+        """
+        melhor = np.full(len(consultas), np.inf)
+        celulas = self._cells(consultas)
+        pendentes = np.arange(len(consultas))
+        for k in range(1, max_aneis + 1):
+            # O primeiro passo cobre a célula da consulta e o anel 1 (o anel 0 sozinho nunca garante nada)
+            consulta, ponto = self._pairs(celulas[pendentes], _cube_offsets(k, so_anel=k > 1))
+            if len(consulta):
+                d2 = ((consultas[pendentes[consulta]] - self._pontos[ponto]) ** 2).sum(axis=1)
+                np.minimum.at(melhor, pendentes[consulta], d2)
+            pendentes = pendentes[melhor[pendentes] > (k * self.celula) ** 2]
+            if not len(pendentes):
+                return melhor
+
+        if len(pendentes) * len(self._pontos) > bloco_pares and self.celula < 2 * RAIO_TERRA_KM:
+            melhor[pendentes] = self._coarser(max_aneis)._nearest_squared(consultas[pendentes], max_aneis,
+                                                                         bloco_pares)
+            return melhor
+        # Poucas consultas (ou células do tamanho da Terra): comparação com todos os pontos, em blocos
+        tamanho = max(bloco_pares // len(self._pontos), 1)
+        for i in range(0, len(pendentes), tamanho):
+            bloco = pendentes[i:i + tamanho]
+            melhor[bloco] = ((consultas[bloco, None, :] - self._pontos[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        return melhor
+
+
+def latest_positions(df, codigo_col, lat_col, lon_col, data_col, colunas=()):
+    """
+    Última posição conhecida de cada código (o mesmo ponto é levantado várias vezes), com `colunas`
+    adicionais. Códigos sem coordenadas válidas ficam com lat/lon NaN.
+    """
+    if lat_col not in df.columns or lon_col not in df.columns:
+        df = df.assign(**{lat_col: np.nan, lon_col: np.nan})
+    posicoes = (df[[codigo_col, data_col, lat_col, lon_col, *colunas]]
+                .sort_values(data_col, kind='stable')
+                .drop_duplicates(codigo_col, keep='last'))
+    validas = valid_coordinates(posicoes[lat_col], posicoes[lon_col])
+    return posicoes.assign(**{lat_col: posicoes[lat_col].where(validas), lon_col: posicoes[lon_col].where(validas)})
+
+
+def community_coverage(comunidades, indice, raio_km, lat_col, lon_col):
+    """
+    Acrescenta a cada comunidade (uma linha por comunidade, ver latest_positions) COLUNAS_COBERTURA: se
+    tem coordenadas, a distância (km) ao ponto de água mais próximo e os pontos de água dentro do raio.
+    """
+    com_coordenadas = comunidades[lat_col].notna().to_numpy()
+    distancia = np.full(len(comunidades), np.nan)
+    no_raio = np.full(len(comunidades), np.nan)
+    if com_coordenadas.any() and len(indice):
+        lat = comunidades[lat_col].to_numpy(dtype=np.float64)[com_coordenadas]
+        lon = comunidades[lon_col].to_numpy(dtype=np.float64)[com_coordenadas]
+        distancia[com_coordenadas] = indice.nearest(lat, lon)
+        no_raio[com_coordenadas] = indice.count_within(lat, lon, raio_km)
+    elif com_coordenadas.any():
+        no_raio[com_coordenadas] = 0  # Sem nenhum ponto de água com coordenadas
+    return comunidades.assign(Com_Coordenadas=com_coordenadas, Distancia_km=distancia, Pontos_no_Raio=no_raio)
+
+
+def coverage_summary(cobertura, por):
+    """
+    Resumo por `por` (ex.: província e distrito): comunidades, comunidades com coordenadas, comunidades
+    sem nenhum ponto de água dentro do raio (só entre as que têm coordenadas) e distâncias.
+    """
+    grupos = cobertura.assign(Sem_Cobertura=cobertura['Pontos_no_Raio'] == 0).groupby(por, sort=True)
+    resumo = grupos.agg(Comunidades=('Com_Coordenadas', 'size'), Com_Coordenadas=('Com_Coordenadas', 'sum'),
+                        Sem_Cobertura=('Sem_Cobertura', 'sum'), Distancia_Mediana_km=('Distancia_km', 'median'),
+                        Distancia_Maxima_km=('Distancia_km', 'max')).reset_index()
+    resumo['Percent_Sem_Cobertura'] = np.where(resumo['Com_Coordenadas'] > 0,
+                                               100 * resumo['Sem_Cobertura'] / resumo['Com_Coordenadas'].clip(lower=1),
+                                               np.nan)
+    return resumo
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# CUBO DE CONTAGENS (ANO x MÊS x PROVÍNCIA x DISTRITO x INFRA)
+# =========================
+# Construído uma única vez a partir dos dataframes de levantamentos. O eixo do distrito é local a cada
+# província (posição do distrito dentro da sua província), o que mantém o cubo denso e pequeno:
+# 10 anos x 12 meses x 11 províncias x 25 distritos x 3 infra ~ 100 mil células (int32, ~400 KB).
+
+
+def build_count_cube(dfs_infra, provincia_col, distrito_col, ano_col='Ano', mes_col='Mes'):
+    """
+    Constrói o cubo denso de contagens de levantamentos.
+
+    Devolve um dicionário com 'contagens' (int32, forma (anos, 12, províncias, distritos, infra)),
+    'anos' (array), 'provincias' (lista) e 'distritos' (lista, por província, dos nomes dos distritos).
+    """
+    pares = pd.concat([d[[provincia_col, distrito_col]] for d in dfs_infra]).dropna().drop_duplicates()
+    pares = pares.sort_values([provincia_col, distrito_col]).reset_index(drop=True)
+    provincias = pares[provincia_col].drop_duplicates().tolist()
+    # Posição de cada distrito dentro da sua província
+    pares['Posicao'] = pares.groupby(provincia_col, sort=False).cumcount()
+    distritos = [pares.loc[pares[provincia_col] == p, distrito_col].tolist() for p in provincias]
+    n_distritos = int(pares['Posicao'].max()) + 1 if len(pares) else 0
+    indice_pares = pd.MultiIndex.from_frame(pares[[provincia_col, distrito_col]])
+
+    anos_validos = pd.concat([d[ano_col] for d in dfs_infra]).dropna()
+    anos = np.arange(int(anos_validos.min()), int(anos_validos.max()) + 1) if len(anos_validos) else \
+        np.array([], dtype=np.int64)
+
+    forma = (len(anos), 12, len(provincias), n_distritos, len(dfs_infra))
+    contagens = np.zeros(forma, dtype=np.int32)
+    if not contagens.size:
+        return {'contagens': contagens, 'anos': anos, 'provincias': provincias, 'distritos': distritos}
+
+    provincia_par = pd.Categorical(pares[provincia_col], categories=provincias).codes
+    posicao_par = pares['Posicao'].to_numpy()
+    contagens = _count_cells(dfs_infra, forma, anos[0], indice_pares, provincia_par, posicao_par,
+                             provincia_col, distrito_col, ano_col, mes_col)
+    return {'contagens': contagens, 'anos': anos, 'provincias': provincias, 'distritos': distritos}
+
+
+def _count_cells(dfs_infra, forma, ano_inicial, indice_pares, provincia_par, posicao_par, provincia_col,
+                 distrito_col, ano_col, mes_col, exigir_cobertura=False):
+    """
+    Contagens (forma do cubo) dos levantamentos de cada infra. Com `exigir_cobertura`, devolve None se
+    algum registo com província, distrito, ano e mês cair fora dos eixos do cubo.
+    """
+    contagens = np.zeros(forma, dtype=np.int32)
+    for i, df_base in enumerate(dfs_infra):
+        linhas = indice_pares.get_indexer(pd.MultiIndex.from_frame(df_base[[provincia_col, distrito_col]]))
+        completos = df_base[ano_col].notna().to_numpy() & df_base[mes_col].notna().to_numpy()
+        if exigir_cobertura:
+            com_par = df_base[[provincia_col, distrito_col]].notna().all(axis=1).to_numpy()
+            if (completos & com_par & (linhas < 0)).any():
+                return None
+        validos = (linhas >= 0) & completos
+        linhas = linhas[validos]
+
+        a = df_base[ano_col].to_numpy()[validos].astype(np.int64) - ano_inicial
+        m = df_base[mes_col].to_numpy()[validos].astype(np.int64) - 1
+        if exigir_cobertura and len(a) and (a.min() < 0 or a.max() >= forma[0]):
+            return None
+        p, d = provincia_par[linhas], posicao_par[linhas]
+
+        celula = np.ravel_multi_index((a, m, p, d, np.full(len(a), i)), forma)
+        contagens += np.bincount(celula, minlength=contagens.size).reshape(forma).astype(np.int32)
+    return contagens
+
+
+def add_to_cube(cubo, dfs_infra, provincia_col, distrito_col, ano_col='Ano', mes_col='Mes'):
+    """
+    Novo cubo com os levantamentos de `dfs_infra` (um dataframe por infra, só com as linhas novas)
+    somados às contagens de `cubo`. Devolve None se alguma linha nova trouxer um ano, província ou
+    distrito fora dos eixos do cubo (nesse caso o cubo tem de ser reconstruído).
+    """
+    if not cubo['contagens'].size:
+        return None
+    pares = [(p, d) for p, nomes in zip(cubo['provincias'], cubo['distritos']) for d in nomes]
+    indice_pares = pd.MultiIndex.from_tuples(pares, names=[provincia_col, distrito_col])
+    provincia_par = np.asarray([i for i, nomes in enumerate(cubo['distritos']) for _ in nomes])
+    posicao_par = np.asarray([j for nomes in cubo['distritos'] for j in range(len(nomes))])
+    novas = _count_cells(dfs_infra, cubo['contagens'].shape, cubo['anos'][0], indice_pares, provincia_par,
+                         posicao_par, provincia_col, distrito_col, ano_col, mes_col, exigir_cobertura=True)
+    if novas is None:
+        return None
+    return dict(cubo, contagens=cubo['contagens'] + novas)
+
+
+def year_position(cubo, ano):
+    """Posição do ano no eixo dos anos (None se o ano não existe no cubo)."""
+    posicao = int(ano) - int(cubo['anos'][0]) if len(cubo['anos']) else -1
+    return posicao if 0 <= posicao < len(cubo['anos']) else None
+
+
+def yearly_totals(cubo, provincia=None, distrito=None):
+    """Totais por ano e infra (forma (anos, infra)), nacionais, de uma província ou de um dos seus distritos."""
+    contagens = cubo['contagens']
+    if provincia is not None:
+        posicao = cubo['provincias'].index(provincia)
+        contagens = contagens[:, :, [posicao]]
+        if distrito is not None:
+            contagens = contagens[:, :, :, [cubo['distritos'][posicao].index(distrito)]]
+    return contagens.sum(axis=(1, 2, 3))
+
+
+def province_totals(cubo, ano):
+    """Totais por província e infra (forma (províncias, infra)) num ano; zeros se o ano não existe."""
+    posicao = year_position(cubo, ano)
+    if posicao is None:
+        return np.zeros((len(cubo['provincias']), cubo['contagens'].shape[-1]), dtype=np.int64)
+    return cubo['contagens'][posicao].sum(axis=(0, 2))
+
+
+def monthly_totals(cubo, ano, provincia=None):
+    """Totais por mês e infra (forma (12, infra)) num ano, nacionais ou de uma província."""
+    posicao = year_position(cubo, ano)
+    if posicao is None:
+        return np.zeros((12, cubo['contagens'].shape[-1]), dtype=np.int64)
+    contagens = cubo['contagens'][posicao]
+    if provincia is not None:
+        contagens = contagens[:, [cubo['provincias'].index(provincia)]]
+    return contagens.sum(axis=(1, 2))
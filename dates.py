@@ -0,0 +1,126 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# NORMALIZAÇÃO DAS DATAS DE LEVANTAMENTO (VÁRIOS FORMATOS NA MESMA COLUNA)
+# =========================
+# Os ficheiros misturam datas do Excel (objectos data/hora), números de série do Excel, texto ISO
+# (2025-07-10) e texto dd/mm/aaaa. O pd.to_datetime infere um único formato a partir do primeiro valor
+# e perde os restantes (ou cai para uma interpretação valor a valor, lenta). Aqui cada valor é primeiro
+# classificado numa família de formato (máscaras vectorizadas) e cada família é convertida de uma só vez
+# com um formato explícito.
+
+ORIGEM_EXCEL = '1899-12-30'  # dia 0 dos números de série do Excel (sistema 1900, com o falso 29/02/1900)
+SERIE_EXCEL_MAXIMA = 2958465  # 9999-12-31
+
+# Famílias de texto: (nome, expressão regular). A ordem importa: a primeira que corresponder ganha.
+FAMILIAS_TEXTO = [
+    ('iso', r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$'),
+    ('dd/mm/aaaa', r'^\d{1,2}[/.-]\d{1,2}[/.-]\d{4}(?:[ T]\d{1,2}:\d{2}(?::\d{2})?)?$'),
+    ('aaaammdd', r'^\d{8}$'),
+    ('serie_excel', r'^\d{1,7}(?:\.\d+)?$'),
+]
+# Variantes de dd/mm/aaaa, pela hora no fim (depois de uniformizar os separadores para '/' e ' ')
+FORMATOS_DIA_MES_ANO = [(r' \d{1,2}:\d{2}:\d{2}$', '%d/%m/%Y %H:%M:%S'), (r' \d{1,2}:\d{2}$', '%d/%m/%Y %H:%M'),
+                        (r'^[^ ]*$', '%d/%m/%Y')]
+
+
+def _from_excel_serial(numeros):
+    numeros = pd.to_numeric(numeros, errors='coerce').astype('float64')
+    numeros = numeros.where((numeros >= 1) & (numeros <= SERIE_EXCEL_MAXIMA))
+    return pd.to_datetime(numeros, unit='D', origin=ORIGEM_EXCEL)
+
+
+def _from_day_first(texto):
+    texto = texto.str.replace(r'^(\d{1,2})[.-](\d{1,2})[.-]', r'\1/\2/', regex=True).str.replace('T', ' ', regex=False)
+    datas = pd.Series(pd.NaT, index=texto.index, dtype='datetime64[us]')
+    for padrao, formato in FORMATOS_DIA_MES_ANO:
+        mascara = texto.str.contains(padrao).to_numpy(dtype=bool)
+        if mascara.any():
+            datas[mascara] = pd.to_datetime(texto[mascara], format=formato, errors='coerce')
+    return datas
+
+
+def _parse_family(familia, texto):
+    if familia == 'iso':
+        return pd.to_datetime(texto.str.replace('/', '-', regex=False), format='ISO8601', errors='coerce')
+    if familia == 'dd/mm/aaaa':
+        return _from_day_first(texto)
+    if familia == 'aaaammdd':
+        return pd.to_datetime(texto, format='%Y%m%d', errors='coerce')
+    return _from_excel_serial(texto)
+
+
+def normalize_dates(valores, minimo=None, hoje=None):
+    """
+    Converte uma coluna de datas em formatos mistos para datetime64. Devolve (datas, relatório), com o
+    relatório {'familias': {família: n}, 'invalidas': n, 'suspeitas': n}: inválidas são valores não vazios
+    que nenhuma família converteu; suspeitas são datas convertidas anteriores a `minimo` ou futuras.
+    """
+    familias = {}
+    if pd.api.types.is_datetime64_any_dtype(valores):
+        datas = valores
+        familias['data_hora'] = int(valores.notna().sum())
+    elif pd.api.types.is_numeric_dtype(valores):
+        datas = _from_excel_serial(valores)
+        familias['serie_excel'] = int(valores.notna().sum())
+    else:
+        datas = pd.Series(pd.NaT, index=valores.index, dtype='datetime64[us]')
+        pendentes = valores.notna().to_numpy().copy()
+
+        if valores.dtype == object:
+            # Células do Excel já convertidas (datas) ou numéricas (séries) vêm como objectos Python
+            tipos = valores.map(type, na_action='ignore')
+            objectos_data = tipos.isin([dt.datetime, dt.date, pd.Timestamp]).to_numpy() & pendentes
+            if objectos_data.any():
+                datas[objectos_data] = pd.to_datetime(valores[objectos_data], errors='coerce')
+                familias['data_hora'] = int(objectos_data.sum())
+            numeros = tipos.isin([int, float, np.int64, np.float64]).to_numpy() & pendentes
+            if numeros.any():
+                datas[numeros] = _from_excel_serial(valores[numeros])
+                familias['serie_excel'] = int(numeros.sum())
+            pendentes &= ~(objectos_data | numeros)
+
+        # As datas repetem-se muito (milhares de dias distintos em milhões de linhas): cada texto distinto
+        # é classificado e convertido uma só vez e o resultado é depois espalhado pelas linhas
+        codigos, unicos = pd.factorize(valores[pendentes].astype(str).str.strip())
+        ocorrencias = np.bincount(codigos, minlength=len(unicos))
+        texto = pd.Series(unicos)
+        datas_unicas = pd.Series(pd.NaT, index=texto.index, dtype='datetime64[us]')
+        for familia, padrao in FAMILIAS_TEXTO:
+            if texto.empty:
+                break
+            mascara = texto.str.match(padrao).to_numpy(dtype=bool)
+            if mascara.any():
+                datas_unicas[texto.index[mascara]] = _parse_family(familia, texto[mascara])
+                familias[familia] = familias.get(familia, 0) + int(ocorrencias[texto.index[mascara]].sum())
+                texto = texto[~mascara]
+        datas[pendentes] = datas_unicas.to_numpy()[codigos]
+
+    validas = datas.notna()
+    suspeitas = pd.Series(False, index=datas.index)
+    if minimo is not None:
+        suspeitas |= validas & (datas < pd.Timestamp(minimo))
+    suspeitas |= validas & (datas > pd.Timestamp(hoje or dt.date.today()) + pd.Timedelta(days=1))
+    relatorio = {'familias': familias, 'invalidas': int(valores.notna().sum() - validas.sum()),
+                 'suspeitas': int(suspeitas.sum())}
+    return datas, relatorio
+
+
+def combine_reports(relatorios):
+    """Soma os relatórios de vários blocos do mesmo ficheiro."""
+    familias, invalidas, suspeitas = {}, 0, 0
+    for relatorio in relatorios:
+        for familia, n in relatorio['familias'].items():
+            familias[familia] = familias.get(familia, 0) + n
+        invalidas += relatorio['invalidas']
+        suspeitas += relatorio['suspeitas']
+    return {'familias': familias, 'invalidas': invalidas, 'suspeitas': suspeitas}
+
+
+def describe_report(relatorio):
+    """Resumo de uma linha: 'iso 5000, dd/mm/aaaa 12; 3 inválida(s), 1 suspeita(s)'."""
+    familias = ', '.join(f"{familia} {n}" for familia, n in relatorio['familias'].items()) or 'sem datas'
+    return f"{familias}; {relatorio['invalidas']} inválida(s), {relatorio['suspeitas']} suspeita(s)"
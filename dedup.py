@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# DETECÇÃO DE LEVANTAMENTOS DUPLICADOS
+# =========================
+# Exactos: índice de hash (uint64) sobre (código, distrito, data), resolvido numa tabela de hash em O(n).
+# Próximos: mesma chave (código, distrito) com datas a <= N dias, detectados por ordenação e
+# comparação de vizinhos consecutivos (sorted-merge), nunca por comparação par-a-par.
+
+DUPLICADO_EXACTO_COL = 'Duplicado_Exacto'
+DUPLICADO_PROXIMO_COL = 'Duplicado_Proximo'
+
+
+def find_duplicates(df, chaves, data_col, janela_dias=0):
+    """
+    Marca os levantamentos reenviados. A primeira ocorrência de cada grupo nunca é marcada.
+
+    Devolve um DataFrame alinhado com `df` com as colunas booleanas 'Duplicado_Exacto'
+    e 'Duplicado_Proximo' (mesmas `chaves`, data a até `janela_dias` dias do registo anterior).
+    """
+    n = len(df)
+    exacto = np.zeros(n, dtype=bool)
+    proximo = np.zeros(n, dtype=bool)
+    colunas = list(chaves) + [data_col]
+
+    if n and all(c in df.columns for c in colunas):
+        # Registos sem código/distrito/data não podem ser comparados
+        completos = df[colunas].notna().all(axis=1).to_numpy()
+        linhas = np.flatnonzero(completos)
+
+        hash_exacto = pd.util.hash_pandas_object(df[colunas], index=False).to_numpy()
+        exacto[linhas] = pd.Series(hash_exacto[linhas]).duplicated().to_numpy()
+
+        if janela_dias > 0:
+            hash_chave = pd.util.hash_pandas_object(df[list(chaves)], index=False).to_numpy()
+            dias = df[data_col].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+            candidatos = linhas[~exacto[linhas]]
+            ordem = candidatos[np.lexsort((dias[candidatos], hash_chave[candidatos]))]
+            mesma_chave = hash_chave[ordem[1:]] == hash_chave[ordem[:-1]]
+            intervalo = dias[ordem[1:]] - dias[ordem[:-1]]
+            proximo[ordem[1:][mesma_chave & (intervalo <= janela_dias)]] = True
+
+    return pd.DataFrame({DUPLICADO_EXACTO_COL: exacto, DUPLICADO_PROXIMO_COL: proximo}, index=df.index)
+
+
+def summarize_duplicates(df, marcas, grupos):
+    """Contagem de duplicados exactos e próximos agregada pelos `grupos` (ex.: Província, Distrito)."""
+    if not all(g in df.columns for g in grupos):
+        return marcas.astype(np.int64).iloc[:0]
+    return marcas.astype(np.int64).groupby([df[g] for g in grupos], dropna=False).sum()
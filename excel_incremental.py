@@ -0,0 +1,180 @@
+import hashlib
+import io
+import os
+import pickle
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+import pandas as pd
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+from openpyxl.worksheet._reader import WorkSheetParser
+from pandas.io.parsers import TextParser
+
+# =========================
+# LEITURA INCREMENTAL DOS FICHEIROS EXCEL (DIFERENÇAS POR BLOCOS DE LINHAS)
+# =========================
+# O XML da folha é dividido em linhas sem as descodificar; cada linha recebe um hash (sem o número da
+# linha, para que inserções não alterem as seguintes) e as linhas são agrupadas em blocos com fronteiras
+# definidas pelo conteúdo. Só os blocos que não existiam na última leitura são interpretados pelo
+# openpyxl; os restantes vêm da cache em disco, já convertidos. O resultado é igual ao de pd.read_excel.
+
+FORMATO_CACHE = 1
+BLOCO_MEDIO = 64   # fronteira de bloco quando hash % BLOCO_MEDIO == 0 (tamanho médio dos blocos)
+BLOCO_MAXIMO = 512
+
+NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+_RE_LINHA = re.compile(rb'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_RE_NUMERO_LINHA = re.compile(rb'<row\b[^>]*?\br="(\d+)"')
+_RE_REFERENCIA = re.compile(rb' r="[A-Z]*\d+"')
+_RE_INICIO_FOLHA = re.compile(rb'<worksheet\b[^>]*>')
+
+
+def _first_sheet_path(arquivo):
+    """Caminho (no zip) da primeira folha do livro, a que o pd.read_excel lê por omissão."""
+    livro = ET.fromstring(arquivo.read('xl/workbook.xml'))
+    primeira = livro.find(f'{NS_MAIN}sheets/{NS_MAIN}sheet')
+    relacoes = ET.fromstring(arquivo.read('xl/_rels/workbook.xml.rels'))
+    alvo = next(r.get('Target') for r in relacoes if r.get('Id') == primeira.get(f'{NS_REL}id'))
+    epoca = CALENDAR_MAC_1904 if (livro.find(f'{NS_MAIN}workbookPr') is not None and
+                                  livro.find(f'{NS_MAIN}workbookPr').get('date1904') in ('1', 'true')) \
+        else CALENDAR_WINDOWS_1900
+    return (alvo.lstrip('/') if alvo.startswith('/xl/') else f'xl/{alvo}'), epoca
+
+
+def _date_style_ids(estilos_xml):
+    """Índices de estilo (cellXfs) com formato de data e de duração, como no openpyxl."""
+    if not estilos_xml:
+        return set(), set()
+    raiz = ET.fromstring(estilos_xml)
+    formatos = dict(BUILTIN_FORMATS)
+    for fmt in raiz.iterfind(f'{NS_MAIN}numFmts/{NS_MAIN}numFmt'):
+        formatos[int(fmt.get('numFmtId'))] = fmt.get('formatCode')
+    datas, duracoes = set(), set()
+    for i, xf in enumerate(raiz.iterfind(f'{NS_MAIN}cellXfs/{NS_MAIN}xf')):
+        codigo = formatos.get(int(xf.get('numFmtId', 0)))
+        if codigo and is_timedelta_format(codigo):
+            duracoes.add(i)
+        elif codigo and is_date_format(codigo):
+            datas.add(i)
+    return datas, duracoes
+
+
+def _pandas_value(celula):
+    """Mesma conversão que o leitor openpyxl do pandas (_convert_cell)."""
+    valor = celula['value']
+    if valor is None:
+        return ""
+    if celula['data_type'] == 'e':
+        return np.nan
+    if celula['data_type'] == 'n':
+        inteiro = int(valor)
+        return inteiro if inteiro == valor else float(valor)
+    return valor
+
+
+def _split_rows(folha):
+    """Devolve [(número da linha, hash, bytes)] para cada <row> da folha."""
+    linhas = []
+    for m in _RE_LINHA.finditer(folha):
+        xml = m.group(0)
+        numero = _RE_NUMERO_LINHA.match(xml)
+        resumo = hashlib.blake2b(_RE_REFERENCIA.sub(b'', xml), digest_size=8).digest()
+        linhas.append((int(numero.group(1)) if numero else None, resumo, xml))
+    return linhas
+
+
+def _content_blocks(linhas):
+    """Agrupa as linhas em blocos com fronteiras definidas pelo hash de cada linha."""
+    blocos, actual = [], []
+    for linha in linhas:
+        actual.append(linha)
+        if int.from_bytes(linha[1][:4], 'little') % BLOCO_MEDIO == 0 or len(actual) >= BLOCO_MAXIMO:
+            blocos.append(actual)
+            actual = []
+    if actual:
+        blocos.append(actual)
+    return blocos
+
+
+def _parse_block(inicio_folha, bloco, partilhadas, epoca, datas, duracoes):
+    """Interpreta (openpyxl) as linhas de um bloco e converte-as como o pandas."""
+    xml = inicio_folha + b'<sheetData>' + b''.join(l[2] for l in bloco) + b'</sheetData></worksheet>'
+    parser = WorkSheetParser(io.BytesIO(xml), partilhadas, epoch=epoca, date_formats=datas,
+                             timedelta_formats=duracoes)
+    convertidas = []
+    for _, celulas in parser.parse():
+        linha = []
+        for celula in celulas:
+            linha.extend([""] * (celula['column'] - 1 - len(linha)))
+            linha.append(_pandas_value(celula))
+        while linha and linha[-1] == "":
+            linha.pop()
+        convertidas.append(linha)
+    return convertidas
+
+
+def read_excel_incremental(file_name, pasta_cache):
+    """
+    Lê a primeira folha de um .xlsx como pd.read_excel, reinterpretando apenas os blocos de linhas
+    novos ou alterados desde a última leitura. Devolve (dataframe, estatísticas).
+    """
+    with zipfile.ZipFile(file_name) as arquivo:
+        caminho_folha, epoca = _first_sheet_path(arquivo)
+        nomes = set(arquivo.namelist())
+        partilhadas_xml = arquivo.read('xl/sharedStrings.xml') if 'xl/sharedStrings.xml' in nomes else b''
+        estilos_xml = arquivo.read('xl/styles.xml') if 'xl/styles.xml' in nomes else b''
+        folha = arquivo.read(caminho_folha)
+
+    # Strings partilhadas e estilos mudam o significado de todas as linhas: fazem parte do contexto
+    contexto = hashlib.blake2b(partilhadas_xml + b'|' + estilos_xml + repr(epoca).encode(),
+                               digest_size=16).hexdigest()
+    caminho_cache = os.path.join(pasta_cache, os.path.basename(file_name) + '.blocos.pkl')
+    anteriores = {}
+    if os.path.exists(caminho_cache):
+        with open(caminho_cache, 'rb') as f:
+            cache = pickle.load(f)
+        if cache.get('formato') == FORMATO_CACHE and cache.get('contexto') == contexto:
+            anteriores = cache['blocos']
+
+    inicio_folha = _RE_INICIO_FOLHA.search(folha).group(0)
+    partilhadas = read_string_table(io.BytesIO(partilhadas_xml)) if partilhadas_xml else []
+    datas, duracoes = _date_style_ids(estilos_xml)
+
+    blocos, novos = {}, 0
+    data, ultima = [], 0
+    for bloco in _content_blocks(_split_rows(folha)):
+        impressao = hashlib.blake2b(b''.join(l[1] for l in bloco), digest_size=16).hexdigest()
+        linhas = blocos.get(impressao) or anteriores.get(impressao)
+        if linhas is None:
+            linhas = _parse_block(inicio_folha, bloco, partilhadas, epoca, datas, duracoes)
+            novos += 1
+        blocos[impressao] = linhas
+        for (numero, _, _), linha in zip(bloco, linhas):
+            numero = numero or ultima + 1
+            data.extend([] for _ in range(numero - ultima - 1))  # linhas em falta no XML = linhas vazias
+            data.append(list(linha))
+            ultima = numero
+
+    # Como o leitor do pandas: remove linhas vazias no fim e iguala a largura das linhas
+    while data and not data[-1]:
+        data.pop()
+    largura = max((len(l) for l in data), default=0)
+    data = [l + [""] * (largura - len(l)) for l in data]
+
+    os.makedirs(pasta_cache, exist_ok=True)
+    temporario = caminho_cache + f'.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as f:
+        pickle.dump({'formato': FORMATO_CACHE, 'contexto': contexto, 'blocos': blocos}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, caminho_cache)
+
+    df = TextParser(data, header=0, skip_blank_lines=False).read() if data else pd.DataFrame()
+    estatisticas = {'blocos': len(blocos), 'novos': novos,
+                    'removidos': len(set(anteriores) - set(blocos)), 'linhas': len(df)}
+    return df, estatisticas
@@ -0,0 +1,52 @@
+"""
+Exporta o estado pré-calculado do dashboard para um único ficheiro (instantâneo), para as instalações sem
+ligação ao servidor.
+
+Os dados são carregados e agregados como no arranque normal (ficheiros principais mais os carregamentos
+aceites) e gravados num ZIP: KPIs de todos os níveis administrativos, actividade por janela, previsões,
+cubo de contagens, anomalias, cobertura das comunidades, regras de qualidade, geometrias do mapa e as
+colunas dos levantamentos consultadas pelos callbacks. A aplicação lê-o em modo só de leitura:
+    SNAPSHOT_FILE=sinas_instantaneo.zip python app.py
+sem ler os ficheiros de levantamentos nem recalcular nada; os arrays são mapeados em memória.
+
+Uso (a partir da pasta com os ficheiros *_cleaned.xlsx):
+    python /caminho/para/export_snapshot.py [--saida sinas_instantaneo.zip] [--comprimir-arrays]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('SYNC_DATA_LOAD', '1')  # os dados têm de estar prontos antes da exportação
+os.environ['STORAGE_BACKEND'] = 'pandas'  # as colunas dos levantamentos são exportadas dos dataframes
+os.environ.pop('SNAPSHOT_FILE', None)  # a exportação parte sempre dos ficheiros de levantamentos
+
+import app  # noqa: E402
+from snapshot import read_snapshot  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--saida', default='sinas_instantaneo.zip', help='Ficheiro do instantâneo')
+    parser.add_argument('--comprimir-arrays', action='store_true',
+                        help='Comprime também os arrays (ficheiro menor, mas lido para memória em vez de mapeado)')
+    args = parser.parse_args()
+
+    app.DADOS_PRONTOS.wait()
+    if app.estado_carregamento['estado'] != 'pronto':
+        print(f"ERRO: os dados não foram carregados: {app.estado_carregamento['erro']}")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    buffers = app.export_snapshot(args.saida, args.comprimir_arrays)
+    print(f"Instantâneo '{args.saida}' gravado em {time.perf_counter() - inicio:.2f} s "
+          f"({os.path.getsize(args.saida) / 1024 ** 2:.1f} MB, {buffers} arrays).")
+
+    inicio = time.perf_counter()
+    metadados, _ = read_snapshot(args.saida)
+    print(f"Verificação: lido em {time.perf_counter() - inicio:.3f} s (versão {metadados['versao_dados']}, "
+          f"dias parados referidos a {metadados['referencia']}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Prepara o GeoJSON dos distritos usado pelo mapa (/mapa).
+
+Descarrega os limites administrativos de nível 2 (distritos) de Moçambique do geoBoundaries (gbOpen,
+licença CC BY 4.0) ou converte um GeoJSON local com os mesmos limites (por exemplo, o COD-AB da OCHA
+no HDX, exportado para GeoJSON). O ficheiro é gravado em DISTRICTS_GEOJSON com uma única propriedade,
+GEOJSON_DISTRITO_PROP: o nome do distrito, juntado à coluna Distrito dos levantamentos depois de
+normalizado (sem acentos, minúsculas). No fim lista os distritos dos levantamentos sem geometria, cujos
+nomes têm de ser acertados no ficheiro gravado.
+
+O mapa lê o ficheiro no carregamento dos dados: reinicie a aplicação depois de o gravar.
+
+Uso (a partir da pasta com os ficheiros *_cleaned.xlsx):
+    python /caminho/para/fetch_districts.py [--entrada limites.geojson] [--propriedade shapeName]
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.request
+
+os.environ.setdefault('SYNC_DATA_LOAD', '1')  # os distritos dos levantamentos são verificados no fim
+os.environ['THREADS_AFTER_FORK'] = '1'  # script de execução única: sem recarga dos dados nem alertas
+
+import app  # noqa: E402
+from geo import normalize_name  # noqa: E402
+
+API_GEOBOUNDARIES = 'https://www.geoboundaries.org/api/current/gbOpen/MOZ/ADM2/'
+# Propriedade com o nome do distrito nas fontes habituais: geoBoundaries, COD-AB (OCHA), GADM
+PROPRIEDADES_NOME = ('shapeName', 'ADM2_PT', 'ADM2_EN', 'NAME_2')
+
+
+def download_geojson(url_api):
+    """GeoJSON completo indicado pela API do geoBoundaries (a resposta traz o endereço do ficheiro)."""
+    with urllib.request.urlopen(url_api, timeout=60) as resposta:
+        metadados = json.load(resposta)
+    print(f"A descarregar os limites de {metadados['boundaryName']} (fonte: {metadados['boundarySource']}).")
+    with urllib.request.urlopen(metadados['gjDownloadURL'], timeout=300) as resposta:
+        return json.load(resposta)
+
+
+def name_property(geojson, propriedade):
+    """
+    Propriedade com o nome do distrito: a indicada ou a primeira de PROPRIEDADES_NOME presente.
+    Devolve (propriedade ou None, propriedades disponíveis).
+    """
+    features = geojson.get('features') or [{}]
+    propriedades = features[0].get('properties') or {}
+    candidatas = [propriedade] if propriedade else (app.GEOJSON_DISTRITO_PROP,) + PROPRIEDADES_NOME
+    encontradas = [p for p in candidatas if p in propriedades]
+    return (encontradas[0] if encontradas else None), sorted(propriedades)
+
+
+def convert(geojson, propriedade):
+    """FeatureCollection só com as geometrias e o nome do distrito em GEOJSON_DISTRITO_PROP."""
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {app.GEOJSON_DISTRITO_PROP: f['properties'][propriedade]},
+         'geometry': f['geometry']}
+        for f in geojson['features'] if f.get('geometry')]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entrada', help='GeoJSON local dos distritos (por omissão, descarregado do geoBoundaries)')
+    parser.add_argument('--propriedade', help='Propriedade com o nome do distrito no GeoJSON de entrada')
+    parser.add_argument('--saida', default=app.DISTRICTS_GEOJSON, help='Ficheiro gravado')
+    args = parser.parse_args()
+
+    if args.entrada:
+        with open(args.entrada, encoding='utf-8') as f:
+            geojson = json.load(f)
+    else:
+        try:
+            geojson = download_geojson(API_GEOBOUNDARIES)
+        except Exception as e:
+            print(f"ERRO: não foi possível descarregar os limites ({e}). Descarregue o GeoJSON de nível 2 (ADM2) "
+                  f"de Moçambique e indique-o com --entrada.")
+            sys.exit(1)
+
+    propriedade, disponiveis = name_property(geojson, args.propriedade)
+    if propriedade is None:
+        print(f"ERRO: propriedade com o nome do distrito não encontrada (disponíveis: {', '.join(disponiveis)}). "
+              f"Indique-a com --propriedade.")
+        sys.exit(1)
+    distritos = convert(geojson, propriedade)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(distritos, f, ensure_ascii=False)
+    print(f"'{args.saida}' gravado: {len(distritos['features'])} distritos (nome lido de '{propriedade}').")
+
+    app.DADOS_PRONTOS.wait()
+    if app.estado_carregamento['estado'] != 'pronto':
+        print(f"AVISO: levantamentos não carregados, nomes dos distritos não verificados: "
+              f"{app.estado_carregamento['erro']}")
+        return
+    com_geometria = {normalize_name(f['properties'][app.GEOJSON_DISTRITO_PROP]) for f in distritos['features']}
+    em_falta = sorted({d for d in app.actividade_janelas['indice'].get_level_values(app.DISTRITO_COL)
+                       if normalize_name(d) not in com_geometria})
+    if em_falta:
+        print(f"AVISO: {len(em_falta)} distritos dos levantamentos sem geometria (acerte os nomes em "
+              f"'{args.saida}'): {', '.join(em_falta)}")
+    else:
+        print("Todos os distritos dos levantamentos têm geometria.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import json
+import unicodedata
+
+import numpy as np
+
+# =========================
+# GEOMETRIAS DOS DISTRITOS (SIMPLIFICAÇÃO E QUANTIZAÇÃO)
+# =========================
+# As geometrias são simplificadas (Douglas-Peucker) e quantizadas uma única vez no arranque,
+# com uma versão por nível de zoom, para que a figura do mapa transporte o mínimo de coordenadas.
+
+
+def normalize_name(nome):
+    """Normaliza um nome (sem acentos, minúsculas, sem espaços extra) para juntar GeoJSON e tabelas."""
+    if nome is None:
+        return ''
+    sem_acentos = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acentos.lower().split())
+
+
+def _douglas_peucker(pontos, tolerancia):
+    """Simplifica uma linha (array N x 2) mantendo os vértices a mais de `tolerancia` do segmento."""
+    n = len(pontos)
+    if n < 3:
+        return pontos
+
+    manter = np.zeros(n, dtype=bool)
+    manter[0] = manter[-1] = True
+    pilha = [(0, n - 1)]
+    while pilha:
+        i, j = pilha.pop()
+        if j <= i + 1:
+            continue
+        a, b = pontos[i], pontos[j]
+        segmento = pontos[i + 1:j]
+        dx, dy = b - a
+        norma = np.hypot(dx, dy)
+        if norma == 0:
+            distancias = np.hypot(segmento[:, 0] - a[0], segmento[:, 1] - a[1])
+        else:
+            distancias = np.abs(dx * (segmento[:, 1] - a[1]) - dy * (segmento[:, 0] - a[0])) / norma
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia:
+            meio = i + 1 + k
+            manter[meio] = True
+            pilha.append((i, meio))
+            pilha.append((meio, j))
+    return pontos[manter]
+
+
+def _simplify_ring(anel, tolerancia, casas_decimais):
+    """Simplifica e quantiza um anel fechado, removendo vértices consecutivos repetidos."""
+    pontos = np.asarray(anel, dtype=float)[:, :2]
+    if len(pontos) == 0:
+        return []
+
+    def quantizar(p):
+        p = np.round(p, casas_decimais)
+        repetido = np.zeros(len(p), dtype=bool)
+        repetido[1:] = (p[1:] == p[:-1]).all(axis=1)
+        return p[~repetido]
+
+    simplificado = quantizar(_douglas_peucker(pontos, tolerancia))
+    if len(simplificado) < 4:
+        # Anéis muito pequenos para a tolerância: mantém apenas a quantização
+        simplificado = quantizar(pontos)
+    return simplificado.tolist()
+
+
+def simplify_geojson(geojson, tolerancia, casas_decimais):
+    """Devolve uma cópia da FeatureCollection com todos os (Multi)Polígonos simplificados e quantizados."""
+    features = []
+    for feature in geojson.get('features', []):
+        geometria = feature.get('geometry') or {}
+        tipo = geometria.get('type')
+        if tipo == 'Polygon':
+            coordenadas = [_simplify_ring(anel, tolerancia, casas_decimais) for anel in geometria['coordinates']]
+        elif tipo == 'MultiPolygon':
+            coordenadas = [[_simplify_ring(anel, tolerancia, casas_decimais) for anel in poligono]
+                           for poligono in geometria['coordinates']]
+        else:
+            continue
+        features.append({
+            'type': 'Feature',
+            'id': feature.get('id'),
+            'properties': {},
+            'geometry': {'type': tipo, 'coordinates': coordenadas},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def load_district_geometries(file_name, propriedade_distrito, tolerancias_zoom, casas_decimais=3):
+    """
+    Carrega o GeoJSON dos distritos e prepara uma versão simplificada por nível de zoom.
+
+    `tolerancias_zoom` mapeia o zoom mínimo de cada nível para a tolerância (em graus).
+    Cada feature recebe como 'id' o nome normalizado do distrito. Devolve {zoom_minimo: geojson}.
+    """
+    with open(file_name, encoding='utf-8') as f:
+        geojson = json.load(f)
+
+    for feature in geojson.get('features', []):
+        feature['id'] = normalize_name(feature.get('properties', {}).get(propriedade_distrito))
+
+    return {zoom: simplify_geojson(geojson, tolerancia, casas_decimais)
+            for zoom, tolerancia in sorted(tolerancias_zoom.items())}
+
+
+def zoom_level_for(cache_geometrias, zoom):
+    """Nível de geometria (zoom mínimo) adequado ao zoom actual do mapa."""
+    niveis = sorted(cache_geometrias)
+    escolhido = niveis[0]
+    for nivel in niveis:
+        if zoom is not None and zoom >= nivel:
+            escolhido = nivel
+    return escolhido
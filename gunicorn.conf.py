@@ -0,0 +1,35 @@
+"""
+Configuração do gunicorn (lida automaticamente a partir da pasta do projecto).
+
+Com PRELOAD_APP=1 a aplicação é importada e os dados carregados uma única vez no processo master,
+antes do fork dos workers. Os dados são compactados em buffers sem objectos Python por célula e o
+heap é congelado (gc.freeze), para que os workers partilhem as mesmas páginas de memória (copy-on-write).
+O número de workers vem de WEB_CONCURRENCY e a porta de PORT (comportamento por omissão do gunicorn).
+"""
+import gc
+import os
+
+timeout = 120
+preload_app = os.environ.get('PRELOAD_APP') == '1'
+
+if preload_app:
+    # Threads não sobrevivem ao fork: os dados têm de estar carregados quando o master termina o import
+    os.environ['SYNC_DATA_LOAD'] = '1'
+    os.environ['FORK_FRIENDLY_DATA'] = '1'
+    # As threads de fundo (recarga dos dados, agendador de alertas) arrancam em cada worker (post_fork),
+    # não no master
+    os.environ['THREADS_AFTER_FORK'] = '1'
+
+
+def pre_fork(server, worker):
+    # Objectos criados no master depois do carregamento também ficam fora do alcance do GC nos workers
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # A verificação de ficheiros alterados e o agendador de alertas correm em threads, que o fork não copia
+    if preload_app:
+        import app
+        app.start_reload_watcher()
+        app.start_alert_scheduler()
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# ROLLUP HIERÁRQUICO DOS KPIS (PAÍS → PROVÍNCIA → DISTRITO → POSTO ADMINISTRATIVO → ...)
+# =========================
+# Os KPIs de todos os nós da hierarquia administrativa são calculados uma vez por versão dos dados, de
+# baixo para cima. Os levantamentos são agregados uma única vez no nível mais fino (uma passagem por
+# infra). Cada nível acima é obtido dos nós filhos (somas, máximos e contagens de filhos), sem voltar a
+# ler os levantamentos. Qualquer nó (o país, uma província, um distrito, um posto...) é servido por uma
+# consulta ao dicionário caminho -> linha.
+
+SEM_NOME = 'Não especificado'  # Nível inferior em falta num levantamento
+NUNCA = 9999  # Dias parados de uma infra sem nenhum levantamento (como nas tabelas de inactividade)
+
+
+def _leaf_totals(df_base, infra_name, niveis, data_col, erro_col, ano_alvo):
+    """Contagens, erros, último levantamento e levantamentos no ano alvo de uma infra, no nível mais fino."""
+    presentes = [n for n in niveis if n in df_base.columns]
+    chaves = df_base[presentes].copy(deep=False)
+    for nivel in niveis:
+        if nivel not in presentes:
+            chaves[nivel] = SEM_NOME  # Ficheiro sem este nível: todos os levantamentos num nó "sem nome"
+    erros = df_base[erro_col] if erro_col in df_base.columns else pd.Series(0, index=df_base.index)
+    agregados = chaves.assign(_erros=erros, _data=df_base[data_col], _ano=df_base['Ano'] == ano_alvo) \
+        .groupby(niveis, dropna=False, observed=True, sort=False) \
+        .agg(**{f'Total_{infra_name}': ('_erros', 'size'), f'Erros_{infra_name}': ('_erros', 'sum'),
+                f'Ultimo_{infra_name}': ('_data', 'max'), f'Ano_{infra_name}': ('_ano', 'sum')})
+    # Níveis em falta num levantamento (NaN) também ficam no nó "sem nome"
+    return agregados.set_axis(pd.MultiIndex.from_frame(agregados.index.to_frame().astype(object).fillna(SEM_NOME)))
+
+
+def _derive(nos, infra_names, referencia, limite_pi):
+    """Métricas de um nível a partir das somas e máximos: dias parados, PI, inactividade e % de erros DAM."""
+    dias = np.column_stack([
+        (referencia - nos[f'Ultimo_{infra}']).dt.days.fillna(NUNCA).to_numpy(dtype=np.int64)
+        for infra in infra_names])
+    for j, infra in enumerate(infra_names):
+        nos[f'Dias Parados ({infra})'] = dias[:, j]
+    validos = np.where(dias != NUNCA, dias, -1)
+    nos['Max_Dias_Parados'] = dias.min(axis=1)  # o levantamento mais recente entre as infra
+    nos['PI'] = (dias >= limite_pi).sum(axis=1)
+    nos['Inactividade_Dias'] = np.where(validos.max(axis=1) >= 0, validos.max(axis=1), NUNCA)
+    nos['Total'] = nos[[f'Total_{infra}' for infra in infra_names]].sum(axis=1)
+    nos['Erros'] = nos[[f'Erros_{infra}' for infra in infra_names]].sum(axis=1)
+    nos['Percent_Erros_DAM'] = np.where(nos['Total'] > 0, 100 * nos['Erros'] / nos['Total'].clip(lower=1), 0.0)
+    nos['Cadastro_Ano_Atual'] = nos[[f'Ano_{infra}' for infra in infra_names]].sum(axis=1) > 0
+    return nos
+
+
+def _parents(filhos, infra_names, limite_activo):
+    """Nível acima: somas e máximos dos filhos, mais contagens de filhos activos e sem cadastro no ano."""
+    somas = [f'{k}_{infra}' for infra in infra_names for k in ('Total', 'Erros', 'Ano')]
+    ultimos = [f'Ultimo_{infra}' for infra in infra_names]
+    dados = filhos[somas + ultimos].assign(
+        Filhos=1, Filhos_Activos=filhos['Max_Dias_Parados'] <= limite_activo,
+        Filhos_Sem_Cadastro=~filhos['Cadastro_Ano_Atual'],
+        _inactividade=filhos['Inactividade_Dias'].where(filhos['Inactividade_Dias'] != NUNCA))
+    regras = dict.fromkeys(somas + ['Filhos', 'Filhos_Activos', 'Filhos_Sem_Cadastro'], 'sum')
+    regras.update(dict.fromkeys(ultimos, 'max'), _inactividade='mean')
+    profundidade = filhos.index.nlevels - 1
+    if profundidade:
+        pais = dados.groupby(level=list(range(profundidade)), sort=False).agg(regras)
+    else:  # O país: um único nó, sem chave
+        pais = dados.agg(regras).to_frame().T.infer_objects().set_axis(pd.Index([()]))
+    pais = pais.rename(columns={'_inactividade': 'Inactividade_Media_Filhos'})
+    pais['Percent_Filhos_Activos'] = 100 * pais['Filhos_Activos'] / pais['Filhos'].clip(lower=1)
+    return pais
+
+
+class HierarchyRollup:
+    """
+    KPIs de todos os nós da hierarquia. `node(*caminho)` devolve o dicionário de métricas de um nó
+    (node() é o país, node(provincia) uma província, ...) e `children(*caminho)` os nós filhos, ordenados.
+    """
+
+    def __init__(self, niveis, niveis_nos):
+        self.niveis = list(niveis)
+        self._nos = {}
+        self._filhos = {}
+        self._colunas = [self.niveis[:profundidade] + list(nos.columns) for profundidade, nos in enumerate(niveis_nos)]
+        for profundidade, nos in enumerate(niveis_nos):
+            registos = nos.to_dict('records')
+            caminhos = [()] if profundidade == 0 else (
+                [(chave,) for chave in nos.index] if profundidade == 1 else list(nos.index))
+            for caminho, registo in zip(caminhos, registos):
+                registo.update(zip(self.niveis, caminho))
+                self._nos[caminho] = registo
+                if caminho:
+                    self._filhos.setdefault(caminho[:-1], []).append(caminho)
+        for caminhos in self._filhos.values():
+            caminhos.sort()
+
+    def node(self, *caminho):
+        return self._nos.get(tuple(caminho))
+
+    def children(self, *caminho):
+        """Dataframe dos nós filhos (uma linha por filho, com as colunas dos níveis)."""
+        filhos = [self._nos[c] for c in self._filhos.get(tuple(caminho), [])]
+        colunas = self._colunas[min(len(caminho) + 1, len(self._colunas) - 1)]
+        return pd.DataFrame(filhos, columns=colunas) if filhos else pd.DataFrame(columns=colunas)
+
+    def __len__(self):
+        return len(self._nos)
+
+
+def build_rollup(dfs_infra, infra_names, niveis, data_col, erro_col, ano_alvo, referencia, limite_pi,
+                 limite_activo):
+    """
+    Constrói o HierarchyRollup de `niveis` (do mais alto ao mais fino) a partir dos levantamentos de cada
+    infra. Os dias parados contam-se até `referencia`; um nó tem PI = número de infra com dias parados
+    >= `limite_pi`; um filho é activo com um levantamento há no máximo `limite_activo` dias.
+    """
+    referencia = pd.Timestamp(referencia)
+    folhas = pd.concat([_leaf_totals(d, infra, niveis, data_col, erro_col, ano_alvo)
+                        for infra, d in zip(infra_names, dfs_infra)], axis=1)
+    for infra in infra_names:
+        for k in ('Total', 'Erros', 'Ano'):
+            folhas[f'{k}_{infra}'] = folhas[f'{k}_{infra}'].fillna(0).astype(np.int64)
+
+    # Do nível mais fino para o país: cada nível só lê os agregados do nível abaixo
+    niveis_nos = [_derive(folhas, infra_names, referencia, limite_pi)]
+    for _ in niveis:
+        niveis_nos.insert(0, _derive(_parents(niveis_nos[0], infra_names, limite_activo), infra_names, referencia,
+                                     limite_pi))
+    return HierarchyRollup(niveis, niveis_nos)
@@ -0,0 +1,106 @@
+import csv
+
+import pandas as pd
+
+# =========================
+# LEITURA MULTI-FORMATO DOS LEVANTAMENTOS (EXCEL, CSV, PARQUET)
+# =========================
+# O sistema de origem também exporta CSV e Parquet, muito mais rápidos de ler do que o Excel. O formato
+# é detectado pelos primeiros bytes do ficheiro (e, no CSV, pela extensão). CSV e Parquet são lidos com
+# o pyarrow (várias threads) e só as colunas pedidas são lidas/convertidas; sem pyarrow o CSV é lido
+# pelo leitor C do pandas, também só com essas colunas. Células vazias ficam nulas, como no pd.read_excel.
+
+ASSINATURA_PARQUET = b'PAR1'
+ASSINATURA_ZIP = b'PK\x03\x04'  # .xlsx é um arquivo zip
+EXTENSOES_CSV = ('.csv', '.txt')
+
+
+def detect_format(caminho):
+    """'parquet', 'xlsx' ou 'csv', a partir dos primeiros bytes do ficheiro (ValueError se desconhecido)."""
+    with open(caminho, 'rb') as f:
+        inicio = f.read(4)
+    if inicio == ASSINATURA_PARQUET:
+        return 'parquet'
+    if inicio == ASSINATURA_ZIP:
+        return 'xlsx'
+    if caminho.lower().endswith(EXTENSOES_CSV):
+        return 'csv'
+    raise ValueError(f"Formato do ficheiro '{caminho}' não reconhecido (esperado .xlsx, .csv ou .parquet).")
+
+
+def _csv_header(caminho):
+    with open(caminho, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+
+def read_csv_columns(caminho, colunas):
+    """Lê apenas `colunas` (as que existirem no cabeçalho) de um CSV em UTF-8."""
+    presentes = [c for c in _csv_header(caminho) if c in colunas]
+    try:
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return pd.read_csv(caminho, usecols=presentes, encoding='utf-8-sig')
+    tabela = pa_csv.read_csv(caminho, read_options=pa_csv.ReadOptions(use_threads=True),
+                             convert_options=pa_csv.ConvertOptions(include_columns=presentes,
+                                                                   strings_can_be_null=True))
+    return tabela.to_pandas()
+
+
+def read_parquet_columns(caminho, colunas):
+    """Lê apenas `colunas` (as que existirem no esquema) de um ficheiro Parquet (requer pyarrow)."""
+    import pyarrow.parquet as pq
+
+    presentes = [c for c in pq.read_schema(caminho).names if c in colunas]
+    return pq.read_table(caminho, columns=presentes, use_threads=True).to_pandas()
+
+
+def read_columns(caminho, formato, colunas):
+    """Lê as `colunas` de um ficheiro CSV ou Parquet; as colunas em falta ficam simplesmente ausentes."""
+    if formato == 'csv':
+        return read_csv_columns(caminho, colunas)
+    if formato == 'parquet':
+        return read_parquet_columns(caminho, colunas)
+    raise ValueError(f"Formato '{formato}' não é colunar.")
+
+
+def count_rows(caminho, formato):
+    """Número de linhas de dados (para reportar o progresso de uma leitura por blocos)."""
+    if formato == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(caminho).metadata.num_rows
+    linhas = 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            linhas += bloco.count(b'\n')
+    return max(linhas - 1, 0)  # sem o cabeçalho
+
+
+def iter_columns(caminho, formato, colunas, linhas_por_bloco=50000):
+    """
+    Lê as `colunas` de um CSV ou Parquet em blocos de dataframes, sem carregar o ficheiro inteiro.
+    No CSV as colunas vêm como texto (a inferência de tipos por bloco podia divergir entre blocos).
+    """
+    if formato == 'parquet':
+        import pyarrow.parquet as pq
+        ficheiro = pq.ParquetFile(caminho)
+        presentes = [c for c in ficheiro.schema_arrow.names if c in colunas]
+        for lote in ficheiro.iter_batches(batch_size=linhas_por_bloco, columns=presentes):
+            yield lote.to_pandas()
+        return
+    if formato != 'csv':
+        raise ValueError(f"Formato '{formato}' não é colunar.")
+
+    presentes = [c for c in _csv_header(caminho) if c in colunas]
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        yield from pd.read_csv(caminho, usecols=presentes, dtype=str, encoding='utf-8-sig',
+                               chunksize=linhas_por_bloco)
+        return
+    leitor = pa_csv.open_csv(caminho, read_options=pa_csv.ReadOptions(use_threads=True),
+                             convert_options=pa_csv.ConvertOptions(
+                                 include_columns=presentes, strings_can_be_null=True,
+                                 column_types={c: pa.string() for c in presentes}))
+    for lote in leitor:
+        yield lote.to_pandas()
@@ -0,0 +1,111 @@
+import json
+import queue
+import threading
+import time
+
+# =========================
+# DIFUSÃO DAS ACTUALIZAÇÕES DE DADOS (SERVER-SENT EVENTS)
+# =========================
+# Quando a versão dos dados muda (recarga ou levantamentos juntados), o estado visível nas páginas (valores
+# dos KPIs e linhas das tabelas de distritos) é comparado com o anterior e só a diferença é enviada, uma
+# vez, a todos os navegadores ligados a este worker. O navegador aplica-a com actualizações parciais das
+# props (assets/actualizacoes.js), sem voltar a pedir a página. Cada ligação ocupa uma thread do worker
+# durante no máximo `duracao_max_s` segundos; depois o EventSource do navegador volta a ligar-se sozinho.
+
+
+def format_event(evento, dados, versao=None):
+    """Mensagem SSE; o id (versão dos dados) volta no cabeçalho Last-Event-ID quando o navegador se religa."""
+    linhas = [f"event: {evento}"]
+    if versao:
+        linhas.append(f"id: {versao}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(linhas) + '\n\n'
+
+
+def diff_snapshots(anterior, actual):
+    """
+    Diferença entre dois estados {'estrutura': ..., 'kpis': {id: texto}, 'linhas': {grupo: {chave: linha}}}:
+    os KPIs com outro texto e, por grupo, as linhas novas ou alteradas. None se a estrutura mudou (a
+    página tem de ser desenhada de novo).
+    """
+    if anterior['estrutura'] != actual['estrutura']:
+        return None
+    kpis = {id_kpi: texto for id_kpi, texto in actual['kpis'].items() if anterior['kpis'].get(id_kpi) != texto}
+    linhas = {}
+    for grupo, novas in actual['linhas'].items():
+        antigas = anterior['linhas'].get(grupo, {})
+        alteradas = [linha for chave, linha in novas.items() if antigas.get(chave) != linha]
+        if alteradas:
+            linhas[grupo] = alteradas
+    return {'kpis': kpis, 'linhas': linhas}
+
+
+class RefreshBroadcaster:
+    """
+    Canal de actualizações de um worker. `publish(versao, estado)` é chamado depois de cada mudança dos
+    dados; `stream(versao_cliente)` devolve o gerador de texto SSE de uma ligação (None se o limite de
+    ligações simultâneas foi atingido).
+    """
+
+    def __init__(self, max_clientes=32, keepalive_s=15, duracao_max_s=300, religar_ms=3000):
+        self.max_clientes = max_clientes
+        self.keepalive_s = keepalive_s
+        self.duracao_max_s = duracao_max_s
+        self.religar_ms = religar_ms
+        self._clientes = set()  # uma fila por ligação
+        self._lock = threading.Lock()
+        self._versao = self._estado = self._ultimo_delta = None
+        self.difundidos = 0
+
+    def publish(self, versao, estado):
+        """Guarda o novo estado e difunde a diferença para o anterior. Devolve a mensagem enviada (ou None)."""
+        with self._lock:
+            anterior, versao_anterior = self._estado, self._versao
+            self._versao, self._estado = versao, estado
+            if anterior is None or versao == versao_anterior:
+                return None
+            delta = diff_snapshots(anterior, estado)
+            if delta is None:
+                self._ultimo_delta = None
+                mensagem = format_event('recarregar', {'de': versao_anterior, 'para': versao}, versao)
+            else:
+                self._ultimo_delta = dict(delta, de=versao_anterior, para=versao)
+                mensagem = format_event('delta', self._ultimo_delta, versao)
+            for fila in self._clientes:
+                fila.put(mensagem)
+            self.difundidos += 1
+        return mensagem
+
+    def stream(self, versao_cliente=None):
+        fila = queue.Queue()
+        with self._lock:
+            if len(self._clientes) >= self.max_clientes:
+                return None
+            self._clientes.add(fila)
+            versao, ultimo_delta = self._versao, self._ultimo_delta
+
+        def gerar():
+            try:
+                yield f"retry: {self.religar_ms}\n\n"
+                # Um navegador que se religa com a versão anterior recebe o último delta; mais atrasado, recarrega
+                if not versao_cliente or versao_cliente == versao:
+                    yield format_event('versao', {'para': versao}, versao)
+                elif ultimo_delta is not None and ultimo_delta['de'] == versao_cliente:
+                    yield format_event('delta', ultimo_delta, versao)
+                else:
+                    yield format_event('recarregar', {'de': versao_cliente, 'para': versao}, versao)
+                fim = time.time() + self.duracao_max_s
+                while time.time() < fim:
+                    try:
+                        yield fila.get(timeout=max(min(self.keepalive_s, fim - time.time()), 0.1))
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+            finally:
+                with self._lock:
+                    self._clientes.discard(fila)
+
+        return gerar()
+
+    def stats(self):
+        with self._lock:
+            return {'versao': self._versao, 'clientes': len(self._clientes), 'difundidos': self.difundidos}
@@ -0,0 +1,118 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# MOTOR DE REGRAS DE QUALIDADE (DAM)
+# =========================
+# Cada regra é declarada como um dicionário {'nome', 'tipo', ...parâmetros} e avaliada como
+# uma máscara booleana vectorizada sobre o dataframe completo (sem apply linha a linha).
+
+
+def _mascara_obrigatorio(df, regra, contexto):
+    """Registos com pelo menos um campo obrigatório vazio (ou coluna inexistente)."""
+    mascara = np.zeros(len(df), dtype=bool)
+    for col in regra['colunas']:
+        if col not in df.columns:
+            return np.ones(len(df), dtype=bool)
+        valores = df[col]
+        vazio = valores.isna()
+        if valores.dtype == object or pd.api.types.is_string_dtype(valores):
+            vazio = vazio | (valores.astype(str).str.strip() == '')
+        mascara |= vazio.to_numpy()
+    return mascara
+
+
+def _mascara_duplicado(df, regra, contexto):
+    """Registos cujo código (ou combinação de colunas) aparece mais de uma vez."""
+    colunas = [c for c in regra['colunas'] if c in df.columns]
+    if len(colunas) != len(regra['colunas']):
+        return np.zeros(len(df), dtype=bool)
+    preenchido = df[colunas].notna().all(axis=1).to_numpy()
+    return df.duplicated(colunas, keep=False).to_numpy() & preenchido
+
+
+def _mascara_data_futura(df, regra, contexto):
+    """Registos com data posterior ao dia da avaliação."""
+    datas = pd.to_datetime(df[regra['coluna']], errors='coerce')
+    return (datas > contexto['hoje']).to_numpy()
+
+
+def _mascara_intervalo_datas(df, regra, contexto):
+    """Registos com data anterior ao mínimo plausível configurado."""
+    datas = pd.to_datetime(df[regra['coluna']], errors='coerce')
+    return (datas < pd.Timestamp(regra['minimo'])).to_numpy()
+
+
+def _mascara_hierarquia(df, regra, contexto):
+    """Registos cujo par (filho, pai) não corresponde ao pai de referência do filho."""
+    filho, pai = regra['filho'], regra['pai']
+    referencia = contexto['referencias'].get((filho, pai))
+    if referencia is None or filho not in df.columns or pai not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    esperado = df[filho].map(referencia)
+    return (esperado.notna() & (esperado != df[pai])).to_numpy()
+
+
+TIPOS_REGRA = {
+    'obrigatorio': _mascara_obrigatorio,
+    'duplicado': _mascara_duplicado,
+    'data_futura': _mascara_data_futura,
+    'intervalo_datas': _mascara_intervalo_datas,
+    'hierarquia': _mascara_hierarquia,
+}
+
+
+def build_hierarchy_reference(dfs, filho, pai):
+    """Pai mais frequente de cada filho (ex.: Província de cada Distrito) considerando todos os datasets."""
+    pares = pd.concat([d[[filho, pai]] for d in dfs if filho in d.columns and pai in d.columns]).dropna()
+    if pares.empty:
+        return pd.Series(dtype=object)
+    contagem = pares.groupby([filho, pai]).size().reset_index(name='n')
+    contagem = contagem.sort_values('n', ascending=False).drop_duplicates(filho)
+    return contagem.set_index(filho)[pai]
+
+
+def evaluate_rules(df, regras, grupos, referencias=None, hoje=None):
+    """
+    Avalia todas as regras sobre o dataframe numa única passagem.
+
+    Devolve um dicionário com:
+      - 'mascaras': DataFrame booleano (uma coluna por regra, alinhado com df)
+      - 'contagens': erros por regra agregados pelos `grupos`, com 'Registos_Com_Erro' e 'Total_Registos'
+      - 'tempos': tempo de execução (ms) de cada regra face ao orçamento ('orcamento_ms')
+    """
+    contexto = {
+        'hoje': hoje if hoje is not None else pd.to_datetime(datetime.now().date()),
+        'referencias': referencias or {},
+    }
+
+    mascaras = {}
+    tempos = []
+    for regra in regras:
+        inicio = time.perf_counter()
+        mascaras[regra['nome']] = TIPOS_REGRA[regra['tipo']](df, regra, contexto)
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        orcamento_ms = regra.get('orcamento_ms')
+        excedido = orcamento_ms is not None and duracao_ms > orcamento_ms
+        if excedido:
+            print(f"AVISO: A regra de qualidade '{regra['nome']}' levou {duracao_ms:.1f} ms "
+                  f"(orçamento: {orcamento_ms} ms).")
+        tempos.append({'Regra': regra['nome'], 'Tempo_ms': round(duracao_ms, 3),
+                       'Orcamento_ms': orcamento_ms, 'Excedido': excedido})
+
+    df_mascaras = pd.DataFrame(mascaras, index=df.index, columns=[r['nome'] for r in regras], dtype=bool)
+
+    df_contagens = df_mascaras.astype(np.int64)
+    df_contagens['Registos_Com_Erro'] = df_mascaras.any(axis=1).astype(np.int64)
+    df_contagens['Total_Registos'] = 1
+    chaves = [df[g] for g in grupos]
+    df_contagens = df_contagens.groupby(chaves, dropna=False).sum()
+
+    return {
+        'mascaras': df_mascaras,
+        'contagens': df_contagens,
+        'tempos': pd.DataFrame(tempos, columns=['Regra', 'Tempo_ms', 'Orcamento_ms', 'Excedido']),
+    }
@@ -0,0 +1,219 @@
+"""
+Relatórios estáticos (HTML) do resumo de cada província e de cada distrito.
+
+Reutiliza o callback `update_detail_content` do dashboard: os dados são carregados uma vez no processo
+principal e as províncias são geradas em paralelo por um conjunto de processos criados por fork (que
+partilham os dados já carregados). Só são regeneradas as províncias cujos levantamentos mudaram desde
+a última execução (impressões digitais guardadas em `manifesto.json` na pasta de saída).
+
+Se o kaleido estiver instalado, cada gráfico é também exportado como PNG.
+
+Uso (a partir da pasta com os ficheiros *_cleaned.xlsx):
+    python /caminho/para/reports.py [--saida relatorios] [--processos 4] [--janela 14] [--forcar]
+"""
+import argparse
+import hashlib
+import html as html_std
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+
+os.environ.setdefault('SYNC_DATA_LOAD', '1')  # os dados têm de estar prontos antes do fork
+# Sem threads de fundo (recarga dos dados, alertas): um processo do pool podia herdar bloqueio_dados adquirido
+os.environ['THREADS_AFTER_FORK'] = '1'
+
+import app  # noqa: E402
+from dash import dash_table, dcc  # noqa: E402
+from plotly.offline import get_plotlyjs_version  # noqa: E402
+
+MANIFESTO = 'manifesto.json'
+
+# Componentes dbc sem equivalente directo em HTML: classe CSS do Bootstrap a usar no <div>
+CLASSES_DBC = {'Row': 'row', 'Card': 'card', 'CardBody': 'card-body', 'CardHeader': 'card-header'}
+
+
+def slug(nome):
+    """Nome de ficheiro seguro (sem acentos nem espaços) para uma província ou distrito."""
+    sem_acentos = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', sem_acentos.lower()).strip('-') or 'sem-nome'
+
+
+def _estilo(estilo):
+    # Dash aceita tanto 'font-size' como 'fontSize'
+    return '; '.join(f"{re.sub('([A-Z])', lambda m: '-' + m.group(1), k).lower()}: {v}"
+                     for k, v in (estilo or {}).items())
+
+
+def _atributos(props):
+    atributos = []
+    if props.get('id'):
+        atributos.append(f'id="{html_std.escape(str(props["id"]))}"')
+    if props.get('className'):
+        atributos.append(f'class="{html_std.escape(props["className"])}"')
+    if props.get('style'):
+        atributos.append(f'style="{html_std.escape(_estilo(props["style"]))}"')
+    return (' ' + ' '.join(atributos)) if atributos else ''
+
+
+def _tabela_html(tabela):
+    colunas = tabela.columns or []
+    cabecalho = ''.join(f"<th>{html_std.escape(str(c['name']))}</th>" for c in colunas)
+    linhas = ''.join('<tr>' + ''.join(f"<td>{html_std.escape(str(linha.get(c['id'], '')))}</td>" for c in colunas)
+                     + '</tr>' for linha in (tabela.data or []))
+    return (f'<table class="table table-dark table-sm table-bordered text-center small">'
+            f'<thead><tr>{cabecalho}</tr></thead><tbody>{linhas}</tbody></table>')
+
+
+def component_to_html(componente, graficos):
+    """
+    Converte a árvore de componentes Dash devolvida pelos callbacks em HTML estático.
+    As figuras são acumuladas em `graficos` (para exportação opcional em PNG).
+    """
+    if componente is None:
+        return ''
+    if isinstance(componente, (list, tuple)):
+        return ''.join(component_to_html(c, graficos) for c in componente)
+    if not hasattr(componente, 'to_plotly_json'):
+        return html_std.escape(str(componente))
+
+    import plotly.io as pio
+
+    nome = type(componente).__name__
+    props = {k: getattr(componente, k, None) for k in ('id', 'className', 'style')}
+    if isinstance(componente, dcc.Graph):
+        graficos.append(componente.figure)
+        return pio.to_html(componente.figure, include_plotlyjs=False, full_html=False,
+                           default_height=app.UNIFORM_HEIGHT)
+    if isinstance(componente, dash_table.DataTable):
+        return _tabela_html(componente)
+    if componente.__module__.startswith('dash.dcc'):
+        return ''  # Controlos interactivos (dropdowns, stores) não fazem sentido num relatório estático
+
+    filhos = component_to_html(getattr(componente, 'children', None), graficos)
+    if componente.__module__.startswith('dash_bootstrap_components'):
+        classe = CLASSES_DBC.get(nome, '')
+        if nome == 'Col':
+            classe = f"col-md-{componente.md}" if getattr(componente, 'md', None) else 'col'
+        props['className'] = ' '.join(filter(None, [classe, props.get('className')]))
+        return f"<div{_atributos(props)}>{filhos}</div>"
+
+    etiqueta = nome.lower()
+    return f"<{etiqueta}{_atributos(props)}>{filhos}</{etiqueta}>"
+
+
+def html_page(titulo, corpo, ligacoes=''):
+    return f"""<!DOCTYPE html>
+<html lang="pt"><head><meta charset="utf-8"><title>{html_std.escape(titulo)}</title>
+<link rel="stylesheet" href="{app.dbc.themes.CYBORG}">
+<link rel="stylesheet" href="https://use.fontawesome.com/releases/v5.8.1/css/all.css">
+<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script></head>
+<body class="p-4">{ligacoes}{corpo}
+<p class="mt-5 text-muted small">Gerado em {time.strftime('%Y-%m-%d %H:%M')}.</p></body></html>"""
+
+
+def export_images(graficos, prefixo):
+    """Exporta as figuras em PNG se houver um renderizador local (kaleido); devolve o número exportado."""
+    try:
+        import kaleido  # noqa: F401
+        import plotly.io as pio
+    except ImportError:
+        return 0
+    for i, figura in enumerate(graficos, start=1):
+        pio.write_image(figura, f"{prefixo}_grafico{i}.png", width=1000, height=450)
+    return len(graficos)
+
+
+def province_fingerprint(provincia, janela):
+    """
+    Impressão digital dos levantamentos da província (3 infra), dos parâmetros do relatório e do que os
+    resultados também dependem: a data a que os dias parados se referem e o ano alvo.
+    """
+    partes = [app.armazenamento.fingerprint(infra, provincia) for infra in app.INFRA_NAMES]
+    partes += [f"janela={janela}", f"referencia={app.actividade_janelas['referencia']}", f"ano={app.TARGET_YEAR}"]
+    return hashlib.sha1('|'.join(partes).encode()).hexdigest()[:16]
+
+
+def render_province(tarefa):
+    """Gera (num processo do pool) o resumo da província e o detalhe de cada um dos seus distritos."""
+    provincia, janela, saida = tarefa
+    inicio = time.perf_counter()
+    pasta = os.path.join(saida, slug(provincia))
+    os.makedirs(pasta, exist_ok=True)
+    calcular = app.update_detail_content.__wrapped__  # sem a cache de resultados: cada página é gerada uma vez
+
+    distritos = app.armazenamento.distinct('Fontes', app.DISTRITO_COL, provincia)
+    ligacoes = ('<p><a href="../index.html">&larr; Todas as províncias</a> | Distritos: ' +
+                ' · '.join(f'<a href="{slug(d)}.html">{html_std.escape(d)}</a>' for d in distritos) + '</p>')
+
+    graficos = []
+    corpo = component_to_html(calcular(provincia, None, janela), graficos)
+    with open(os.path.join(pasta, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(html_page(f"Resumo - {provincia}", corpo, ligacoes))
+    imagens = export_images(graficos, os.path.join(pasta, 'index'))
+
+    for distrito in distritos:
+        graficos = []
+        corpo = component_to_html(calcular(provincia, distrito, janela), graficos)
+        with open(os.path.join(pasta, f"{slug(distrito)}.html"), 'w', encoding='utf-8') as f:
+            f.write(html_page(f"{distrito} ({provincia})", corpo,
+                              '<p><a href="index.html">&larr; Resumo da província</a></p>'))
+        imagens += export_images(graficos, os.path.join(pasta, slug(distrito)))
+
+    return provincia, len(distritos) + 1, imagens, time.perf_counter() - inicio
+
+
+def write_index(saida, provincias):
+    itens = ''.join(f'<li><a href="{slug(p)}/index.html">{html_std.escape(p)}</a></li>' for p in provincias)
+    with open(os.path.join(saida, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(html_page("Relatórios por Província", f"<h3>RELATÓRIOS POR PROVÍNCIA</h3><ul>{itens}</ul>"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--saida', default='relatorios', help='Pasta de saída')
+    parser.add_argument('--processos', type=int, default=os.cpu_count(), help='Processos em paralelo')
+    parser.add_argument('--janela', type=int, default=app.DAYS_THRESHOLD, choices=app.ACTIVITY_WINDOWS,
+                        help='Limite de inactividade (dias)')
+    parser.add_argument('--forcar', action='store_true', help='Regenera todas as províncias')
+    args = parser.parse_args()
+
+    app.DADOS_PRONTOS.wait()
+    if app.estado_carregamento['estado'] != 'pronto':
+        print(f"ERRO: os dados não foram carregados: {app.estado_carregamento['erro']}")
+        sys.exit(1)
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho_manifesto = os.path.join(args.saida, MANIFESTO)
+    manifesto = {}
+    if os.path.exists(caminho_manifesto) and not args.forcar:
+        with open(caminho_manifesto, encoding='utf-8') as f:
+            manifesto = json.load(f)
+
+    provincias = app.armazenamento.distinct('Fontes', app.PROVINCIA_COL)
+    impressoes = {p: province_fingerprint(p, args.janela) for p in provincias}
+    pendentes = [p for p in provincias if manifesto.get(p) != impressoes[p]
+                 or not os.path.exists(os.path.join(args.saida, slug(p), 'index.html'))]
+    print(f"{len(provincias)} províncias; {len(pendentes)} a regenerar "
+          f"({len(provincias) - len(pendentes)} sem alterações).")
+
+    inicio = time.perf_counter()
+    if pendentes:
+        # fork: os processos herdam os dados já carregados (sem voltar a ler os ficheiros)
+        with multiprocessing.get_context('fork').Pool(max(1, min(args.processos, len(pendentes)))) as pool:
+            for provincia, paginas, imagens, duracao in pool.imap_unordered(
+                    render_province, [(p, args.janela, args.saida) for p in pendentes]):
+                manifesto[provincia] = impressoes[provincia]
+                print(f"  {provincia}: {paginas} páginas, {imagens} imagens em {duracao:.1f} s")
+                with open(caminho_manifesto, 'w', encoding='utf-8') as f:
+                    json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    write_index(args.saida, provincias)
+    print(f"Relatórios em '{args.saida}' ({time.perf_counter() - inicio:.1f} s).")
+
+
+if __name__ == '__main__':
+    main()
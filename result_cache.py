@@ -0,0 +1,282 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# =========================
+# CACHE DE RESULTADOS DOS CALLBACKS (MEMÓRIA + DISCO PARTILHADO)
+# =========================
+# Chave: (versão dos dados, callback, inputs). Pedidos concorrentes com a mesma chave esperam por um
+# único cálculo (single-flight): entre threads com um Event, entre processos com uma reserva na
+# tabela SQLite. O nível em disco é opcional e sobrevive a reinícios dos workers.
+# O nível em memória é limitado em bytes (tamanho serializado de cada resultado, não número de entradas);
+# as visitas por inputs são contadas para pré-aquecer os resultados mais pedidos no arranque.
+
+
+def snapshot_version(ficheiros):
+    """Versão dos dados: hash do nome, tamanho e data de modificação de cada ficheiro (igual em todos os workers)."""
+    assinatura = []
+    for nome in ficheiros:
+        try:
+            estado = os.stat(nome)
+            assinatura.append(f"{nome}:{estado.st_size}:{estado.st_mtime_ns}")
+        except OSError:
+            assinatura.append(f"{nome}:ausente")
+    return hashlib.sha1('|'.join(assinatura).encode()).hexdigest()[:16]
+
+
+class _DiskTier:
+    """Nível partilhado num ficheiro SQLite: resultados (pickle) e reservas de cálculo em curso."""
+
+    def __init__(self, caminho, reserva_s):
+        self.caminho = caminho
+        self.reserva_s = reserva_s
+        with self._ligacao() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS resultados (chave TEXT PRIMARY KEY, valor BLOB, criado REAL)")
+            con.execute("CREATE TABLE IF NOT EXISTS reservas (chave TEXT PRIMARY KEY, expira REAL)")
+
+    def _ligacao(self):
+        # Uma ligação por operação: as ligações SQLite não podem ser partilhadas entre threads/fork
+        return sqlite3.connect(self.caminho, timeout=10)
+
+    def get_raw(self, chave):
+        with self._ligacao() as con:
+            linha = con.execute("SELECT valor FROM resultados WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else None
+
+    def set(self, chave, serializado):
+        with self._ligacao() as con:
+            con.execute("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?)", (chave, serializado, time.time()))
+            con.execute("DELETE FROM reservas WHERE chave = ?", (chave,))
+
+    def claim(self, chave):
+        """Tenta reservar o cálculo da chave; False se outro processo já o está a fazer."""
+        agora = time.time()
+        with self._ligacao() as con:
+            con.execute("DELETE FROM reservas WHERE chave = ? AND expira < ?", (chave, agora))
+            cursor = con.execute("INSERT OR IGNORE INTO reservas VALUES (?, ?)", (chave, agora + self.reserva_s))
+            return cursor.rowcount == 1
+
+    def release(self, chave):
+        with self._ligacao() as con:
+            con.execute("DELETE FROM reservas WHERE chave = ?", (chave,))
+
+    def purge_other_versions(self, versao):
+        with self._ligacao() as con:
+            con.execute("DELETE FROM resultados WHERE chave NOT LIKE ?", (f"{versao}|%",))
+
+
+class _VisitLog:
+    """Contagem de visitas por (callback, inputs), acumulada num ficheiro JSON partilhado pelos workers."""
+
+    def __init__(self, caminho, gravar_cada=50):
+        self.caminho = caminho
+        self.gravar_cada = gravar_cada
+        self._pendentes = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, nome, argumentos):
+        with self._lock:
+            self._pendentes[json.dumps([nome, list(argumentos)], ensure_ascii=False)] += 1
+            gravar = sum(self._pendentes.values()) >= self.gravar_cada
+        if gravar:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, Counter()
+        if not pendentes:
+            return
+        # Leitura-soma-escrita sob flock: vários workers acumulam no mesmo ficheiro
+        with open(self.caminho + '.lock', 'a') as bloqueio:
+            fcntl.flock(bloqueio, fcntl.LOCK_EX)
+            totais = Counter(self._read())
+            totais.update(pendentes)
+            temporario = f"{self.caminho}.{os.getpid()}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(totais, f, ensure_ascii=False)
+            os.replace(temporario, self.caminho)
+
+    def _read(self):
+        if not os.path.exists(self.caminho):
+            return {}
+        with open(self.caminho, encoding='utf-8') as f:
+            return json.load(f)
+
+    def most_visited(self, nome, n):
+        """Os `n` tuplos de inputs mais visitados de um callback."""
+        contagens = Counter(self._read())
+        contagens.update(self._pendentes)
+        escolhidos = []
+        for chave, _ in contagens.most_common():
+            nome_chave, argumentos = json.loads(chave)
+            if nome_chave == nome:
+                escolhidos.append(tuple(argumentos))
+                if len(escolhidos) == n:
+                    break
+        return escolhidos
+
+
+class ResultCache:
+    """
+    Cache de resultados de callbacks com coalescência de pedidos.
+
+    `versao` é uma função que devolve a versão actual dos dados (None = não guardar, p. ex. durante o
+    carregamento). O nível em memória guarda no máximo `max_bytes` (tamanho serializado), expulsando
+    os resultados menos usados recentemente. `caminho_disco` activa o nível SQLite partilhado entre
+    processos e `caminho_visitas` a contagem de visitas usada por warm_up().
+    """
+
+    def __init__(self, versao, max_bytes=64 * 1024 ** 2, caminho_disco=None, caminho_visitas=None,
+                 reserva_s=60, espera_s=0.05):
+        self.versao = versao
+        self.max_bytes = max_bytes
+        self.espera_s = espera_s
+        self.disco = _DiskTier(caminho_disco, reserva_s) if caminho_disco else None
+        self.visitas = _VisitLog(caminho_visitas) if caminho_visitas else None
+        self._memoria = OrderedDict()  # chave -> (valor, bytes)
+        self._bytes = 0
+        self._em_curso = {}
+        self._funcoes = {}
+        self._lock = threading.Lock()
+        self.estatisticas = {'memoria': 0, 'disco': 0, 'coalescidos': 0, 'calculados': 0, 'expulsoes': 0}
+
+    def _guardar_memoria(self, chave, valor, tamanho):
+        if tamanho > self.max_bytes:
+            return  # maior do que o limite inteiro: não vale a pena esvaziar a cache por ele
+        with self._lock:
+            if chave in self._memoria:
+                self._bytes -= self._memoria.pop(chave)[1]
+            self._memoria[chave] = (valor, tamanho)
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes:
+                _, (_, tamanho_expulso) = self._memoria.popitem(last=False)
+                self._bytes -= tamanho_expulso
+                self.estatisticas['expulsoes'] += 1
+
+    def _ler(self, chave):
+        with self._lock:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                self.estatisticas['memoria'] += 1
+                return True, self._memoria[chave][0]
+        if self.disco is not None:
+            serializado = self.disco.get_raw(chave)
+            if serializado is not None:
+                valor = pickle.loads(serializado)
+                self._guardar_memoria(chave, valor, len(serializado))
+                self.estatisticas['disco'] += 1
+                return True, valor
+        return False, None
+
+    def _calcular(self, calcular):
+        self.estatisticas['calculados'] += 1
+        valor = calcular()
+        return valor, pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _calcular_entre_processos(self, chave, calcular):
+        """
+        Só um processo calcula a chave; os outros esperam que o resultado apareça no disco.
+        Devolve (valor, valor serializado); o tamanho serializado é o peso do resultado na memória.
+        """
+        if self.disco is None:
+            return self._calcular(calcular)
+        while not self.disco.claim(chave):
+            time.sleep(self.espera_s)
+            serializado = self.disco.get_raw(chave)
+            if serializado is not None:
+                self.estatisticas['coalescidos'] += 1
+                return pickle.loads(serializado), serializado
+        try:
+            serializado = self.disco.get_raw(chave)  # pode ter sido escrito entre a leitura inicial e a reserva
+            if serializado is not None:
+                return pickle.loads(serializado), serializado
+            valor, serializado = self._calcular(calcular)
+            self.disco.set(chave, serializado)
+            return valor, serializado
+        finally:
+            self.disco.release(chave)
+
+    def get_or_compute(self, nome, argumentos, calcular):
+        versao = self.versao()
+        if versao is None:
+            return calcular()
+        chave = f"{versao}|{nome}|{argumentos!r}"
+
+        encontrado, valor = self._ler(chave)
+        if encontrado:
+            return valor
+
+        with self._lock:
+            evento = self._em_curso.get(chave)
+            lider = evento is None
+            if lider:
+                evento = self._em_curso[chave] = threading.Event()
+        if not lider:
+            # Outra thread deste processo já está a calcular: espera pelo resultado dela
+            evento.wait()
+            if hasattr(evento, 'valor'):
+                self.estatisticas['coalescidos'] += 1
+                return evento.valor
+            return calcular()  # o cálculo do líder falhou: calcula (e propaga o erro) localmente
+
+        try:
+            valor, serializado = self._calcular_entre_processos(chave, calcular)
+            self._guardar_memoria(chave, valor, len(serializado))
+            evento.valor = valor  # entregue às threads em espera mesmo que não caiba na memória
+            return valor
+        finally:
+            with self._lock:
+                del self._em_curso[chave]
+            evento.set()
+
+    def cached(self, nome):
+        """Decorador para callbacks Dash: os argumentos posicionais (inputs/states) fazem parte da chave."""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def envolvida(*args):
+                if self.visitas is not None:
+                    self.visitas.record(nome, args)
+                return self.get_or_compute(nome, args, lambda: funcao(*args))
+            self._funcoes[nome] = funcao
+            return envolvida
+        return decorador
+
+    def warm_up(self, nome, n):
+        """Calcula (e guarda) os resultados dos `n` inputs mais visitados de um callback. Devolve quantos."""
+        if self.visitas is None or nome not in self._funcoes or n <= 0:
+            return 0
+        funcao = self._funcoes[nome]
+        aquecidos = 0
+        for argumentos in self.visitas.most_visited(nome, n):
+            try:
+                self.get_or_compute(nome, argumentos, lambda: funcao(*argumentos))
+                aquecidos += 1
+            except Exception as e:
+                # Inputs antigos podem já não existir nos dados (p. ex. distrito renomeado)
+                print(f"AVISO: Pré-aquecimento de {nome}{argumentos} falhou: {e}")
+        return aquecidos
+
+    def stats(self):
+        """Estatísticas do processo: acertos por nível, taxa de acerto, bytes guardados e expulsões."""
+        with self._lock:
+            resultado = dict(self.estatisticas, entradas=len(self._memoria), bytes=self._bytes,
+                             max_bytes=self.max_bytes, pid=os.getpid())
+        pedidos = sum(resultado[k] for k in ('memoria', 'disco', 'coalescidos', 'calculados'))
+        resultado['taxa_acerto'] = round((pedidos - resultado['calculados']) / pedidos, 4) if pedidos else None
+        return resultado
+
+    def clear(self, versao_actual=None):
+        """Limpa o nível em memória e, no disco, as entradas de outras versões dos dados."""
+        with self._lock:
+            self._memoria.clear()
+            self._bytes = 0
+        if self.disco is not None and versao_actual is not None:
+            self.disco.purge_other_versions(versao_actual)
@@ -0,0 +1,103 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+import zipfile
+
+# =========================
+# INSTANTÂNEO DO ESTADO PRÉ-CALCULADO (MODO SÓ DE LEITURA)
+# =========================
+# O estado do dashboard (agregados, KPIs, tabelas, geometrias) é gravado num único ficheiro ZIP com pickle
+# (protocolo 5). Os buffers dos arrays NumPy (colunas dos dataframes, cubo, contagens...) saem da sequência
+# pickle e ficam em membros próprios, não comprimidos e alinhados: na leitura são mapeados em memória
+# (mmap) e os arrays reconstruídos directamente sobre o mapeamento, sem cópia nem descompressão. Só a
+# sequência pickle (os objectos pequenos) é comprimida e interpretada no arranque.
+
+FORMATO = 1
+MEMBRO_METADADOS = 'metadados.json'
+MEMBRO_ESTADO = 'estado.pkl'
+PREFIXO_BUFFERS = 'buffers/'
+ALINHAMENTO = 64  # bytes: o início de cada buffer fica alinhado para os arrays NumPy
+BUFFER_MINIMO = 4096  # Buffers mais pequenos ficam dentro da sequência pickle (não compensa um membro)
+CABECALHO_LOCAL = 30  # Tamanho fixo do cabeçalho local de um membro ZIP
+EXTRA_ALINHAMENTO = 0xD935  # Identificador do campo extra de enchimento (o mesmo do zipalign)
+
+
+def _write_aligned(zf, nome, dados, compressao):
+    """Grava um membro; não comprimido, o início dos dados fica alinhado a ALINHAMENTO bytes."""
+    info = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+    info.compress_type = compressao
+    if compressao == zipfile.ZIP_STORED:
+        # O zipfile acrescenta 20 bytes de extra ZIP64 aos membros grandes (mesma regra que _open_to_write)
+        zip64 = len(dados) * 1.05 > zipfile.ZIP64_LIMIT
+        inicio = zf.fp.tell() + CABECALHO_LOCAL + len(nome.encode('ascii')) + 4 + (20 if zip64 else 0)
+        enchimento = -inicio % ALINHAMENTO
+        info.extra = struct.pack('<HH', EXTRA_ALINHAMENTO, enchimento) + bytes(enchimento)
+    zf.writestr(info, dados)
+
+
+def write_snapshot(caminho, estado, metadados, comprimir_buffers=False):
+    """
+    Grava `estado` (objectos serializáveis com pickle) e `metadados` (JSON) em `caminho`. Com
+    `comprimir_buffers` os arrays também são comprimidos: ficheiro mais pequeno para transferir, mas lido
+    para memória em vez de mapeado. Devolve o número de buffers fora da sequência pickle.
+    """
+    buffers = []
+
+    def fora_da_sequencia(buffer):
+        if buffer.raw().nbytes < BUFFER_MINIMO:
+            return True  # verdadeiro: o buffer fica dentro da sequência pickle
+        buffers.append(buffer)
+        return False
+
+    sequencia = pickle.dumps(estado, protocol=5, buffer_callback=fora_da_sequencia)
+    compressao = zipfile.ZIP_DEFLATED if comprimir_buffers else zipfile.ZIP_STORED
+    metadados = dict(metadados, formato=FORMATO, buffers=len(buffers), criado_em=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with zipfile.ZipFile(caminho + '.tmp', 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        zf.writestr(MEMBRO_METADADOS, json.dumps(metadados, ensure_ascii=False, indent=2))
+        zf.writestr(MEMBRO_ESTADO, sequencia)
+        for i, buffer in enumerate(buffers):
+            _write_aligned(zf, f"{PREFIXO_BUFFERS}{i:05d}", buffer.raw(), compressao)
+    # Os processos que estão a ler o ficheiro anterior continuam com o mapeamento antigo
+    os.replace(caminho + '.tmp', caminho)
+    return len(buffers)
+
+
+def _data_offset(mapa, info):
+    """Posição dos dados de um membro no ficheiro (depois do cabeçalho local, que tem o seu próprio extra)."""
+    cabecalho = mapa[info.header_offset:info.header_offset + CABECALHO_LOCAL]
+    if cabecalho[:4] != b'PK\x03\x04':
+        raise ValueError(f"cabeçalho inválido no membro '{info.filename}'")
+    tamanho_nome, tamanho_extra = struct.unpack('<HH', cabecalho[26:30])
+    return info.header_offset + CABECALHO_LOCAL + tamanho_nome + tamanho_extra
+
+
+def read_metadata(caminho):
+    """Metadados de um instantâneo (sem ler o estado)."""
+    with zipfile.ZipFile(caminho) as zf:
+        return json.loads(zf.read(MEMBRO_METADADOS))
+
+
+def read_snapshot(caminho):
+    """
+    Lê um instantâneo gravado por write_snapshot. Devolve (metadados, estado); os arrays dos buffers não
+    comprimidos ficam mapeados em memória (só de leitura) e partilham as páginas entre processos.
+    """
+    with open(caminho, 'rb') as f:
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with zipfile.ZipFile(caminho) as zf:
+        metadados = json.loads(zf.read(MEMBRO_METADADOS))
+        if metadados.get('formato') != FORMATO:
+            raise ValueError(f"formato de instantâneo não suportado: {metadados.get('formato')} (esperado {FORMATO})")
+        vista, buffers = memoryview(mapa), []
+        for i in range(metadados['buffers']):
+            info = zf.getinfo(f"{PREFIXO_BUFFERS}{i:05d}")
+            if info.compress_type == zipfile.ZIP_STORED:
+                inicio = _data_offset(mapa, info)
+                buffers.append(vista[inicio:inicio + info.file_size])
+            else:
+                buffers.append(zf.read(info))
+        estado = pickle.loads(zf.read(MEMBRO_ESTADO), buffers=buffers)
+    return metadados, estado
@@ -0,0 +1,228 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# ARMAZENAMENTO DOS LEVANTAMENTOS (PANDAS EM MEMÓRIA OU SQLITE EMBUTIDO)
+# =========================
+# Os callbacks só pedem contagens, valores distintos e os últimos registos, sempre filtrados por
+# província/distrito/ano. As duas implementações respondem às mesmas consultas: a de pandas lê um índice
+# dos dataframes em memória (instalações pequenas); a de SQLite empurra filtros e agregações para SQL num
+# ficheiro com índices, e a memória deixa de crescer com o histórico.
+
+CONTAGEM = '_levantamentos'  # Coluna das contagens no índice do PandasBackend
+
+
+class PandasBackend:
+    """
+    Consultas sobre os dataframes em memória, um por infra. Como os índices do SQLite, cada infra tem um
+    índice criado uma vez: as contagens por (Provincia, Distrito, Ano, Mes) e as posições das linhas
+    ordenadas por distrito e data. Contagens, valores distintos e últimos registos são lidos do índice, sem
+    máscaras sobre todos os levantamentos nem cópias das linhas filtradas: a memória de uma consulta
+    depende do resultado e não do histórico.
+    """
+
+    def __init__(self, tabelas, provincia_col, distrito_col, data_col):
+        self.tabelas = tabelas
+        self.provincia_col, self.distrito_col, self.data_col = provincia_col, distrito_col, data_col
+        self._contagens, self._ordem, self._grupos = {}, {}, {}
+        for infra, df in tabelas.items():
+            self._index(infra, df)
+
+    def _index(self, infra, df):
+        dimensoes = [c for c in (self.provincia_col, self.distrito_col, 'Ano', 'Mes') if c in df.columns]
+        self._contagens[infra] = df.groupby(dimensoes, observed=True, dropna=False).size().reset_index(name=CONTAGEM)
+
+        # Posições ordenadas por (província, distrito, data); NaT (o menor inteiro) fica no início do distrito
+        provincias, nomes_provincias = pd.factorize(df[self.provincia_col])
+        distritos, nomes_distritos = pd.factorize(df[self.distrito_col])
+        datas = pd.to_datetime(df[self.data_col]).to_numpy().view(np.int64)
+        ordem = np.lexsort((datas, distritos, provincias))
+        chaves = provincias[ordem].astype(np.int64) * (len(nomes_distritos) + 1) + distritos[ordem]
+        inicios = np.flatnonzero(np.diff(chaves, prepend=-1)) if len(ordem) else np.empty(0, dtype=np.intp)
+        grupos = {}
+        for inicio, fim in zip(inicios, np.append(inicios[1:], len(ordem))):
+            p, d = provincias[ordem[inicio]], distritos[ordem[inicio]]
+            provincia = nomes_provincias[p] if p >= 0 else None
+            grupos.setdefault(provincia, {})[nomes_distritos[d] if d >= 0 else None] = (int(inicio), int(fim))
+        self._ordem[infra], self._grupos[infra] = ordem, grupos
+
+    def _filtrar(self, infra, provincia=None, distrito=None, ano=None):
+        df = self.tabelas[infra]
+        mascara = pd.Series(True, index=df.index)
+        for coluna, valor in ((self.provincia_col, provincia), (self.distrito_col, distrito), ('Ano', ano)):
+            if valor is not None:
+                mascara &= df[coluna] == valor
+        return df[mascara]
+
+    def _contar(self, infra, provincia=None, distrito=None, ano=None):
+        """Linhas da tabela de contagens com os filtros indicados (tamanho: distritos x meses, não levantamentos)."""
+        contagens = self._contagens[infra]
+        mascara = np.ones(len(contagens), dtype=bool)
+        for coluna, valor in ((self.provincia_col, provincia), (self.distrito_col, distrito), ('Ano', ano)):
+            if valor is not None:
+                mascara &= (contagens[coluna] == valor).to_numpy()
+        return contagens[mascara]
+
+    def _intervalos(self, infra, provincia=None, distrito=None):
+        """Intervalos de `_ordem[infra]` dos distritos seleccionados."""
+        grupos = self._grupos[infra]
+        provincias = grupos.values() if provincia is None else [grupos.get(provincia, {})]
+        return [intervalo for distritos in provincias for nome, intervalo in distritos.items()
+                if distrito is None or nome == distrito]
+
+    def count(self, infra, provincia=None, distrito=None, ano=None):
+        return int(self._contar(infra, provincia, distrito, ano)[CONTAGEM].sum())
+
+    def count_by(self, infra, coluna, provincia=None, distrito=None, ano=None):
+        """Contagem de levantamentos por valor de `coluna` (Series ordenada pelo valor)."""
+        contagens = self._contar(infra, provincia, distrito, ano)
+        if coluna not in contagens.columns:
+            return self._filtrar(infra, provincia, distrito, ano).groupby(coluna, observed=True).size().sort_index()
+        return contagens.groupby(coluna, observed=True)[CONTAGEM].sum().sort_index().rename(None)
+
+    def distinct(self, infra, coluna, provincia=None):
+        contagens = self._contar(infra, provincia)
+        origem = contagens if coluna in contagens.columns else self._filtrar(infra, provincia)
+        return sorted(origem[coluna].dropna().unique())
+
+    def latest(self, infra, colunas, limite, provincia=None, distrito=None):
+        """Os `limite` levantamentos mais recentes (por data, decrescente; na mesma data, o último a entrar antes)."""
+        ordem = self._ordem[infra]
+        # Os `limite` mais recentes de cada distrito seleccionado, já por ordem decrescente
+        intervalos = self._intervalos(infra, provincia, distrito)
+        partes = [ordem[max(inicio, fim - limite):fim][::-1] for inicio, fim in intervalos]
+        df = self.tabelas[infra].take(np.concatenate(partes) if partes else np.empty(0, dtype=np.intp))
+        if len(partes) > 1:
+            df = df.sort_values(self.data_col, ascending=False, kind='stable')
+        return df[colunas].head(limite).reset_index(drop=True)
+
+    def fingerprint(self, infra, provincia=None):
+        """Impressão digital (hash) dos levantamentos, independente da ordem das linhas."""
+        df = self._filtrar(infra, provincia)
+        soma = int(pd.util.hash_pandas_object(df, index=False).sum()) if len(df) else 0
+        return f"{len(df)}:{soma & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+class SQLiteBackend:
+    """
+    Consultas em SQL sobre um ficheiro SQLite com uma tabela por infra e índice em
+    (Provincia, Distrito, Data_Levantamento). Só as colunas usadas pelos callbacks são guardadas.
+    """
+
+    def __init__(self, caminho, provincia_col, distrito_col, data_col):
+        self.caminho = caminho
+        self.provincia_col, self.distrito_col, self.data_col = provincia_col, distrito_col, data_col
+        self.colunas = {}
+
+    def _ligacao(self):
+        # Uma ligação por consulta: podem ser feitas em várias threads e em workers criados por fork
+        return sqlite3.connect(self.caminho, timeout=30)
+
+    @staticmethod
+    def _tabela(infra):
+        return f"levantamentos_{infra.lower()}"
+
+    def sync(self, versao, tabelas, colunas):
+        """
+        Grava as tabelas (apenas `colunas[infra]`) se o ficheiro ainda não tiver esta versão dos dados.
+        A escrita é feita numa transacção exclusiva: com vários workers, só o primeiro grava.
+        """
+        self.colunas = {infra: list(cols) for infra, cols in colunas.items()}
+        con = self._ligacao()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("CREATE TABLE IF NOT EXISTS metadados (chave TEXT PRIMARY KEY, valor TEXT)")
+            linha = con.execute("SELECT valor FROM metadados WHERE chave = 'versao'").fetchone()
+            if linha and linha[0] == versao:
+                con.rollback()
+                return False
+
+            for infra, df in tabelas.items():
+                tabela, cols = self._tabela(infra), self.colunas[infra]
+                con.execute(f'DROP TABLE IF EXISTS "{tabela}"')
+                tipos = {'Ano': 'INTEGER', 'Mes': 'INTEGER'}
+                definicao = ", ".join(f"{c} {tipos.get(c, 'TEXT')}" for c in cols)
+                con.execute(f'CREATE TABLE "{tabela}" ({definicao})')
+
+                dados = df[cols].copy()
+                dados[self.data_col] = pd.to_datetime(dados[self.data_col]).dt.strftime('%Y-%m-%d %H:%M:%S')
+                for c in ('Ano', 'Mes'):
+                    dados[c] = dados[c].astype('Int64')
+                dados = dados.astype(object).where(dados.notna(), None)
+                con.executemany(f'INSERT INTO "{tabela}" VALUES ({", ".join("?" * len(cols))})',
+                                dados.itertuples(index=False, name=None))
+                con.execute(f'CREATE INDEX "idx_{tabela}_prov_dist_data" ON "{tabela}" '
+                            f'({self.provincia_col}, {self.distrito_col}, {self.data_col})')
+                con.execute(f'CREATE INDEX "idx_{tabela}_ano" ON "{tabela}" (Ano, {self.provincia_col})')
+
+            con.execute("INSERT OR REPLACE INTO metadados VALUES ('versao', ?)", (versao,))
+            con.commit()
+            return True
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            con.close()
+
+    def _onde(self, provincia=None, distrito=None, ano=None):
+        condicoes, parametros = [], []
+        for coluna, valor in ((self.provincia_col, provincia), (self.distrito_col, distrito), ('Ano', ano)):
+            if valor is not None:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(int(valor) if coluna == 'Ano' else valor)
+        return (" WHERE " + " AND ".join(condicoes) if condicoes else ""), parametros
+
+    def _coluna(self, infra, coluna):
+        # Os nomes de colunas não podem ser parâmetros SQL: só aceita colunas da tabela
+        if coluna not in self.colunas[infra]:
+            raise ValueError(f"Coluna '{coluna}' não existe na tabela de {infra}.")
+        return coluna
+
+    def count(self, infra, provincia=None, distrito=None, ano=None):
+        onde, parametros = self._onde(provincia, distrito, ano)
+        with self._ligacao() as con:
+            return con.execute(f'SELECT COUNT(*) FROM "{self._tabela(infra)}"{onde}', parametros).fetchone()[0]
+
+    def count_by(self, infra, coluna, provincia=None, distrito=None, ano=None):
+        """Contagem de levantamentos por valor de `coluna` (Series ordenada pelo valor)."""
+        coluna = self._coluna(infra, coluna)
+        onde, parametros = self._onde(provincia, distrito, ano)
+        onde += (" AND " if onde else " WHERE ") + f"{coluna} IS NOT NULL"
+        with self._ligacao() as con:
+            linhas = con.execute(f'SELECT {coluna}, COUNT(*) FROM "{self._tabela(infra)}"{onde} '
+                                 f'GROUP BY {coluna} ORDER BY {coluna}', parametros).fetchall()
+        return pd.Series([n for _, n in linhas], index=pd.Index([v for v, _ in linhas], name=coluna), dtype='int64')
+
+    def distinct(self, infra, coluna, provincia=None):
+        coluna = self._coluna(infra, coluna)
+        onde, parametros = self._onde(provincia)
+        onde += (" AND " if onde else " WHERE ") + f"{coluna} IS NOT NULL"
+        with self._ligacao() as con:
+            linhas = con.execute(f'SELECT DISTINCT {coluna} FROM "{self._tabela(infra)}"{onde} ORDER BY {coluna}',
+                                 parametros).fetchall()
+        return [v for (v,) in linhas]
+
+    def latest(self, infra, colunas, limite, provincia=None, distrito=None):
+        """Os `limite` levantamentos mais recentes (por data, decrescente)."""
+        selecao = ", ".join(self._coluna(infra, c) for c in colunas)
+        onde, parametros = self._onde(provincia, distrito)
+        with self._ligacao() as con:
+            df = pd.read_sql_query(f'SELECT {selecao} FROM "{self._tabela(infra)}"{onde} '
+                                   f'ORDER BY {self.data_col} DESC LIMIT ?', con, params=parametros + [int(limite)])
+        if self.data_col in df.columns:
+            df[self.data_col] = pd.to_datetime(df[self.data_col])
+        return df
+
+    def fingerprint(self, infra, provincia=None):
+        """Impressão digital (hash) dos levantamentos, lidos numa ordem fixa."""
+        cols = ", ".join(self.colunas[infra])
+        onde, parametros = self._onde(provincia)
+        resumo, n = hashlib.sha1(), 0
+        with self._ligacao() as con:
+            for linha in con.execute(f'SELECT {cols} FROM "{self._tabela(infra)}"{onde} ORDER BY {cols}', parametros):
+                resumo.update(repr(linha).encode())
+                n += 1
+        return f"{n}:{resumo.hexdigest()[:16]}"
@@ -0,0 +1,95 @@
+import base64
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+# =========================
+# CARREGAMENTO DE NOVOS LEVANTAMENTOS (UPLOAD, VALIDAÇÃO E JUNÇÃO EM BACKGROUND)
+# =========================
+# O dcc.Upload entrega o ficheiro em base64 no pedido do callback: o conteúdo é descodificado para disco
+# em blocos e o callback responde logo com o id da tarefa. Uma única thread por processo valida,
+# interpreta e junta as tarefas por ordem; o progresso de cada tarefa é gravado num ficheiro JSON, para
+# que a página o possa consultar em qualquer worker. Os pedidos dos utilizadores nunca esperam por ela.
+
+BLOCO_BASE64 = 4 * 1024 * 1024  # múltiplo de 4: cada bloco descodifica-se sozinho
+
+
+def save_upload(conteudo, pasta, nome_ficheiro):
+    """Grava em `pasta` o conteúdo de um dcc.Upload ('data:...;base64,...'). Devolve o caminho gravado."""
+    _, _, dados = conteudo.partition(',')
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"{uuid.uuid4().hex[:12]}_{os.path.basename(nome_ficheiro)}")
+    with open(caminho, 'wb') as f:
+        for inicio in range(0, len(dados), BLOCO_BASE64):
+            f.write(base64.b64decode(dados[inicio:inicio + BLOCO_BASE64]))
+    return caminho
+
+
+class UploadQueue:
+    """
+    Fila de tarefas de carregamento processadas por uma thread (criada no primeiro pedido de cada processo).
+
+    `processar(tarefa, reportar)` faz o trabalho e devolve a mensagem final; `reportar(progresso, mensagem)`
+    actualiza o estado da tarefa (progresso entre 0 e 1). O estado fica em `pasta_estado/<id>.json`.
+    """
+
+    def __init__(self, processar, pasta_estado):
+        self.processar = processar
+        self.pasta_estado = pasta_estado
+        self._fila = queue.Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _caminho(self, tarefa_id):
+        return os.path.join(self.pasta_estado, f"{tarefa_id}.json")
+
+    def _gravar(self, tarefa):
+        temporario = f"{self._caminho(tarefa['id'])}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(tarefa, f, ensure_ascii=False)
+        os.replace(temporario, self._caminho(tarefa['id']))
+
+    def submit(self, infra, caminho, nome_ficheiro):
+        """Põe o ficheiro recebido na fila; devolve o id da tarefa."""
+        os.makedirs(self.pasta_estado, exist_ok=True)
+        tarefa = {'id': uuid.uuid4().hex[:12], 'infra': infra, 'ficheiro': nome_ficheiro, 'caminho': caminho,
+                  'estado': 'em_fila', 'progresso': 0.0, 'mensagem': 'Em fila para validação.',
+                  'criado': time.time()}
+        self._gravar(tarefa)
+        with self._lock:
+            # Threads não sobrevivem ao fork: cada worker cria a sua na primeira submissão
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._fila = queue.Queue()
+                threading.Thread(target=self._trabalhar, name='carregamentos', daemon=True).start()
+        self._fila.put(tarefa)
+        return tarefa['id']
+
+    def status(self, tarefa_id):
+        """Estado gravado da tarefa (None se não existe)."""
+        try:
+            with open(self._caminho(os.path.basename(tarefa_id)), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _trabalhar(self):
+        while True:
+            tarefa = self._fila.get()
+
+            def reportar(progresso, mensagem, estado='a_processar'):
+                tarefa.update(progresso=round(float(progresso), 3), mensagem=mensagem, estado=estado)
+                self._gravar(tarefa)
+
+            try:
+                reportar(0.0, 'A validar o ficheiro...')
+                reportar(1.0, self.processar(dict(tarefa), reportar), 'concluido')
+            except Exception as e:
+                print(f"ERRO no carregamento '{tarefa['ficheiro']}': {e}")
+                reportar(tarefa['progresso'], f"Erro: {e}", 'erro')
+            finally:
+                if os.path.exists(tarefa['caminho']):
+                    os.remove(tarefa['caminho'])